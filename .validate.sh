@@ -10,4 +10,31 @@ find . -name "*.sh" -not -path "./node_modules/*" -exec bash -n {} \;
 echo "→ Checking Python scripts..."
 find . -name "*.py" -not -path "./node_modules/*" -exec python -m py_compile {} \;
 
+# Check cold import time of clarity_coach (needs requirements.txt installed)
+echo "→ Checking clarity_coach import time..."
+if ! python -c "import clarity_coach"; then
+  echo "  clarity_coach does not import; install requirements.txt first"
+  exit 1
+fi
+python - <<'PY' || exit 1
+import os, subprocess, sys
+
+budget_ms = float(os.environ.get("IMPORT_BUDGET_MS", "500"))
+err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import clarity_coach"],
+                     capture_output=True, text=True).stderr
+total_ms = max(int(line.split("|")[1]) for line in err.splitlines()
+               if line.rstrip().endswith("| clarity_coach")) / 1000
+print(f"  import clarity_coach: {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+if total_ms > budget_ms:
+    heavy = sorted((int(l.split("|")[1]), l.split("|")[2].strip()) for l in err.splitlines() if l.count("|") == 2 and "cumulative" not in l)
+    print("  slowest imports:", ", ".join(f"{name} {us // 1000} ms" for us, name in heavy[-5:][::-1]))
+    sys.exit(1)
+PY
+
+# Optional benchmark regression check against a baseline recorded on this machine
+if [ -n "$BENCH_BASELINE" ]; then
+  echo "→ Comparing benchmarks with $BENCH_BASELINE..."
+  python -m clarity_coach.bench --baseline "$BENCH_BASELINE" ${BENCH_ARGS:-} || exit 1
+fi
+
 echo "✅ Validation complete."
@@ -1,5 +1,15 @@
 import streamlit as st
-from coach import analyze_text
+from coach import IncrementalAnalyzer, load_nlp, spell_index
+
+
+@st.cache_resource
+def get_analyzer():
+    # one per server process: the model, the vocabulary and the per-sentence
+    # results survive reruns, so an edit only re-analyzes what changed
+    load_nlp()
+    spell_index()
+    return IncrementalAnalyzer()
+
 
 st.set_page_config(page_title="🧠 Clarity Coach", layout="centered")
 
@@ -7,22 +17,23 @@ st.title("🧠 Clarity Coach")
 st.write("Paste your technical writing below. This tool will find jargon, explain it, and offer simpler rewrites.")
 
 text = st.text_area("📄 Input Text", height=200)
+live = st.checkbox("Update as I type", value=False)
 
-if st.button("🔍 Analyze"):
+if st.button("🔍 Analyze") or (live and text.strip()):
     if not text.strip():
         st.warning("Please enter some text.")
     else:
-        results = analyze_text(text)
+        results = get_analyzer().analyze(text)
+        jargon = [c for c in results["changes"] if c.category == "jargon"]
 
-        if results:
+        if jargon:
             st.markdown("### ✨ Results")
-            for item in results:
+            for change in jargon:
                 st.markdown(f"""
-                - **Term**: `{item['term']}`  
-                  - 📖 *Meaning*: {item['meaning']}  
-                  - 🔁 *Simpler Alternative*: `{item['simpler']}`  
-                  - ✏️ *Suggested Rewrite*:  
-                    `{item['rewrite']}`
+                - **Term**: `{change.before}`  
+                  - 🔁 *Simpler Alternative*: `{change.after}`
                 """)
+            st.markdown("✏️ *Suggested Rewrite*:")
+            st.success(results["polished"])
         else:
             st.success("✅ No jargon detected. Great job!")
@@ -1,33 +1,23 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, io, csv, json, zipfile, base64, sys, glob, logging, time, argparse, tempfile, shutil
-from datetime import datetime
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email import encoders
+import os, io, re, copy, csv, atexit, json, zipfile, base64, sys, glob, logging, time, argparse, tempfile, shutil, threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 
 # Core NLP + helpers
-import spacy
-from fuzzywuzzy import process
-from wordfreq import top_n_list
-from colorama import Fore, Style, init as color_init
-import difflib
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
-
-# Exports
-from openpyxl import Workbook
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from docx import Document
-from docx.shared import RGBColor
+from clarity_coach.spelling import SpellIndex, VOCAB_FILE, VOCAB_SIZE, open_vocab_file
+from clarity_coach.rules import RuleMatcher, Change, OffsetMap
+from clarity_coach.cache import ResultCache, TokenMemo, fingerprint
+from clarity_coach.diff import diff_opcodes
+from clarity_coach.loglimit import LogLimiter
+
+# spaCy, colorama, the export backends (openpyxl, reportlab, python-docx), the
+# email builders, the Google client libraries, the run log, the output store
+# and the delivery queue are imported where they are first used, so a short CLI
+# run only loads what it actually needs.  Importing the package has no side
+# effects: logging is set up by the entry points (setup_logging) and the
+# vocabulary is opened on first use (valid_words).
 
 # Clipboard (optional)
 try:
@@ -36,14 +26,6 @@ try:
 except Exception:
     HAS_CLIP = False
 
-# Google APIs (OAuth user credentials)
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-import google.auth.exceptions
-import pickle
-
 # ================= SETTINGS (defaults; can override via CLI) =================
 HIGHLIGHT = True
 SEND_EMAIL = True
@@ -51,9 +33,21 @@ UPLOAD_GDOC = True
 SAVE_LOCAL = True
 DRY_RUN = False
 
+NLP_MODEL = "en_core_web_sm"
+SENTENCE_MODE = "parser"   # parser | senter | rule (see load_nlp)
+NLP_BATCH_SIZE = 64        # texts per nlp.pipe batch
+NLP_PROCESSES = 1          # nlp.pipe worker processes
+
 OUTPUT_FILE = "clarity_output"       # base filename; timestamps appended automatically
-APPEND_LOG_MD = "clarity_log.md"     # rolling log file (append mode)
+RUN_LOG = "clarity_log.jsonl"        # structured run log (see clarity_coach/runlog.py); None disables
+RUN_LOG_MAX_MB = 50                  # rotate the active log past this size...
+RUN_LOG_ROTATE_DAYS = 7              # ...or once its first record is this old
+RUN_LOG_KEEP = 10                    # rotated files kept
+RUN_LOG_BUFFER = 100                 # records written per flush
 ERROR_LOG = "clarity_errors.log"
+LOG_REPEATS = 3                      # identical log messages written per run; later ones are counted
+LOG_RATE = 20                        # messages per call site per LOG_RATE_WINDOW seconds
+LOG_RATE_WINDOW = 60
 
 EMAIL_FROM = None          # if None, Gmail API uses the authorized user ("me")
 EMAIL_TO = None            # set to your email to enable email sending
@@ -65,21 +59,97 @@ SCOPES = [
     "https://www.googleapis.com/auth/gmail.send",
 ]
 
-# Retries
-API_RETRIES = 3
-RETRY_SLEEP = 2.0
+# Retries (Drive uploads and Gmail sends run in the background, see clarity_coach/delivery.py)
+API_RETRIES = 3            # attempts per run
+RETRY_SLEEP = 2.0          # first backoff; doubles per attempt (up to RETRY_MAX_SLEEP), with jitter
+RETRY_MAX_SLEEP = 60.0
+DELIVERY_CONCURRENCY = 4   # uploads/sends in flight at once
+DELIVERY_QUEUE = "clarity_delivery.sqlite"  # pending uploads/sends; unfinished ones are retried next run
+GOOGLE_API_ENDPOINT = None # e.g. a local fake Google API server for tests; skips OAuth
+
+# Minimum fuzzy score for a spelling correction
+FUZZY_SCORE = 86
+
+# analyze_text result cache
+CACHE_SIZE = 256           # results kept in memory (0 disables the memory tier)
+CACHE_DIR = None           # optional on-disk tier, shared between runs and workers
+CACHE_MAX_MB = 100         # disk tier size cap; least recently used entries go first
+CACHE_MAX_AGE_DAYS = 30    # disk entries older than this are dropped
+
+# Per-token spelling memo (token -> correction), kept across documents
+TOKEN_MEMO_SIZE = 50000    # tokens kept in memory
+TOKEN_MEMO_FILE = None     # optional SQLite file shared by workers and later runs
+
+# Export formats and scheduling
+EXPORT_FORMATS = None      # format names to write (see EXPORTERS), None for every built-in; "zip" bundles them
+EXPORT_WORKERS = 4         # formats rendered at once (1 renders them one after another)
+EXPORT_EXECUTOR = "thread" # thread | process (process sidesteps the GIL for PDF/DOCX rendering)
+OUTPUT_STORE = None        # --store DIR: outputs named by content hash and reused across runs (clarity_coach/store.py)
+RUN_ID = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"  # this run in the store index
+
+# Streaming (--stream): large files analyzed chunk by chunk with bounded memory
+STREAM = False
+STREAM_CHUNK_CHARS = 20000 # target chunk size; chunks end at a sentence boundary
+STREAM_BATCH = 8           # chunks per nlp.pipe call
+
+# Incremental folder runs (--incremental): unchanged inputs are skipped
+INCREMENTAL = False
+INPUT_MANIFEST = "clarity_inputs.json"  # in the output directory: size, mtime and hash per processed input
+
+# Zip and email attachments
+ZIP_LEVEL = 6              # deflate level 1-9 (0 stores everything)
+ZIP_STORED_EXTS = (".xlsx", ".docx", ".zip", ".gz", ".png", ".jpg")  # already compressed: stored as-is
+EMAIL_SPOOL_MB = 8         # outgoing messages larger than this are spooled to a temp file
+EMAIL_CHUNK_MB = 4         # upload chunk for the message (a multiple of 256 KiB)
+
+# Digest (--digest, folder mode): one combined report, zip, upload and email per run
+DIGEST = False
+
+# Instrumentation
+TIMINGS_LOG = None         # JSON-lines file: one record of stage timings per processed text
+PROFILE = None             # path prefix for cProfile dumps (set by --profile)
 # ============================================================================
 
 # ----- Logging -----
-logging.basicConfig(filename=ERROR_LOG, filemode="a", level=logging.INFO,
-                    format="%(asctime)s [%(levelname)s] %(message)s")
-
-# ----- Console color -----
-color_init(autoreset=True)
+LOG_LIMITER = None  # set by setup_logging()
+
+def setup_logging():
+    # called by main(), serve and pool workers rather than on import, so that
+    # importing a submodule doesn't create ERROR_LOG or register exit hooks
+    global LOG_LIMITER
+    if LOG_LIMITER is None:
+        logging.basicConfig(filename=ERROR_LOG, filemode="a", level=logging.INFO,
+                            format="%(asctime)s [%(levelname)s] %(message)s")
+        # repeats are dropped before they reach the file; log_summary() reports how many
+        LOG_LIMITER = LogLimiter(LOG_REPEATS, LOG_RATE, LOG_RATE_WINDOW)
+        for handler in logging.getLogger().handlers:
+            handler.addFilter(LOG_LIMITER)
+        atexit.register(LOG_LIMITER.summary)
+    return LOG_LIMITER
+
+def log_summary():
+    # one line per noisy call site; pool workers call this per batch (no exit hooks there)
+    return LOG_LIMITER.summary() if LOG_LIMITER is not None else 0
 
 # ----- NLP -----
-nlp = spacy.load("en_core_web_sm")
-VALID_WORDS = set(top_n_list("en", 50000))
+nlp = None  # spaCy pipeline, loaded on first use by load_nlp()
+
+_spell_index = None
+_valid_words = None
+
+def valid_words():
+    # A prebuilt vocabulary file (python -m clarity_coach.spelling) is memory-mapped
+    # and shared between processes; without one the words come from wordfreq and
+    # the spelling index is built on first use (spell_index).
+    global _spell_index, _valid_words
+    if _valid_words is None:
+        _spell_index = open_vocab_file(VOCAB_FILE, min_score=FUZZY_SCORE)
+        if _spell_index is not None:
+            _valid_words = _spell_index
+        else:
+            from wordfreq import top_n_list
+            _valid_words = set(top_n_list("en", VOCAB_SIZE))
+    return _valid_words
 
 # Jargon and maps
 JARGON_DB = {
@@ -111,6 +181,26 @@ GRAMMAR_FIXES = {
     "cuz": "because"
 }
 
+# All tables compiled once into a single matcher (see clarity_coach/rules.py):
+# slang and contractions match whole tokens, grammar fixes are case-sensitive
+# substrings, jargon terms ignore case.
+RULES = None
+_tables_fp = None  # fingerprint of the tables, hashed once per load_rules()
+
+def load_rules():
+    # call again after changing the tables: rebuilds RULES and drops the
+    # memoized table fingerprint so cached results keyed on the old ones miss
+    global RULES, _tables_fp
+    RULES = RuleMatcher()
+    RULES.add_literals("slang", SLANG_MAP, ignore_case=True, whole_token=True)
+    RULES.add_literals("contraction", CONTRACTIONS, ignore_case=True, whole_token=True)
+    RULES.add_literals("grammar", GRAMMAR_FIXES)
+    RULES.add_literals("jargon", {jt: meta["simpler"] for jt, meta in JARGON_DB.items()}, ignore_case=True)
+    _tables_fp = None
+    return RULES
+
+load_rules()
+
 # ----- Utility helpers -----
 def ts():
     return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -123,75 +213,187 @@ def ensure_dir(path):
 
 def highlight(before, after):
     if HIGHLIGHT:
+        from colorama import Fore, Style
         return f"{Fore.RED}{before}{Style.RESET_ALL} → {Fore.GREEN}{after}{Style.RESET_ALL}"
     return f"{before} → {after}"
 
-def google_service(api, version):
-    creds = None
-    if os.path.exists("token.pickle"):
-        with open("token.pickle", "rb") as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except google.auth.exceptions.RefreshError:
-                creds = None
-        if not creds:
-            flow = InstalledAppFlow.from_client_secrets_file(
+# ----- Google clients -----
+# One set of credentials and one service object per API for the whole process,
+# built from the discovery documents bundled with googleapiclient. httplib2
+# connections aren't thread-safe, so each thread executes requests over its own
+# authorized connection (google_http), kept open between calls.
+CREDS_REFRESH_MARGIN = 300   # seconds before expiry at which the token is refreshed
+
+_google_lock = threading.Lock()
+_google_services = {}        # (api, version) -> service
+_google_local = threading.local()
+_google_creds = None
+
+def google_credentials():
+    global _google_creds
+    with _google_lock:
+        if GOOGLE_API_ENDPOINT and _google_creds is None:
+            from google.auth.credentials import AnonymousCredentials
+            _google_creds = AnonymousCredentials()
+        if GOOGLE_API_ENDPOINT:
+            return _google_creds
+        creds = _google_creds
+        if creds is None and os.path.exists("token.pickle"):
+            import pickle
+            with open("token.pickle", "rb") as token:
+                creds = pickle.load(token)
+        if creds is None or not creds.valid or expires_soon(creds):
+            creds = refresh_credentials(creds)
+        _google_creds = creds
+        return creds
+
+def expires_soon(creds):
+    # google-auth keeps expiry as naive UTC; compared as an aware datetime either way
+    if creds.expiry is None:
+        return False
+    expiry = creds.expiry if creds.expiry.tzinfo else creds.expiry.replace(tzinfo=timezone.utc)
+    return expiry - datetime.now(timezone.utc) < timedelta(seconds=CREDS_REFRESH_MARGIN)
+
+def refresh_credentials(creds):
+    import pickle
+    import google.auth.exceptions
+    from google.auth.transport.requests import Request
+
+    if creds and creds.refresh_token:
+        try:
+            creds.refresh(Request())
+        except google.auth.exceptions.RefreshError:
+            creds = None
+    else:
+        creds = None
+    if not creds:
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        flow = InstalledAppFlow.from_client_secrets_file(
     "/workspaces/portfolio/projects/clarity-coach/credentials.json", SCOPES
 )
-            creds = flow.run_console()
-        with open("token.pickle", "wb") as token:
-            pickle.dump(creds, token)
-    return build(api, version, credentials=creds)
+        creds = flow.run_console()
+    with open("token.pickle", "wb") as token:
+        pickle.dump(creds, token)
+    return creds
+
+def google_service(api, version):
+    # requests from these services should be run with .execute(http=google_http())
+    key = (api, version)
+    service = _google_services.get(key)
+    if service is None:
+        from googleapiclient.discovery import build
+        creds = google_credentials()
+        options = {"api_endpoint": GOOGLE_API_ENDPOINT} if GOOGLE_API_ENDPOINT else None
+        service = build(api, version, credentials=creds, client_options=options,
+                        static_discovery=True, cache_discovery=False)
+        with _google_lock:
+            service = _google_services.setdefault(key, service)
+    return service
+
+def google_http():
+    # this thread's authorized connection; credentials are re-checked (and refreshed
+    # when close to expiry) on every call, the connection itself is reused
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.http import build_http  # Http set up for the client (e.g. 308 isn't a redirect)
+    creds = google_credentials()
+    http = getattr(_google_local, "http", None)
+    if http is None or http.credentials is not creds:
+        http = _google_local.http = AuthorizedHttp(creds, http=build_http())
+    return http
 
 # ----- Core analyzer -----
+# sentence_cleanup only needs sentence boundaries and token text
+NLP_UNUSED = ["tagger", "attribute_ruler", "lemmatizer", "ner"]
+
+def load_nlp():
+    # parser: same boundaries as the full pipeline, without tagging/NER
+    # senter: the model's lighter statistical sentence recognizer
+    # rule:   punctuation-based sentencizer, no model needed
+    global nlp
+    if nlp is None:
+        import spacy
+        if SENTENCE_MODE == "rule":
+            nlp = spacy.blank("en")
+            nlp.add_pipe("sentencizer")
+        elif SENTENCE_MODE == "senter":
+            nlp = spacy.load(NLP_MODEL, exclude=NLP_UNUSED + ["parser"])
+            nlp.enable_pipe("senter")
+        else:
+            nlp = spacy.load(NLP_MODEL, exclude=NLP_UNUSED)
+    return nlp
+
+def spell_index():
+    # built on first out-of-vocabulary token; lookups score a few dozen
+    # candidates instead of all of valid_words()
+    global _spell_index
+    valid_words()
+    if _spell_index is None:
+        from wordfreq import top_n_list
+        _spell_index = SpellIndex(top_n_list("en", VOCAB_SIZE), min_score=FUZZY_SCORE)
+    return _spell_index
+
+WORDLIKE = re.compile(r"\w")  # tokens without one are never looked up
+
 def correct_spelling(text):
+    # per-token pass; Change offsets index text
     changes = []
-    categories = []  # parallel list for categories
     out = []
-    for word in text.split():
+    for m in re.finditer(r"\S+", text):
+        word = m.group()
         w = word.lower()
         if w in SLANG_MAP:
-            changes.append(f"{word} → {SLANG_MAP[w]}"); categories.append("slang")
+            changes.append(Change("slang", word, SLANG_MAP[w], m.start(), m.end(), w))
             out.append(SLANG_MAP[w])
         elif w in CONTRACTIONS:
-            changes.append(f"{word} → {CONTRACTIONS[w]}"); categories.append("contraction")
+            changes.append(Change("contraction", word, CONTRACTIONS[w], m.start(), m.end(), w))
             out.append(CONTRACTIONS[w])
-        elif w in VALID_WORDS:
+        elif w in valid_words() or not WORDLIKE.search(w):
+            # punctuation and symbols (===, -, →) process to an empty query; nothing to look up
             out.append(word)
         else:
-            match, score = process.extractOne(w, VALID_WORDS)
-            if score and score > 85:
-                changes.append(f"{word} → {match}"); categories.append("spelling")
+            match, score, category = lookup_token(w)
+            if category:
+                changes.append(Change(category, word, match, m.start(), m.end(), f"fuzzy:{score}"))
                 out.append(match)
             else:
                 out.append(word)
-    return " ".join(out), changes, categories
+    return " ".join(out), changes
+
+def lookup_token(w):
+    # fuzzy lookup, memoized: each distinct token pays for spell_index() once
+    memo = token_memo()
+    hit = memo.get(w)
+    if hit is None:
+        COUNTERS["fuzzy_lookups"] += 1
+        match, score = spell_index().lookup(w)
+        hit = (match, score, "spelling" if match and score >= FUZZY_SCORE else None)
+        memo.put(w, hit)
+    else:
+        COUNTERS["memo_hits"] += 1
+    return hit
+
+def find_rule_matches(text, categories=None):
+    # every rule hit as a Change, with its category and character offsets
+    return list(RULES.finditer(text, categories))
+
+def apply_rules(text, categories):
+    # returns (new_text, changes); offsets index text
+    return RULES.apply(text, categories)
 
 def smooth_grammar(text):
-    changes, cats = [], []
-    fixed = text
-    for bad, good in GRAMMAR_FIXES.items():
-        if bad in fixed:
-            fixed = fixed.replace(bad, good)
-            changes.append(f"{bad} → {good}")
-            cats.append("grammar")
-    return fixed, changes, cats
+    return apply_rules(text, ("grammar",))
 
 def replace_jargon(text):
-    changes, cats = [], []
-    final = text
-    for jt, meta in JARGON_DB.items():
-        if jt in final.lower():
-            final = final.replace(jt, meta["simpler"])
-            changes.append(f"{jt} → {meta['simpler']}")
-            cats.append("jargon")
-    return final, changes, cats
+    return apply_rules(text, ("jargon",))
 
 def sentence_cleanup(text):
-    doc = nlp(text)
+    return join_sentences(load_nlp()(text))
+
+def sentence_cleanup_batch(texts, batch_size=None, n_process=None):
+    docs = load_nlp().pipe(texts, batch_size=batch_size or NLP_BATCH_SIZE, n_process=n_process or NLP_PROCESSES)
+    return [join_sentences(doc) for doc in docs]
+
+def join_sentences(doc):
     sentences = []
     for sent in doc.sents:
         toks = [t.text for t in sent]
@@ -202,17 +404,168 @@ def sentence_cleanup(text):
     return " ".join(sentences)
 
 def analyze_text(text):
+    timings = {}
+    with timed(timings, "cache"):
+        cache, key = result_cache(), cache_key(text)
+        res = cache.get(key)
+    if res is not None:
+        return cached_result(from_cache(res), timings)
+    before = dict(COUNTERS)
     # step 1: spelling/slang/contractions
-    step1, ch1, cat1 = correct_spelling(text)
+    with timed(timings, "spelling"):
+        step1, ch1 = correct_spelling(text)
     # step 2: sentence cleanup for spacing and capitalization
-    step2 = sentence_cleanup(step1)
-    # step 3: grammar smoothing
-    step3, ch2, cat2 = smooth_grammar(step2)
-    # step 4: jargon replacement
-    final, ch3, cat3 = replace_jargon(step3)
+    with timed(timings, "sentences"):
+        step2 = sentence_cleanup(step1)
+    res = finish_analysis(text, step2, ch1, timings, counted_since(before))
+    cache.put(key, to_json(res))
+    return res
+
+def analyze_texts(texts, batch_size=None, n_process=None):
+    # same as analyze_text for each text, with sentence cleanup batched through nlp.pipe;
+    # cached texts are skipped and repeated texts within the batch analyzed once
+    lookup = {}
+    with timed(lookup, "cache"):
+        cache = result_cache()
+        keys = [cache_key(text) for text in texts]
+        found = {key: cache.get(key) for key in dict.fromkeys(keys)}
+    per_text = {k: round(v / len(texts), 3) for k, v in lookup["cache"].items()} if texts else {}
+    todo = {key: text for key, text in zip(keys, texts) if found[key] is None}
+    step1, timings, counts = [], [], []
+    for text in todo.values():
+        timings.append({"cache": dict(per_text)})
+        before = dict(COUNTERS)
+        with timed(timings[-1], "spelling"):
+            step1.append(correct_spelling(text))
+        counts.append(counted_since(before))
+    batch = {}
+    with timed(batch, "sentences"):
+        step2 = sentence_cleanup_batch([s[0] for s in step1], batch_size, n_process) if todo else []
+    for t in timings:  # one nlp.pipe call for the batch; each text gets an equal share
+        t["sentences"] = {k: round(v / len(timings), 3) for k, v in batch["sentences"].items()}
+    for (key, text), (_, ch1), s2, t, n in zip(todo.items(), step1, step2, timings, counts):
+        found[key] = finish_analysis(text, s2, ch1, t, n)
+        cache.put(key, to_json(found[key]))
+    results, seen = [], set()
+    for key in keys:
+        res = found[key]
+        if key in seen:
+            res = cached_result(copy.deepcopy(res), {"cache": per_text})  # repeated text: its own copy
+        elif key not in todo:
+            res = cached_result(from_cache(res), {"cache": per_text})
+        results.append(res)
+        seen.add(key)
+    return results
+
+# ----- Instrumentation -----
+# Per-stage wall/CPU milliseconds go into res["stats"]["timings"] (analysis) and
+# the export_result() record (exports); both can be appended to TIMINGS_LOG.
+COUNTERS = {"fuzzy_lookups": 0, "memo_hits": 0}
+
+@contextmanager
+def timed(timings, stage):
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        t = timings.setdefault(stage, {"wall_ms": 0.0, "cpu_ms": 0.0})
+        t["wall_ms"] = round(t["wall_ms"] + (time.perf_counter() - wall) * 1000, 3)
+        t["cpu_ms"] = round(t["cpu_ms"] + (time.process_time() - cpu) * 1000, 3)
+
+def counted_since(before):
+    return {k: COUNTERS[k] - before[k] for k in COUNTERS}
+
+def cached_result(res, timings):
+    # the stored timings describe the run that produced the entry, not this one
+    res["stats"].update(cached=True, timings=timings, fuzzy_lookups=0, memo_hits=0)
+    return res
+
+# stats describing one run rather than the text; kept out of exported files so the
+# same input always renders the same bytes (and --store artifacts stay current)
+RUN_STATS = ("cached", "timings", "fuzzy_lookups", "memo_hits")
 
-    all_changes = ch1 + ch2 + ch3
-    all_cats = cat1 + cat2 + cat3
+def export_stats(stats):
+    return {k: v for k, v in stats.items() if k not in RUN_STATS}
+
+def exported(res):
+    return {**res, "stats": export_stats(res["stats"])}
+
+def log_timings(res, delivered=None, source=None):
+    if not TIMINGS_LOG:
+        return
+    st = res["stats"]
+    record = {"ts": datetime.now().isoformat(timespec="seconds"), "pid": os.getpid(), "source": source,
+              "cached": st.get("cached", False), "words": st["words_before"],
+              "fuzzy_lookups": st.get("fuzzy_lookups", 0), "memo_hits": st.get("memo_hits", 0),
+              "analysis": st.get("timings", {}), "export": (delivered or {}).get("timings", {})}
+    try:
+        with open(TIMINGS_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logging.error(f"Timings log failed: {e}")
+
+# ----- Result cache -----
+_result_cache = None
+
+def result_cache():
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(CACHE_SIZE, CACHE_DIR, max_bytes=CACHE_MAX_MB * 2**20,
+                                    max_age=CACHE_MAX_AGE_DAYS * 86400)
+    return _result_cache
+
+_analysis_fp = None  # (settings, fingerprint) from the last call
+RESULT_FORMAT = 2  # bump when cached results mean something else (2: offsets into the original)
+
+def analysis_fingerprint():
+    # anything that changes the analysis of a given text belongs in the fingerprint;
+    # called once per text, so the tables are hashed once per load_rules() and the
+    # result is reused while the settings stay the same
+    global _tables_fp, _analysis_fp
+    if _tables_fp is None:
+        _tables_fp = fingerprint(JARGON_DB, SLANG_MAP, CONTRACTIONS, GRAMMAR_FIXES)
+    settings = (RESULT_FORMAT, _tables_fp, NLP_MODEL, SENTENCE_MODE, FUZZY_SCORE, VOCAB_SIZE, len(valid_words()))
+    if _analysis_fp is None or _analysis_fp[0] != settings:
+        _analysis_fp = (settings, fingerprint(*settings))
+    return _analysis_fp[1]
+
+def cache_key(text):
+    return ResultCache.key(text, analysis_fingerprint())
+
+_token_memo = None
+
+def token_memo():
+    global _token_memo
+    if _token_memo is None:
+        fp = fingerprint(FUZZY_SCORE, VOCAB_SIZE, len(valid_words()))
+        _token_memo = TokenMemo(fp, TOKEN_MEMO_SIZE, TOKEN_MEMO_FILE)
+        atexit.register(_token_memo.close)
+    return _token_memo
+
+# Changes are stored and exported as compact lists in CHANGE_FIELDS order
+CHANGE_FIELDS = list(Change.__slots__)
+
+def to_json(res):
+    return {**res, "changes": [c.to_list() for c in res["changes"]]}
+
+def from_cache(res):
+    res["changes"] = [Change.from_list(c) for c in res["changes"]]
+    res["diff_pairs"] = [tuple(p) for p in res["diff_pairs"]]  # JSON turned them into lists
+    return res
+
+def cache_stats():
+    return {"results": result_cache().stats(), "tokens": token_memo().stats()}
+
+def finish_analysis(text, step2, ch1, timings=None, counts=None):
+    timings = {} if timings is None else timings
+    # step 3: grammar smoothing and jargon replacement, one scan over the text
+    with timed(timings, "rules"):
+        final, ch2 = apply_rules(step2, ("grammar", "jargon"))
+        if ch2:  # offsets into step2 -> into text, through the spelling pass
+            ch2 = OffsetMap(text).add(text, ch1).original(ch2, step2)
+
+    all_changes = ch1 + ch2
+    all_cats = [c.category for c in all_changes]
 
     # stats
     stats = {
@@ -225,45 +578,38 @@ def analyze_text(text):
             "contraction": all_cats.count("contraction"),
             "grammar": all_cats.count("grammar"),
             "jargon": all_cats.count("jargon"),
-        }
+        },
+        **(counts or {}),
+        "cached": False,
+        "timings": timings,
     }
 
     # prepare word-level diff for side-by-side views
-    diff_pairs = compute_simple_pairs(text, final)
+    with timed(timings, "diff"):
+        diff_pairs = compute_simple_pairs(text, final)
 
     return {
         "original": text,
         "polished": final,
-        "changes": all_changes,
-        "categories": all_cats,
+        "changes": all_changes,  # Change records (clarity_coach.rules)
         "stats": stats,
         "diff_pairs": diff_pairs  # list of (orig_chunk, polished_chunk)
     }
 
 def compute_simple_pairs(a, b):
     # token-based diff; returns aligned pairs for HTML/PDF/DOCX side-by-side
+    # (anchored diff from clarity_coach.diff: near-linear on long texts)
     a_tok = a.split()
     b_tok = b.split()
-    sm = difflib.SequenceMatcher(None, a_tok, b_tok)
-    pairs = []
-    for tag, i1, i2, j1, j2 in sm.get_opcodes():
-        if tag == "equal":
-            pairs.append((" ".join(a_tok[i1:i2]), " ".join(b_tok[j1:j2])))
-        elif tag in ("replace", "delete", "insert"):
-            pairs.append((" ".join(a_tok[i1:i2]), " ".join(b_tok[j1:j2])))
-    return pairs
+    return [(" ".join(a_tok[i1:i2]), " ".join(b_tok[j1:j2])) for _, i1, i2, j1, j2 in diff_opcodes(a_tok, b_tok)]
 
 # ----- Console output -----
 def print_console(res):
     print("=== BEFORE ==="); print(res["original"])
     print("\n=== AFTER ==="); print(res["polished"])
     print("\n=== CHANGES MADE ===")
-    for i, c in enumerate(res["changes"]):
-        try:
-            b, a = c.split(" → ")
-            print(f"- [{res['categories'][i]}] {highlight(b, a)}")
-        except Exception:
-            print(f"- {c}")
+    for c in res["changes"]:
+        print(f"- [{c.category}] {highlight(c.before, c.after)}")
     print("\n=== STATS ===")
     st = res["stats"]
     print(f"Words before: {st['words_before']}")
@@ -279,6 +625,23 @@ def html_diff_table_rows(diff_pairs):
     return "\n".join(rows)
 
 # ----- Exports (all respect SAVE_LOCAL/DRY_RUN) -----
+# Registry of save_<format>(res, outdir) functions by --formats name. cost is
+# "light" or "heavy"; heavy formats are started first. Other packages can add
+# formats through the "clarity_coach.exporters" entry point group, loaded only
+# when the format is requested. Formats with a StreamWriter ("stream") can also
+# be written by --stream (see Streaming). version is part of the --store key
+# along with the source of save; bump it when a helper or template that save
+# uses changes what the format renders.
+EXPORTERS = {}
+PLUGIN_GROUP = "clarity_coach.exporters"
+
+def exporter(name, cost="light", version=1):
+    def register(save):
+        EXPORTERS[name] = {"save": save, "cost": cost, "version": version}
+        return save
+    return register
+
+@exporter("md")
 def save_markdown(res, outdir):
     fn = timestamped_filename(OUTPUT_FILE, "md", outdir)
     if DRY_RUN or not SAVE_LOCAL:
@@ -290,12 +653,13 @@ def save_markdown(res, outdir):
         f.write("## After\n")
         f.write(res["polished"] + "\n\n")
         f.write("## Changes\n")
-        for i, c in enumerate(res["changes"]):
-            f.write(f"- [{res['categories'][i]}] {c}\n")
+        for c in res["changes"]:
+            f.write(f"- [{c.category}] {c}\n")
         f.write("\n## Stats\n")
         f.write(json.dumps(res["stats"], indent=2))
     return fn
 
+@exporter("html")
 def save_html(res, outdir):
     fn = timestamped_filename(OUTPUT_FILE, "html", outdir)
     if DRY_RUN or not SAVE_LOCAL:
@@ -309,14 +673,14 @@ def save_html(res, outdir):
         f.write(html_diff_table_rows(res["diff_pairs"]))
         f.write("</table>")
         f.write("<h3>Changes</h3><ul>")
-        for i, c in enumerate(res["changes"]):
-            b, a = (c.split(" → ")+["",""])[:2]
-            f.write(f"<li>[{res['categories'][i]}] <span style='color:red'>{b}</span> → <span style='color:green'>{a}</span></li>")
+        for c in res["changes"]:
+            f.write(f"<li>[{c.category}] <span style='color:red'>{c.before}</span> → <span style='color:green'>{c.after}</span></li>")
         f.write("</ul>")
         f.write("<h3>Stats</h3><pre>" + json.dumps(res["stats"], indent=2) + "</pre>")
         f.write("</body></html>")
     return fn
 
+@exporter("txt")
 def save_txt(res, outdir):
     fn = timestamped_filename(OUTPUT_FILE, "txt", outdir)
     if DRY_RUN or not SAVE_LOCAL:
@@ -325,50 +689,58 @@ def save_txt(res, outdir):
         f.write("=== BEFORE ===\n" + res["original"] + "\n\n")
         f.write("=== AFTER ===\n" + res["polished"] + "\n\n")
         f.write("=== CHANGES MADE ===\n")
-        for i, c in enumerate(res["changes"]):
-            f.write(f"- [{res['categories'][i]}] {c}\n")
+        for c in res["changes"]:
+            f.write(f"- [{c.category}] {c}\n")
         f.write("\n=== STATS ===\n")
         f.write(json.dumps(res["stats"], indent=2))
     return fn
 
+@exporter("json")
 def save_json(res, outdir):
     fn = timestamped_filename(OUTPUT_FILE, "json", outdir)
     if DRY_RUN or not SAVE_LOCAL:
         return fn
     with open(fn, "w", encoding="utf-8") as f:
-        json.dump(res, f, indent=4, ensure_ascii=False)
+        json.dump({**to_json(res), "change_fields": CHANGE_FIELDS}, f, indent=4, ensure_ascii=False)
     return fn
 
+@exporter("csv")
 def save_csv(res, outdir):
     fn = timestamped_filename(OUTPUT_FILE, "csv", outdir)
     if DRY_RUN or not SAVE_LOCAL:
         return fn
     with open(fn, "w", newline="", encoding="utf-8") as f:
         w = csv.writer(f); w.writerow(["Category", "Original Text", "Corrected Text"])
-        for i, c in enumerate(res["changes"]):
-            parts = c.split(" → "); before = parts[0].strip(); after = parts[1].strip() if len(parts)>1 else ""
-            w.writerow([res["categories"][i], before, after])
+        for c in res["changes"]:
+            w.writerow([c.category, c.before.strip(), c.after.strip()])
     return fn
 
+@exporter("xlsx", cost="heavy")
 def save_xlsx(res, outdir):
     fn = timestamped_filename(OUTPUT_FILE, "xlsx", outdir)
     if DRY_RUN or not SAVE_LOCAL:
         return fn
+    from openpyxl import Workbook
+
     wb = Workbook()
     ws1 = wb.active; ws1.title = "Before"; ws1["A1"] = "Original Text"; ws1["A2"] = res["original"]
     ws2 = wb.create_sheet("After"); ws2["A1"] = "Polished Text"; ws2["A2"] = res["polished"]
     ws3 = wb.create_sheet("Changes"); ws3.append(["Category", "Original Text", "Corrected Text"])
-    for i, c in enumerate(res["changes"]):
-        parts = c.split(" → "); before = parts[0].strip(); after = parts[1].strip() if len(parts)>1 else ""
-        ws3.append([res["categories"][i], before, after])
+    for c in res["changes"]:
+        ws3.append([c.category, c.before.strip(), c.after.strip()])
     ws4 = wb.create_sheet("Stats"); ws4["A1"] = "Stats JSON"; ws4["A2"] = json.dumps(res["stats"])
     wb.save(fn)
     return fn
 
+@exporter("pdf", cost="heavy")
 def save_pdf(res, outdir):
     fn = timestamped_filename(OUTPUT_FILE, "pdf", outdir)
     if DRY_RUN or not SAVE_LOCAL:
         return fn
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib import colors
+
     doc = SimpleDocTemplate(fn)
     styles = getSampleStyleSheet(); elems = []
     elems.append(Paragraph("Clarity Coach Results", styles["Title"])); elems.append(Spacer(1, 12))
@@ -389,9 +761,8 @@ def save_pdf(res, outdir):
 
     elems.append(Paragraph("Changes:", styles["Heading2"]))
     data2 = [["Category", "Original", "Corrected"]]
-    for i, c in enumerate(res["changes"]):
-        parts = c.split(" → "); b = parts[0]; a = parts[1] if len(parts)>1 else ""
-        data2.append([res["categories"][i], b, a])
+    for c in res["changes"]:
+        data2.append([c.category, c.before, c.after])
     table2 = Table(data2, colWidths=[80, 210, 210])
     table2.setStyle(TableStyle([("GRID",(0,0),(-1,-1),0.5,colors.black)]))
     elems.append(table2); elems.append(Spacer(1, 12))
@@ -402,10 +773,14 @@ def save_pdf(res, outdir):
     doc.build(elems)
     return fn
 
+@exporter("docx", cost="heavy")
 def save_docx(res, outdir):
     fn = timestamped_filename(OUTPUT_FILE, "docx", outdir)
     if DRY_RUN or not SAVE_LOCAL:
         return fn
+    from docx import Document
+    from docx.shared import RGBColor
+
     d = Document()
     d.add_heading("Clarity Coach Results", 0)
     d.add_heading("Before", 1); d.add_paragraph(res["original"])
@@ -418,13 +793,11 @@ def save_docx(res, outdir):
         runR = p.add_run(right);      runR.font.color.rgb = RGBColor(0x00, 0xAA, 0x00)
 
     d.add_heading("Changes", 1)
-    for i, c in enumerate(res["changes"]):
-        p = d.add_paragraph(f"[{res['categories'][i]}] ")
-        parts = c.split(" → ")
-        runL = p.add_run(parts[0] + " "); runL.font.color.rgb = RGBColor(0xAA, 0x00, 0x00)
-        if len(parts) > 1:
-            p.add_run("→ ")
-            runR = p.add_run(parts[1]); runR.font.color.rgb = RGBColor(0x00, 0xAA, 0x00)
+    for c in res["changes"]:
+        p = d.add_paragraph(f"[{c.category}] ")
+        runL = p.add_run(c.before + " "); runL.font.color.rgb = RGBColor(0xAA, 0x00, 0x00)
+        p.add_run("→ ")
+        runR = p.add_run(c.after); runR.font.color.rgb = RGBColor(0x00, 0xAA, 0x00)
 
     d.add_heading("Stats", 1)
     d.add_paragraph(json.dumps(res["stats"], indent=2))
@@ -432,145 +805,899 @@ def save_docx(res, outdir):
     return fn
 
 def save_gdoc(res, tmpdir):
-    # create temp txt to convert
+    # the text Drive converts to a Google Doc
     temp = timestamped_filename(OUTPUT_FILE, "txt", tmpdir)
     with open(temp, "w", encoding="utf-8") as f:
         f.write("=== BEFORE ===\n" + res["original"] + "\n\n")
         f.write("=== AFTER ===\n" + res["polished"] + "\n\n")
         f.write("=== CHANGES ===\n")
-        for i, c in enumerate(res["changes"]):
-            f.write(f"- [{res['categories'][i]}] {c}\n")
+        for c in res["changes"]:
+            f.write(f"- [{c.category}] {c}\n")
         f.write("\n=== STATS ===\n")
         f.write(json.dumps(res["stats"], indent=2))
 
-    if DRY_RUN:
-        return temp, None
+    return temp  # uploaded by the delivery stage (queue_gdoc)
 
-    drive = google_service("drive", "v3")
-    meta = {"name": os.path.splitext(os.path.basename(temp))[0], "mimeType": "application/vnd.google-apps.document"}
-    if DRIVE_FOLDER_ID: meta["parents"] = [DRIVE_FOLDER_ID]
-    file_id = None; link = None
-    for attempt in range(API_RETRIES):
+def plugin_entry_points():
+    from importlib.metadata import entry_points
+    try:
+        return list(entry_points(group=PLUGIN_GROUP))
+    except TypeError:  # Python < 3.10
+        return list(entry_points().get(PLUGIN_GROUP, []))
+
+def load_plugin(name):
+    # import the entry point registered for name; cost may be set as an attribute
+    for ep in plugin_entry_points():
+        if ep.name == name:
+            save = ep.load()
+            EXPORTERS[name] = {"save": save, "cost": getattr(save, "cost", "heavy"),
+                               "stream": getattr(save, "stream", None), "version": getattr(save, "version", None)}
+            return True
+    return False
+
+def available_formats():
+    return list(EXPORTERS) + [ep.name for ep in plugin_entry_points() if ep.name not in EXPORTERS] + ["zip"]
+
+def selected_exporters():
+    # requested formats, heaviest first so the slow renders start straight away
+    selected = []
+    for name in EXPORT_FORMATS or list(EXPORTERS):
+        if name == "zip":
+            continue
+        if name not in EXPORTERS and not load_plugin(name):
+            logging.error(f"Unknown export format: {name}")
+            continue
+        selected.append(name)
+    return sorted(selected, key=lambda name: EXPORTERS[name]["cost"] != "heavy")
+
+def wants_zip():
+    return EXPORT_FORMATS is None or "zip" in EXPORT_FORMATS or bool(SEND_EMAIL and EMAIL_TO)
+
+# ----- Export scheduling -----
+EXPORT_SETTINGS = ("OUTPUT_FILE", "SAVE_LOCAL", "DRY_RUN")  # globals the exporters read
+_export_pools = {}
+
+def export_pool(kind):
+    # created on first use and kept for the whole run; None means render inline
+    if EXPORT_WORKERS <= 1:
+        return None
+    if kind == "process":
+        import multiprocessing
+        if multiprocessing.current_process().daemon:
+            kind = "thread"  # pool workers (--workers) cannot start processes of their own
+    if kind not in _export_pools:
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+        executor = ProcessPoolExecutor if kind == "process" else ThreadPoolExecutor
+        _export_pools[kind] = executor(max_workers=EXPORT_WORKERS)
+    return _export_pools[kind]
+
+def submit_export(pool, save, res, outdir, settings=None):
+    if pool is not None:
+        return pool.submit(run_export, save, res, outdir, settings)
+    from concurrent.futures import Future
+    job = Future()
+    try:
+        job.set_result(run_export(save, res, outdir, settings))
+    except Exception as e:
+        job.set_exception(e)
+    return job
+
+def run_export(save, res, outdir, settings=None):
+    # settings carries the caller's globals into export processes
+    if settings:
+        globals().update(settings)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    out = save(res, outdir)
+    return out, {"wall_ms": round((time.perf_counter() - wall) * 1000, 3),
+                 "cpu_ms": round((time.thread_time() - cpu) * 1000, 3)}
+
+# ----- Output store -----
+_output_store = None
+
+def output_store():
+    global _output_store
+    if _output_store is None:
+        from clarity_coach.store import OutputStore
+        _output_store = OutputStore(OUTPUT_STORE)
+        atexit.register(_output_store.close)
+    return _output_store
+
+_exporter_digests = {}  # (save, version) -> digest
+
+def exporter_digest(name):
+    # the exporter's name, version and source, hashed once per process: editing
+    # save_<format> (or bumping its version) stops old artifacts being reused
+    save, version = EXPORTERS[name]["save"], EXPORTERS[name].get("version")
+    if (save, version) not in _exporter_digests:
+        import inspect
         try:
-            media = MediaFileUpload(temp, mimetype="text/plain")
-            file = drive.files().create(body=meta, media_body=media, fields="id,webViewLink").execute()
-            file_id = file.get("id"); link = file.get("webViewLink")
-            break
-        except Exception as e:
-            logging.error(f"Drive upload failed: {e}")
-            time.sleep(RETRY_SLEEP)
-    return temp, link
+            source = inspect.getsource(save)
+        except (OSError, TypeError):
+            source = None
+        _exporter_digests[save, version] = fingerprint(f"{save.__module__}.{save.__qualname__}", version, source)
+    return _exporter_digests[save, version]
+
+def artifact_key(res, name):
+    # input text and analysis settings (as for the result cache) plus the exporter;
+    # the output file name is not part of the content
+    return fingerprint(cache_key(res["original"]), name, exporter_digest(name))
+
+def store_outputs(results, keys, timings, scratch):
+    # rendered files move from scratch into the store; every artifact used goes in the index
+    store = output_store()
+    for name, key in keys.items():
+        if name not in results:
+            continue
+        reused = timings[name].get("reused", False)
+        if not reused:
+            results[name] = store.put(key, results[name], name)
+        store.record(RUN_ID, OUTPUT_FILE, name, key, reused)
+    store.discard(scratch)
+
+def store_zip(paths):
+    # keyed by its members (whose names are their keys); entries are named after OUTPUT_FILE
+    store = output_store()
+    key = fingerprint("zip", ZIP_LEVEL, OUTPUT_FILE, [os.path.basename(p) for p in paths])
+    found = store.find(key)
+    store.record(RUN_ID, OUTPUT_FILE, "zip", key, found is not None)
+    if found:
+        return found
+    scratch = store.scratch()
+    try:
+        names = [OUTPUT_FILE + os.path.splitext(p)[1] for p in paths]
+        return store.put(key, zip_files(paths, scratch, names=names), "zip")
+    finally:
+        store.discard(scratch)
 
 # ----- Zip and email -----
-def zip_files(paths, outdir):
-    fn = timestamped_filename(OUTPUT_FILE, "zip", outdir)
+def zip_files(paths, outdir, base=None, names=None):
+    fn = timestamped_filename(base or OUTPUT_FILE, "zip", outdir)
     if DRY_RUN:
         return fn
-    with zipfile.ZipFile(fn, "w", zipfile.ZIP_DEFLATED) as z:
-        for p in paths:
+    # entries are copied from disk in blocks; formats that are zip containers
+    # already (xlsx, docx) aren't deflated a second time
+    with zipfile.ZipFile(fn, "w") as z:
+        for i, p in enumerate(paths):
             if p and os.path.exists(p):
-                z.write(p, arcname=os.path.basename(p))
+                stored = ZIP_LEVEL == 0 or os.path.splitext(p)[1].lower() in ZIP_STORED_EXTS
+                z.write(p, arcname=names[i] if names else os.path.basename(p),
+                        compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED,
+                        compresslevel=None if stored else ZIP_LEVEL)
     return fn
 
-def send_email_with_zip(zip_path, subject="Clarity Coach Results", body="See attached results."):
+def email_job(zip_path, subject="Clarity Coach Results", body="See attached results."):
+    # delivery payload for send_gmail, or None when there is nothing to send
     if not zip_path or not os.path.exists(zip_path) or not SEND_EMAIL:
-        return False
+        return None
     if EMAIL_TO is None:
         logging.info("EMAIL_TO not set; skipping email.")
-        return False
-
-    gmail = google_service("gmail", "v1")
-    sender = EMAIL_FROM if EMAIL_FROM else "me"
-
-    message = MIMEMultipart()
-    message["to"] = EMAIL_TO
-    message["from"] = sender
-    message["subject"] = subject
-    message.attach(MIMEText(body, "plain"))
-
-    with open(zip_path, "rb") as f:
-        part = MIMEBase("application", "zip")
-        part.set_payload(f.read())
-    encoders.encode_base64(part)
-    part.add_header("Content-Disposition", f'attachment; filename="{os.path.basename(zip_path)}"')
-    message.attach(part)
-
-    raw = base64.urlsafe_b64encode(message.as_bytes()).decode()
-
-    for attempt in range(API_RETRIES):
+        return None
+    return {"zip": os.path.abspath(zip_path), "to": EMAIL_TO, "from": EMAIL_FROM or "me",
+            "subject": subject, "body": body}
+
+MIME_BLOCK = 57 * 1024  # whole 76-character base64 lines per block read
+
+def base64_lines(data):
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+def write_message(job, out):
+    # the RFC 822 message, written to out piece by piece: the attachment is
+    # base64-encoded straight from the zip file instead of being held in memory.
+    # Every line ends in CRLF, the encoded ones included.
+    from email.header import Header
+    boundary = f"=={os.urandom(12).hex()}"
+    name = os.path.basename(job["zip"])
+    head = (f"To: {job['to']}\r\nFrom: {job['from']}\r\n"
+            f"Subject: {Header(job['subject'], 'utf-8').encode()}\r\nMIME-Version: 1.0\r\n"
+            f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n'
+            f"--{boundary}\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: base64\r\n\r\n"
+            f"{base64_lines(job['body'].encode('utf-8')).decode()}"
+            f"--{boundary}\r\nContent-Type: application/zip\r\nContent-Transfer-Encoding: base64\r\n"
+            f'Content-Disposition: attachment; filename="{name}"\r\n\r\n')
+    out.write(head.encode("utf-8"))
+    with open(job["zip"], "rb") as f:
+        for block in iter(lambda: f.read(MIME_BLOCK), b""):
+            out.write(base64_lines(block))
+    out.write(f"--{boundary}--\r\n".encode())
+
+def send_gmail(job):
+    # uploaded as message/rfc822 media in resumable chunks, so the message is never
+    # base64-encoded a second time or built as one string
+    from googleapiclient.http import MediaIoBaseUpload
+    with tempfile.SpooledTemporaryFile(max_size=EMAIL_SPOOL_MB * 2**20) as spool:
+        write_message(job, spool)
+        spool.seek(0)
+        media = MediaIoBaseUpload(spool, mimetype="message/rfc822", chunksize=EMAIL_CHUNK_MB * 2**20, resumable=True)
+        request = google_service("gmail", "v1").users().messages().send(userId="me", body={}, media_body=media)
+        plain_http_endpoint(request).execute(http=google_http())
+    return True
+
+def upload_gdoc(job):
+    from googleapiclient.http import MediaFileUpload
+    meta = {"name": os.path.splitext(os.path.basename(job["path"]))[0],
+            "mimeType": "application/vnd.google-apps.document"}
+    if job.get("folder"): meta["parents"] = [job["folder"]]
+    media = MediaFileUpload(job["path"], mimetype="text/plain")
+    request = google_service("drive", "v3").files().create(body=meta, media_body=media, fields="id,webViewLink")
+    return plain_http_endpoint(request).execute(http=google_http()).get("webViewLink")
+
+def plain_http_endpoint(request):
+    # the client forces https on upload URLs; keep a plain-http --google-endpoint as it is
+    if GOOGLE_API_ENDPOINT and GOOGLE_API_ENDPOINT.startswith("http://"):
+        request.uri = "http://" + request.uri.split("://", 1)[1]
+    return request
+
+# ----- Delivery -----
+# Uploads and sends are handed to a background event loop (clarity_coach/delivery.py)
+# and overlap with the analysis and exports that follow; settle() waits for them.
+_delivery = None
+
+def delivery_service():
+    # not named delivery(): importing the clarity_coach.delivery submodule
+    # binds that name on the package
+    global _delivery
+    if _delivery is None:
+        from clarity_coach.delivery import Delivery  # asyncio is slow to import; only runs that deliver need it
+        _delivery = Delivery({"gdoc": upload_gdoc, "email": send_gmail}, DELIVERY_CONCURRENCY, API_RETRIES,
+                             RETRY_SLEEP, RETRY_MAX_SLEEP, queue_path=None if DRY_RUN else DELIVERY_QUEUE)
+    return _delivery
+
+def queue_gdoc(temp):
+    if DRY_RUN or not temp:
+        return None
+    return delivery_service().submit("gdoc", {"path": os.path.abspath(temp), "folder": DRIVE_FOLDER_ID})
+
+def queue_email(zip_path, **message):
+    job = email_job(zip_path, **message)
+    return delivery_service().submit("email", job) if job else None
+
+def settle(delivered):
+    # wait for the entry's pending uploads/sends and record how they went
+    for kind, job in delivered.pop("pending", {}).items():
+        field = "gdoc_link" if kind == "gdoc" else "email_sent"
+        if job is None:  # nothing to send (e.g. no zip)
+            delivered[field] = False
+            continue
         try:
-            gmail.users().messages().send(userId="me", body={"raw": raw}).execute()
-            return True
+            delivered[field], delivered["timings"]["gdoc_upload" if kind == "gdoc" else "email"] = job.result()
         except Exception as e:
-            logging.error(f"Gmail send failed: {e}")
-            time.sleep(RETRY_SLEEP)
-    return False
-
-# ----- Append log -----
-def append_log(res):
+            delivered.setdefault("errors", {})[kind] = str(e)
+            if kind == "email": delivered["email_sent"] = False
+    return delivered
+
+def resume_deliveries():
+    # uploads/sends an earlier run left unfinished, of the kinds this run delivers:
+    # --no-email, --no-gdoc and --no-save leave them queued for a later run
+    kinds = [kind for kind, on in (("gdoc", UPLOAD_GDOC), ("email", SEND_EMAIL)) if on]
+    if DRY_RUN or not SAVE_LOCAL or not kinds or not os.path.exists(DELIVERY_QUEUE):
+        return
+    jobs = delivery_service().resume(kinds)
+    if jobs:
+        print(f"Retrying {len(jobs)} upload(s)/email(s) left over from an earlier run.")
+    return jobs
+
+def close_delivery():
+    global _delivery
+    if _delivery is not None:
+        _delivery.close()
+        _delivery = None
+
+# ----- Run log -----
+_run_log = None
+
+def run_log():
+    global _run_log
+    if _run_log is None:
+        from clarity_coach.runlog import RunLog
+        _run_log = RunLog(RUN_LOG, RUN_LOG_MAX_MB * 2**20, RUN_LOG_ROTATE_DAYS, RUN_LOG_KEEP, RUN_LOG_BUFFER)
+        atexit.register(_run_log.close)
+    return _run_log
+
+def append_log(res, source=None):
+    # buffered; written in one append per RUN_LOG_BUFFER records and at exit
+    if not RUN_LOG:
+        return
+    from clarity_coach.runlog import words_of
     try:
-        with open(APPEND_LOG_MD, "a", encoding="utf-8") as f:
-            f.write(f"\n\n# Run {ts()}\n")
-            f.write("## Before\n" + res["original"] + "\n\n")
-            f.write("## After\n" + res["polished"] + "\n\n")
-            f.write("## Changes\n")
-            for i, c in enumerate(res["changes"]):
-                f.write(f"- [{res['categories'][i]}] {c}\n")
-            f.write("\n## Stats\n" + json.dumps(res["stats"], indent=2) + "\n")
+        stats = {k: v for k, v in res["stats"].items() if k != "timings"}  # timings go to TIMINGS_LOG
+        run_log().add({"ts": round(time.time(), 3), "source": source, "original": res["original"],
+                       "polished": res["polished"], "changes": [c.to_list() for c in res["changes"]],
+                       "stats": stats}, words_of(res["original"]))
     except Exception as e:
-        logging.error(f"Append log failed: {e}")
+        logging.error(f"Run log failed: {e}")
+
+def flush_log():
+    if _run_log is not None:
+        try:
+            _run_log.flush()
+        except Exception as e:
+            logging.error(f"Run log failed: {e}")
 
 # ----- Clipboard -----
+_clipboard = None
+
+def clipboard_ok():
+    # checked once per process: a missing backend (headless box, no xclip/xsel) is not an error
+    global _clipboard
+    if _clipboard is None:
+        try:
+            _clipboard = HAS_CLIP and bool(pyperclip.determine_clipboard()[0])
+        except Exception:
+            _clipboard = False
+    return _clipboard
+
 def copy_to_clipboard(text):
-    if HAS_CLIP:
+    global _clipboard
+    if clipboard_ok():
         try:
             pyperclip.copy(text)
         except Exception as e:
-            logging.error(f"Clipboard copy failed: {e}")
+            _clipboard = False  # don't retry a broken backend for every text
+            logging.error(f"Clipboard copy failed, not copying again this run: {e}")
 
 # ----- Orchestrator for one text -----
 def process_text(text, outroot):
-    res = analyze_text(text)
+    return process_result(analyze_text(text), outroot)
 
+def process_result(res, outroot):
     # console
     print_console(res)
 
     # clipboard
     copy_to_clipboard(res["polished"])
 
-    # outputs
-    produced = []
-    if SAVE_LOCAL:
-        produced.append(save_markdown(res, outroot))
-        produced.append(save_html(res, outroot))
-        produced.append(save_txt(res, outroot))
-        produced.append(save_json(res, outroot))
-        produced.append(save_csv(res, outroot))
-        produced.append(save_xlsx(res, outroot))
-        produced.append(save_pdf(res, outroot))
-        produced.append(save_docx(res, outroot))
-
-    # Google Doc
-    gdoc_temp = None
-    gdoc_link = None
-    if UPLOAD_GDOC:
-        gdoc_temp, gdoc_link = save_gdoc(res, outroot)
-        if gdoc_temp: produced.append(gdoc_temp)
-        if gdoc_link: print(f"Google Doc: {gdoc_link}")
-
-    # Zip + email
-    zip_path = zip_files(produced, outroot) if (SAVE_LOCAL or UPLOAD_GDOC) else None
-    if SEND_EMAIL and EMAIL_TO:
-        ok = send_email_with_zip(zip_path)
-        print("Email sent." if ok else "Email skipped or failed.")
+    delivered = settle(export_result(res, outroot))
+    report_delivery(delivered)
+    log_timings(res, delivered)
 
     # append log
     append_log(res)
 
     return res
 
+def export_result(res, outroot):
+    # every format is an independent rendering of res: they run concurrently on the
+    # export pool, and a failing format is reported without stopping the others
+    timings, errors, results = {}, {}, {}
+    jobs, keys, scratch = {}, {}, None
+    res = exported(res)
+    if SAVE_LOCAL:
+        pool = export_pool(EXPORT_EXECUTOR)
+        settings = {name: globals()[name] for name in EXPORT_SETTINGS} if EXPORT_EXECUTOR == "process" else None
+        if OUTPUT_STORE and not DRY_RUN:
+            scratch = output_store().scratch()
+        for name in selected_exporters():
+            if scratch:
+                # an artifact with the same key already holds exactly this output
+                keys[name] = artifact_key(res, name)
+                found = output_store().find(keys[name])
+                if found:
+                    results[name], timings[name] = found, {"wall_ms": 0.0, "cpu_ms": 0.0, "reused": True}
+                    continue
+            jobs[name] = submit_export(pool, EXPORTERS[name]["save"], res, scratch or outroot, settings)
+    if UPLOAD_GDOC and not DIGEST:
+        # only writes the text to upload; the upload itself is queued below
+        jobs["gdoc"] = submit_export(export_pool("thread"), save_gdoc, res, outroot)
+
+    for name, job in jobs.items():
+        try:
+            results[name], timings[name] = job.result()
+        except Exception as e:
+            logging.error(f"Export {name} failed: {e}")
+            errors[name] = str(e)
+    if scratch:
+        store_outputs(results, keys, timings, scratch)
+
+    # outputs, in the order formats were requested whatever order they finished in
+    order = EXPORT_FORMATS or list(EXPORTERS)
+    produced = [results[name] for name in order if name in results]
+    gdoc_temp = results.get("gdoc")
+    stored = list(produced)
+    if gdoc_temp: produced.append(gdoc_temp)
+
+    if DIGEST:  # bundled, uploaded and emailed once for the whole run (deliver_digest)
+        zip_path, pending = None, {}
+    elif scratch:  # the zip holds the stored artifacts only; the upload text is not one of them
+        zip_path, pending = bundle_and_send(stored, outroot, timings, store=True)
+    else:
+        zip_path, pending = bundle_and_send(produced, outroot, timings, SAVE_LOCAL or UPLOAD_GDOC)
+    gdoc_job = queue_gdoc(gdoc_temp)
+    if gdoc_job: pending["gdoc"] = gdoc_job
+    return {"outputs": produced, "zip": zip_path, "gdoc_link": None, "email_sent": None,
+            "errors": errors, "timings": timings, "pending": pending}
+
+def bundle_and_send(produced, outroot, timings, bundle=True, store=False):
+    # Zip + email
+    zip_path = None
+    if bundle and wants_zip():
+        with timed(timings, "zip"):
+            zip_path = store_zip(produced) if store else zip_files(produced, outroot)
+    # the email goes out in the background; its outcome is filled in by settle()
+    pending = {}
+    if SEND_EMAIL and EMAIL_TO:
+        pending["email"] = queue_email(zip_path)
+    return zip_path, pending
+
+def report_delivery(delivered):
+    for name, err in delivered.get("errors", {}).items():
+        print(f"Export {name} failed: {err}")
+    if delivered["gdoc_link"]: print(f"Google Doc: {delivered['gdoc_link']}")
+    if delivered["email_sent"] is not None:
+        print("Email sent." if delivered["email_sent"] else "Email skipped or failed.")
+
+# ----- Streaming -----
+# For inputs too large to hold several copies of in memory: the file is read in
+# blocks and cut at sentence ends into chunks of about STREAM_CHUNK_CHARS, the
+# chunks are analyzed STREAM_BATCH at a time, and each result is appended to the
+# streaming writers and dropped. Only running totals are kept.
+READ_BLOCK = 1 << 16
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+")
+
+def iter_chunks(f, size=None):
+    size = size or STREAM_CHUNK_CHARS
+    buf = ""
+    for block in iter(lambda: f.read(READ_BLOCK), ""):
+        buf += block
+        while len(buf) > size:
+            cut = chunk_cut(buf, size)
+            chunk, buf = buf[:cut].strip(), buf[cut:]
+            if chunk:
+                yield chunk
+    if buf.strip():
+        yield buf.strip()
+
+def chunk_cut(buf, size):
+    # after the last sentence end that fits, else the last whitespace, else a hard cut
+    end = 0
+    for m in SENTENCE_END.finditer(buf, 0, size):
+        end = m.end()
+    if not end:
+        end = max(buf.rfind(" ", 0, size), buf.rfind("\n", 0, size)) + 1
+    return end or size
+
+def analyze_stream(chunks, batch=None):
+    # generator of analyze_texts results, one per chunk
+    batch = batch or STREAM_BATCH
+    group = []
+    for chunk in chunks:
+        group.append(chunk)
+        if len(group) >= batch:
+            yield from analyze_texts(group)
+            group = []
+    if group:
+        yield from analyze_texts(group)
+
+def add_stats(total, st):
+    total["parts"] = total.get("parts", 0) + 1
+    for key in ("words_before", "words_after", "num_changes", "fuzzy_lookups", "memo_hits"):
+        total[key] = total.get(key, 0) + st.get(key, 0)
+    by_cat = total.setdefault("by_category", {})
+    for cat, n in st["by_category"].items():
+        by_cat[cat] = by_cat.get(cat, 0) + n
+    return total
+
+class StreamWriter:
+    # one output file written part by part; subclasses supply the format
+    ext = None
+
+    def __init__(self, outdir):
+        self.fn = timestamped_filename(OUTPUT_FILE, self.ext, outdir)
+        self.f = None
+        if SAVE_LOCAL and not DRY_RUN:
+            self.f = open(self.fn, "w", encoding="utf-8", newline="")
+            self.start()
+
+    def add(self, n, res):
+        if self.f:
+            self.write(n, res)
+
+    def close(self, stats=None):
+        if self.f:
+            if stats is not None:
+                self.finish(stats)
+            self.f.close()
+            self.f = None
+        return self.fn
+
+    def start(self): pass
+    def write(self, n, res): pass
+    def finish(self, stats): pass
+
+def stream_exporter(name):
+    # attach a StreamWriter to a registered format so --stream can write it
+    def register(cls):
+        EXPORTERS[name]["stream"] = cls
+        return cls
+    return register
+
+@stream_exporter("md")
+class MarkdownStream(StreamWriter):
+    ext = "md"
+    def start(self):
+        self.f.write("# Clarity Coach Results\n\n")
+    def write(self, n, res):
+        self.f.write(f"## Part {n}\n\n### Before\n{res['original']}\n\n### After\n{res['polished']}\n\n### Changes\n")
+        for c in res["changes"]:
+            self.f.write(f"- [{c.category}] {c}\n")
+        self.f.write("\n")
+    def finish(self, stats):
+        self.f.write("## Stats\n" + json.dumps(stats, indent=2))
+
+@stream_exporter("txt")
+class TextStream(StreamWriter):
+    ext = "txt"
+    def write(self, n, res):
+        self.f.write(f"=== PART {n} ===\n=== BEFORE ===\n{res['original']}\n\n=== AFTER ===\n{res['polished']}\n\n")
+        self.f.write("=== CHANGES MADE ===\n")
+        for c in res["changes"]:
+            self.f.write(f"- [{c.category}] {c}\n")
+        self.f.write("\n")
+    def finish(self, stats):
+        self.f.write("=== STATS ===\n" + json.dumps(stats, indent=2))
+
+@stream_exporter("html")
+class HtmlStream(StreamWriter):
+    ext = "html"
+    def start(self):
+        self.f.write("<html><body><h2>Clarity Coach Results</h2>")
+    def write(self, n, res):
+        self.f.write(f"<h3>Part {n}</h3><h4>Before</h4><p>{res['original']}</p><h4>After</h4><p>{res['polished']}</p>")
+        self.f.write("<table border='1' cellpadding='6' cellspacing='0'><tr><th>Original</th><th>Polished</th></tr>")
+        self.f.write(html_diff_table_rows(res["diff_pairs"]) + "</table><ul>")
+        for c in res["changes"]:
+            self.f.write(f"<li>[{c.category}] <span style='color:red'>{c.before}</span> → <span style='color:green'>{c.after}</span></li>")
+        self.f.write("</ul>")
+    def finish(self, stats):
+        self.f.write("<h3>Stats</h3><pre>" + json.dumps(stats, indent=2) + "</pre></body></html>")
+
+@stream_exporter("json")
+class JsonStream(StreamWriter):
+    # {"parts": [...], "stats": {...}}, valid JSON once closed
+    ext = "json"
+    def start(self):
+        self.f.write('{\n"parts": [\n')
+    def write(self, n, res):
+        self.f.write((",\n" if n > 1 else "") + json.dumps(to_json(res), ensure_ascii=False))
+    def finish(self, stats):
+        self.f.write('\n],\n"change_fields": ' + json.dumps(CHANGE_FIELDS))
+        self.f.write(',\n"stats": ' + json.dumps(stats, indent=4) + "\n}\n")
+
+@stream_exporter("csv")
+class CsvStream(StreamWriter):
+    ext = "csv"
+    def start(self):
+        self.w = csv.writer(self.f); self.w.writerow(["Category", "Original Text", "Corrected Text"])
+    def write(self, n, res):
+        for c in res["changes"]:
+            self.w.writerow([c.category, c.before.strip(), c.after.strip()])
+
+def process_stream(fp, outroot):
+    # stream one file through analysis into the streaming writers; returns a manifest entry
+    global OUTPUT_FILE
+    base, started = OUTPUT_FILE, time.time()
+    OUTPUT_FILE = f"{base}_{os.path.splitext(os.path.basename(fp))[0]}"
+    names = selected_exporters() if SAVE_LOCAL else []
+    streamable = [name for name in names if EXPORTERS[name].get("stream")]
+    writers, stats, timings = [], {}, {}
+    try:
+        writers = [EXPORTERS[name]["stream"](outroot) for name in streamable]
+        with open(fp, "r", encoding="utf-8") as f:
+            for n, res in enumerate(analyze_stream(iter_chunks(f)), 1):
+                add_stats(stats, res["stats"])
+                for w in writers:
+                    w.add(n, exported(res))
+        produced = [w.close(export_stats(stats)) for w in writers]
+        zip_path, pending = (None, {}) if DIGEST else bundle_and_send(produced, outroot, timings, SAVE_LOCAL)
+        entry = settle({"file": fp, "status": "ok", "streamed": True, "outputs": produced, "zip": zip_path,
+                        "gdoc_link": None, "email_sent": None, "stats": stats, "timings": timings, "errors": {},
+                        "skipped_formats": [name for name in names if name not in streamable], "pending": pending})
+    except Exception as e:
+        logging.error(f"Streaming {fp} failed: {e}")
+        for w in writers:
+            w.close()
+        entry = {"file": fp, "status": "error", "error": str(e)}
+    finally:
+        OUTPUT_FILE = base
+    entry["seconds"] = round(time.time() - started, 3)
+    return entry
+
+# ----- Folder batch -----
+# Settings main() may override; handed to worker processes as-is.
+RUN_SETTINGS = ("HIGHLIGHT", "SEND_EMAIL", "UPLOAD_GDOC", "SAVE_LOCAL", "DRY_RUN", "EMAIL_FROM", "EMAIL_TO",
+                "DRIVE_FOLDER_ID", "OUTPUT_FILE", "NLP_BATCH_SIZE", "SENTENCE_MODE", "CACHE_SIZE", "CACHE_DIR",
+                "TOKEN_MEMO_SIZE", "TOKEN_MEMO_FILE", "TIMINGS_LOG", "PROFILE", "EXPORT_FORMATS", "EXPORT_WORKERS", "EXPORT_EXECUTOR", "STREAM",
+                "STREAM_CHUNK_CHARS", "DELIVERY_QUEUE", "DELIVERY_CONCURRENCY", "GOOGLE_API_ENDPOINT", "DIGEST", "ZIP_LEVEL",
+                "OUTPUT_STORE", "RUN_ID")
+
+def read_text(fp):
+    with open(fp, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+def process_batch(paths, outroot):
+    # analyze a batch of files through one nlp.pipe call, then export each;
+    # returns one (manifest entry, result) pair per file, in input order
+    global OUTPUT_FILE
+    if STREAM:
+        batch = [(process_stream(fp, outroot), None) for fp in paths]
+        token_memo().flush()
+        return batch
+    entries, texts = {}, {}
+    for fp in paths:
+        try:
+            texts[fp] = read_text(fp)
+        except Exception as e:
+            logging.error(f"Reading {fp} failed: {e}")
+            entries[fp] = {"file": fp, "status": "error", "error": str(e)}
+    readable = list(texts)
+    try:
+        results = dict(zip(readable, analyze_texts([texts[fp] for fp in readable])))
+    except Exception as e:
+        logging.error(f"Batch analysis failed: {e}")
+        results = {}
+        entries.update({fp: {"file": fp, "status": "error", "error": str(e)} for fp in readable})
+
+    base = OUTPUT_FILE
+    for fp, res in results.items():
+        started = time.time()
+        # per-input names, so files finishing in the same second don't collide
+        OUTPUT_FILE = f"{base}_{os.path.splitext(os.path.basename(fp))[0]}"
+        try:
+            entries[fp] = {"file": fp, "status": "ok", **export_result(res, outroot)}
+        except Exception as e:
+            logging.error(f"Processing {fp} failed: {e}")
+            entries[fp] = {"file": fp, "status": "error", "error": str(e)}
+        finally:
+            OUTPUT_FILE = base
+        entries[fp]["seconds"] = round(time.time() - started, 3)
+    # uploads and emails went out in the background while the later files exported
+    for fp, res in results.items():
+        settle(entries[fp])
+        log_timings(res, entries[fp], source=fp)
+    token_memo().flush()  # pool workers exit without running atexit hooks
+    log_summary()
+    return [(entries[fp], results.get(fp)) for fp in paths]
+
+def init_worker(settings):
+    # runs once per worker process: apply CLI settings, warm the model and vocabulary;
+    # caches are reopened here rather than inherited from the parent
+    globals().update(settings, _result_cache=None, _token_memo=None, _delivery=None,
+                     _google_services={}, _google_local=threading.local(), _output_store=None)
+    setup_logging()
+    load_nlp()
+    spell_index()
+
+_profiler = None
+
+def worker_batch(args):
+    # cache counters are per process; send this worker's running totals along
+    global _profiler
+    if PROFILE and _profiler is None:
+        import cProfile
+        _profiler = cProfile.Profile()
+    if _profiler:
+        _profiler.enable()
+    try:
+        batch = process_batch(*args)
+    finally:
+        if _profiler:
+            # cumulative per worker, rewritten after every batch (workers have no exit hook)
+            _profiler.disable()
+            _profiler.dump_stats(f"{PROFILE}_worker{os.getpid()}.pstats")
+    return batch, os.getpid(), cache_stats()
+
+def process_folder(files, outroot, workers=1):
+    # serial, or spread over a process pool; results are reported and logged
+    # in input order either way, and a per-file manifest is written at the end
+    started = ts()
+    if STREAM:
+        size = 1  # each file is already chunked and batched on its own
+    elif workers > 1:
+        size = max(1, min(NLP_BATCH_SIZE, -(-len(files) // (workers * 4))))
+    else:
+        size = NLP_BATCH_SIZE
+    batches = [(files[i:i + size], outroot) for i in range(0, len(files), size)]
+
+    manifest, counters, sections = [], {}, []
+    if workers > 1:
+        import multiprocessing
+        settings = {name: globals()[name] for name in RUN_SETTINGS}
+        settings["NLP_PROCESSES"] = 1  # the pool already provides the parallelism
+        shared_memo = None
+        if not TOKEN_MEMO_FILE:
+            # no persistent memo: workers still share one for the length of the run
+            fd, shared_memo = tempfile.mkstemp(prefix="clarity_tokens_", suffix=".sqlite")
+            os.close(fd)
+            settings["TOKEN_MEMO_FILE"] = shared_memo
+        try:
+            with multiprocessing.Pool(workers, initializer=init_worker, initargs=(settings,)) as pool:
+                for batch, pid, stats in pool.imap(worker_batch, batches):
+                    manifest += report_batch(batch)
+                    counters[pid] = stats
+                    if DIGEST: sections += [digest_section(entry, res) for entry, res in batch]
+        finally:
+            if shared_memo:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(shared_memo + suffix):
+                        os.remove(shared_memo + suffix)
+    else:
+        for args in batches:
+            batch = process_batch(*args)
+            manifest += report_batch(batch)
+            if DIGEST: sections += [digest_section(entry, res) for entry, res in batch]
+        counters[os.getpid()] = cache_stats()
+
+    failed = sum(1 for e in manifest if e["status"] != "ok")
+    cache = {tier: {k: sum(c[tier][k] for c in counters.values()) for k in ("hits", "misses")}
+             for tier in ("results", "tokens")}
+    cache["results"]["disk_hits"] = sum(c["results"]["disk_hits"] for c in counters.values())
+    print(f"\nProcessed {len(manifest)} files: {len(manifest) - failed} ok, {failed} failed.")
+    print(f"Result cache: {cache['results']['hits']} hits ({cache['results']['disk_hits']} from disk), "
+          f"{cache['results']['misses']} misses; token memo: {cache['tokens']['hits']} hits, "
+          f"{cache['tokens']['misses']} misses.")
+    flush_log()
+    log_summary()
+    digest = deliver_digest(manifest, sections, outroot) if DIGEST and not DRY_RUN else None
+    if not DRY_RUN:
+        fn = timestamped_filename("clarity_manifest", "json", outroot)
+        with open(fn, "w", encoding="utf-8") as f:
+            json.dump({"started": started, "finished": ts(), "workers": workers, "cache": cache,
+                       "digest": digest, "files": manifest}, f, indent=2, ensure_ascii=False)
+        print(f"Manifest: {fn}")
+    return manifest
+
+def report_batch(batch):
+    entries = []
+    for entry, res in batch:
+        print(f"\n=== Processing: {entry['file']} ===")
+        if entry.get("streamed"):
+            st = entry["stats"]
+            print(f"Streamed {st.get('parts', 0)} parts: {st.get('words_before', 0)} words, "
+                  f"{st.get('num_changes', 0)} changes {st.get('by_category', {})}")
+            if entry["skipped_formats"]:
+                print(f"Formats without a streaming writer, skipped: {', '.join(entry['skipped_formats'])}")
+            report_delivery(entry)
+        elif res is None:
+            print(f"Failed: {entry['error']}")
+        else:
+            print_console(res)
+            copy_to_clipboard(res["polished"])
+            if entry["status"] == "ok":
+                report_delivery(entry)
+            else:
+                print(f"Export failed: {entry['error']}")
+            append_log(res, entry["file"])
+        entries.append(entry)
+    return entries
+
+# ----- Incremental folder runs -----
+# INPUT_MANIFEST records, per input processed successfully, its size, mtime,
+# content hash and the settings fingerprint of that run. A file matching all
+# of them is skipped; the content is only hashed when size or mtime changed.
+def run_fingerprint():
+    # besides the text, what decides a file's outputs and where they are
+    # delivered: another format, exporter version, store or recipient redoes it
+    exporters = [(name, exporter_digest(name)) for name in selected_exporters()]
+    return fingerprint(analysis_fingerprint(), EXPORT_FORMATS, exporters, SAVE_LOCAL, ZIP_LEVEL, ZIP_STORED_EXTS,
+                       STREAM, STREAM_CHUNK_CHARS, OUTPUT_FILE, OUTPUT_STORE, DIGEST, UPLOAD_GDOC, DRIVE_FOLDER_ID,
+                       SEND_EMAIL, EMAIL_TO, EMAIL_FROM, GOOGLE_API_ENDPOINT)
+
+def file_digest(fp):
+    import hashlib
+    h = hashlib.sha256()
+    with open(fp, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_inputs(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["files"]
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Ignoring input manifest {path}: {e}")
+        return {}
+
+def changed_inputs(files, known):
+    # returns (files to process, {abspath: record to keep once processed});
+    # unchanged files that were only touched get their new mtime in known
+    current = run_fingerprint()
+    changed, records = [], {}
+    for fp in files:
+        path = os.path.abspath(fp)
+        st = os.stat(fp)
+        rec = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "fingerprint": current}
+        old = known.get(path)
+        if old and old.get("fingerprint") == current and old.get("size") == st.st_size:
+            if old.get("mtime_ns") == st.st_mtime_ns:
+                continue
+            rec["sha256"] = file_digest(fp)
+            if rec["sha256"] == old.get("sha256"):
+                old["mtime_ns"] = st.st_mtime_ns
+                continue
+        rec.setdefault("sha256", file_digest(fp))
+        changed.append(fp)
+        records[path] = rec
+    return changed, records
+
+def save_inputs(path, known, records, manifest):
+    # failed files stay out (or keep their old record), so the next run retries them
+    for entry in manifest:
+        rec = records.get(os.path.abspath(entry["file"]))
+        if rec and entry["status"] == "ok":
+            known[os.path.abspath(entry["file"])] = {**rec, "processed": ts(), "outputs": entry.get("outputs"),
+                                                     "zip": entry.get("zip")}
+    known = {fp: rec for fp, rec in known.items() if os.path.exists(fp)}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"updated": ts(), "files": known}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def process_folder_incremental(files, outroot, workers=1):
+    path = os.path.join(outroot, INPUT_MANIFEST)
+    known = load_inputs(path)
+    changed, records = changed_inputs(files, known)
+    print(f"{len(files) - len(changed)} of {len(files)} files unchanged since the last run; skipping them.")
+    manifest = process_folder(changed, outroot, workers) if changed else []
+    if not DRY_RUN:
+        save_inputs(path, known, records, manifest)
+    return manifest
+
+# ----- Digest -----
+def digest_section(entry, res):
+    # one file's part of the digest report; only this text is kept until the run ends
+    lines = [f"## {os.path.basename(entry['file'])}\n"]
+    if entry["status"] != "ok":
+        lines.append(f"Failed: {entry.get('error')}\n")
+    elif res is None:  # streamed: the per-part reports are in the archive
+        st = entry["stats"]
+        lines.append(f"Streamed in {st.get('parts', 0)} parts: {st.get('words_before', 0)} words, "
+                     f"{st.get('num_changes', 0)} changes {st.get('by_category', {})}\n")
+    else:
+        st = res["stats"]
+        lines.append(f"{st['words_before']} words, {st['num_changes']} changes {st['by_category']}\n")
+        lines.append("### After\n" + res["polished"] + "\n")
+        if res["changes"]:
+            lines.append("### Changes\n" + "".join(f"- [{c.category}] {c}\n" for c in res["changes"]))
+    return "\n".join(lines)
+
+def deliver_digest(manifest, sections, outroot):
+    # one report and one archive for the whole run, uploaded once and emailed once
+    timings = {}
+    ok = sum(1 for e in manifest if e["status"] == "ok")
+    path = timestamped_filename("clarity_digest", "md", outroot)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"# Clarity Coach Digest\n\n{len(manifest)} files: {ok} ok, {len(manifest) - ok} failed.\n\n")
+        f.write("\n".join(sections))
+    produced = [p for e in manifest for p in e.get("outputs", []) if p] + [path]
+    with timed(timings, "zip"):
+        zip_path = zip_files(produced, outroot, base="clarity_digest")
+    digest = {"file": path, "zip": zip_path, "gdoc_link": None, "email_sent": None, "errors": {},
+              "timings": timings, "pending": {}}
+    if UPLOAD_GDOC:
+        digest["pending"]["gdoc"] = queue_gdoc(path)
+    if SEND_EMAIL and EMAIL_TO:
+        digest["pending"]["email"] = queue_email(zip_path, subject=f"Clarity Coach Digest ({len(manifest)} files)",
+                                                 body=f"Results for {len(manifest)} files ({ok} ok) attached.")
+    settle(digest)
+    print(f"\nDigest: {path}\nArchive: {zip_path}")
+    report_delivery(digest)
+    return digest
+
 # ----- CLI -----
 def main():
+    global SEND_EMAIL, UPLOAD_GDOC, SAVE_LOCAL, DRY_RUN, EMAIL_TO, EMAIL_FROM, DRIVE_FOLDER_ID
+    global NLP_BATCH_SIZE, NLP_PROCESSES, SENTENCE_MODE, CACHE_DIR, CACHE_SIZE, TOKEN_MEMO_FILE
+    global TIMINGS_LOG, PROFILE, EXPORT_WORKERS, EXPORT_EXECUTOR, EXPORT_FORMATS, STREAM, STREAM_CHUNK_CHARS
+    global DELIVERY_QUEUE, DELIVERY_CONCURRENCY, GOOGLE_API_ENDPOINT, DIGEST, ZIP_LEVEL, RUN_LOG, OUTPUT_STORE, INCREMENTAL
+    if sys.argv[1:2] == ["serve"]:  # long-running HTTP mode, see clarity_coach/server.py
+        from clarity_coach import server
+        return server.main(sys.argv[2:])
+    if sys.argv[1:2] == ["log"]:  # queries over the run log, see clarity_coach/runlog.py
+        from clarity_coach import runlog
+        return runlog.main(sys.argv[2:], RUN_LOG)
+    setup_logging()
     parser = argparse.ArgumentParser(description="Clarity Coach: correct spelling, grammar, jargon; export everywhere.")
     parser.add_argument("text", nargs="?", help="Text to process (wrap in quotes). If omitted, use --folder.")
     parser.add_argument("--folder", help="Process all .txt files in folder (batch mode).")
@@ -582,10 +1709,33 @@ def main():
     parser.add_argument("--email-from", help="Override EMAIL_FROM.")
     parser.add_argument("--drive-folder", help="Google Drive folder ID.")
     parser.add_argument("--outdir", default="clarity_outputs", help="Output directory.")
+    parser.add_argument("--batch-size", type=int, help="Texts per spaCy batch in folder mode.")
+    parser.add_argument("--nlp-procs", type=int, help="spaCy worker processes for folder mode.")
+    parser.add_argument("--sentencizer", choices=["parser", "senter", "rule"], help="Sentence segmentation mode.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for folder mode.")
+    parser.add_argument("--cache-dir", help="Keep analysis results on disk here and reuse them across runs.")
+    parser.add_argument("--cache-size", type=int, help="Analysis results kept in memory (0 disables).")
+    parser.add_argument("--token-memo", help="SQLite file memoizing spelling corrections across runs.")
+    parser.add_argument("--formats", help="Comma-separated export formats, e.g. json,csv (default: all built-ins and zip).")
+    parser.add_argument("--export-workers", type=int, help="Formats rendered concurrently per document (1 = one at a time).")
+    parser.add_argument("--export-executor", choices=["thread", "process"], help="Render formats on threads or processes.")
+    parser.add_argument("--stream", action="store_true", help="Folder mode: read and analyze each file in chunks (for very large files).")
+    parser.add_argument("--chunk-chars", type=int, help="Target chunk size for --stream.")
+    parser.add_argument("--timings", help="Append per-text stage timings to this JSON-lines file.")
+    parser.add_argument("--profile", action="store_true", help="Write cProfile stats for this run to the output directory.")
+    parser.add_argument("--run-log", help="Structured run log file (query it with: clarity-coach log --help).")
+    parser.add_argument("--incremental", action="store_true", help="Folder mode: skip inputs unchanged since the last run.")
+    parser.add_argument("--store", help="Keep outputs in this content-addressed store, reusing identical ones across runs.")
+    parser.add_argument("--zip-level", type=int, choices=range(10), help="Deflate level for zips (0 stores files uncompressed).")
+    parser.add_argument("--digest", action="store_true", help="Folder mode: one combined report, zip, upload and email instead of one per file.")
+    parser.add_argument("--delivery-queue", help="SQLite file of pending uploads/emails, retried by later runs.")
+    parser.add_argument("--delivery-concurrency", type=int, help="Uploads/emails in flight at once.")
+    parser.add_argument("--google-endpoint", help="Send Google API calls to this URL (e.g. a local fake server); no OAuth.")
     args = parser.parse_args()
 
+    from colorama import init as color_init
+    color_init(autoreset=True)
 
-    global SEND_EMAIL, UPLOAD_GDOC, SAVE_LOCAL, DRY_RUN, EMAIL_TO, EMAIL_FROM, DRIVE_FOLDER_ID
     if args.no_email: SEND_EMAIL = False
     if args.no_gdoc: UPLOAD_GDOC = False
     if args.no_save: SAVE_LOCAL = False
@@ -593,6 +1743,34 @@ def main():
     if args.email_to: EMAIL_TO = args.email_to
     if args.email_from: EMAIL_FROM = args.email_from
     if args.drive_folder: DRIVE_FOLDER_ID = args.drive_folder
+    if args.batch_size: NLP_BATCH_SIZE = args.batch_size
+    if args.nlp_procs: NLP_PROCESSES = args.nlp_procs
+    if args.sentencizer: SENTENCE_MODE = args.sentencizer
+    if args.cache_dir: CACHE_DIR = args.cache_dir
+    if args.cache_size is not None: CACHE_SIZE = args.cache_size
+    if args.token_memo: TOKEN_MEMO_FILE = args.token_memo
+    if args.timings: TIMINGS_LOG = args.timings
+    if args.export_workers: EXPORT_WORKERS = args.export_workers
+    if args.export_executor: EXPORT_EXECUTOR = args.export_executor
+    if args.stream: STREAM = True
+    if args.chunk_chars: STREAM_CHUNK_CHARS = args.chunk_chars
+    if args.delivery_queue: DELIVERY_QUEUE = args.delivery_queue
+    if args.delivery_concurrency: DELIVERY_CONCURRENCY = args.delivery_concurrency
+    if args.google_endpoint: GOOGLE_API_ENDPOINT = args.google_endpoint
+    if args.digest and args.folder: DIGEST = True
+    if args.zip_level is not None: ZIP_LEVEL = args.zip_level
+    if args.run_log: RUN_LOG = args.run_log
+    if args.store: OUTPUT_STORE = args.store
+    if args.incremental and args.folder: INCREMENTAL = True
+    if STREAM and OUTPUT_STORE:
+        print("--store cannot be combined with --stream: streamed outputs are written part by part, not stored.")
+        return
+    if args.formats:
+        EXPORT_FORMATS = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+        unknown = [f for f in EXPORT_FORMATS if f not in available_formats()]
+        if unknown:
+            print(f"Unknown format(s): {', '.join(unknown)}. Available: {', '.join(available_formats())}")
+            return
 
     outdir = args.outdir
     if SAVE_LOCAL and not DRY_RUN:
@@ -600,22 +1778,27 @@ def main():
     else:
         ensure_dir(outdir)  # still host temp artifacts
 
+    profiler = None
+    if args.profile:
+        import cProfile
+        PROFILE = os.path.join(outdir, f"clarity_profile_{ts()}")
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     try:
+        resume_deliveries()
         if args.folder:
             # batch mode: each .txt file processed
             files = sorted(glob.glob(os.path.join(args.folder, "*.txt")))
             if not files:
                 print("No .txt files found in folder.")
                 return
-            for fp in files:
-                # Skip previously generated output files to avoid recursion
-                if "clarity_output" in os.path.basename(fp):
-                    continue
-
-                with open(fp, "r", encoding="utf-8") as f:
-                    text = f.read().strip()
-                print(f"\n=== Processing: {fp} ===")
-                process_text(text, outdir)
+            # Skip previously generated output files to avoid recursion
+            files = [fp for fp in files if "clarity_output" not in os.path.basename(fp)]
+            if INCREMENTAL:
+                process_folder_incremental(files, outdir, workers=args.workers)
+            else:
+                process_folder(files, outdir, workers=args.workers)
 
         else:
             # single text mode
@@ -626,6 +1809,19 @@ def main():
     except Exception as e:
         logging.error(f"Fatal error: {e}")
         print("An error occurred. See clarity_errors.log for details.")
+    finally:
+        close_delivery()  # waits for leftovers resumed from earlier runs
+        if profiler:
+            profiler.disable()
+            write_profile(profiler, PROFILE)
+
+def write_profile(profiler, prefix):
+    # raw stats for pstats/snakeviz plus a readable top-30 by cumulative time
+    import pstats
+    profiler.dump_stats(prefix + ".pstats")
+    with open(prefix + ".txt", "w", encoding="utf-8") as f:
+        pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(30)
+    print(f"Profile: {prefix}.pstats")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for the analysis pipeline and the exporters.
+
+Synthetic corpora of several sizes and typo densities are generated from a
+fixed seed, so two runs on the same machine analyze exactly the same text.
+For each corpus the harness measures single-text ``analyze_text`` latency
+(p50/p90/p99), batch throughput through ``analyze_texts`` (docs/sec) and
+the Python heap peak of a batch run (tracemalloc); every registered exporter
+is timed on one result.  Result and token caches are disabled so each run
+pays the full cost.
+
+    python -m clarity_coach.bench --out bench.json
+    python -m clarity_coach.bench --baseline bench.json   # exit 1 on regressions
+
+Only compare baselines recorded on the same machine and settings.
+"""
+
+import os, sys, json, time, random, platform, argparse, tempfile, tracemalloc, statistics
+
+import clarity_coach as cc
+
+# name: (documents, words per document, share of words with a typo)
+CORPORA = {
+    "small": (20, 40, 0.02),
+    "medium": (50, 150, 0.05),
+    "large": (100, 400, 0.10),
+}
+EXPORT_REPEAT = 5
+
+# metric -> True if higher is better; used for --baseline comparisons
+METRICS = {"p50_ms": False, "p90_ms": False, "p99_ms": False, "docs_per_sec": True, "peak_kib": False,
+           "ms": False}
+
+
+def typo(word, rng):
+    if len(word) < 3:
+        return word
+    i = rng.randrange(len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:   # swap neighbours
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == 1:   # drop a letter
+        return word[:i] + word[i + 1:]
+    if kind == 2:   # double a letter
+        return word[:i] + word[i] + word[i:]
+    return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i + 1:]
+
+
+def make_corpus(docs, words, typo_rate, seed=0):
+    """Deterministic documents mixing common words, typos, slang and jargon."""
+    from wordfreq import top_n_list
+    rng = random.Random(seed)
+    vocab = top_n_list("en", 5000)
+    extras = list(cc.SLANG_MAP) + list(cc.CONTRACTIONS) + list(cc.JARGON_DB) + list(cc.GRAMMAR_FIXES)
+    corpus = []
+    for _ in range(docs):
+        out = []
+        for _ in range(words):
+            r = rng.random()
+            if r < typo_rate:
+                out.append(typo(rng.choice(vocab), rng))
+            elif r < typo_rate + 0.03:
+                out.append(rng.choice(extras))
+            else:
+                out.append(rng.choice(vocab))
+            if rng.random() < 0.08:
+                out[-1] += "."
+        corpus.append(" ".join(out))
+    return corpus
+
+
+def fresh_caches():
+    # every measurement starts cold: no result cache, an empty in-memory token memo
+    cc.CACHE_SIZE, cc.CACHE_DIR, cc.TOKEN_MEMO_FILE = 0, None, None
+    cc._result_cache = cc._token_memo = None
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def bench_corpus(corpus):
+    fresh_caches()
+    latencies = []
+    for text in corpus:
+        started = time.perf_counter()
+        cc.analyze_text(text)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    fresh_caches()
+    started = time.perf_counter()
+    cc.analyze_texts(corpus)
+    elapsed = time.perf_counter() - started
+
+    fresh_caches()
+    tracemalloc.start()
+    cc.analyze_texts(corpus)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"docs": len(corpus), "words": sum(len(t.split()) for t in corpus),
+            "p50_ms": round(percentile(latencies, 50), 3), "p90_ms": round(percentile(latencies, 90), 3),
+            "p99_ms": round(percentile(latencies, 99), 3), "mean_ms": round(statistics.mean(latencies), 3),
+            "docs_per_sec": round(len(corpus) / elapsed, 2), "peak_kib": peak // 1024}
+
+
+def bench_exporters(res):
+    cc.SAVE_LOCAL, cc.DRY_RUN = True, False
+    results = {}
+    with tempfile.TemporaryDirectory() as outdir:
+        for name, exp in cc.EXPORTERS.items():
+            save = exp["save"]
+            times = []
+            for i in range(EXPORT_REPEAT):
+                cc.OUTPUT_FILE = f"bench_{name}_{i}"  # timestamps alone would collide within a second
+                started = time.perf_counter()
+                save(res, outdir)
+                times.append((time.perf_counter() - started) * 1000)
+            results[name] = {"ms": round(statistics.median(times), 3)}
+    return results
+
+
+def compare(current, baseline, tolerance):
+    """Lines describing metrics that got worse than baseline by more than tolerance."""
+    regressions = []
+    for section, entries in baseline["results"].items():
+        for name, metrics in entries.items():
+            now = current["results"].get(section, {}).get(name)
+            if not now:
+                continue
+            for metric, higher_is_better in METRICS.items():
+                if metric not in metrics or metric not in now or not metrics[metric]:
+                    continue
+                change = (now[metric] - metrics[metric]) / metrics[metric]
+                if (-change if higher_is_better else change) > tolerance:
+                    regressions.append(f"{section}/{name} {metric}: {metrics[metric]} -> {now[metric]} "
+                                       f"({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Clarity Coach analysis and exports.")
+    parser.add_argument("--corpora", default="small,medium", help=f"Comma-separated from: {', '.join(CORPORA)}.")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus generator seed.")
+    parser.add_argument("--sentencizer", choices=["parser", "senter", "rule"], help="Sentence segmentation mode.")
+    parser.add_argument("--no-export", action="store_true", help="Skip the exporter benchmarks.")
+    parser.add_argument("--out", help="Write results to this JSON file (e.g. a new baseline).")
+    parser.add_argument("--baseline", help="Compare against this results file; exit 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a metric counts as a regression.")
+    args = parser.parse_args()
+
+    if args.sentencizer:
+        cc.SENTENCE_MODE = args.sentencizer
+
+    # warm up the model and vocabulary so the first measured text doesn't pay for loading them
+    cc.load_nlp()
+    cc.spell_index()
+
+    report = {"meta": {"ts": cc.ts(), "python": platform.python_version(), "platform": platform.platform(),
+                       "cpus": os.cpu_count(), "sentence_mode": cc.SENTENCE_MODE, "model": cc.NLP_MODEL,
+                       "fuzzy_score": cc.FUZZY_SCORE, "seed": args.seed},
+              "results": {"analysis": {}}}
+    sample = None
+    for name in args.corpora.split(","):
+        docs, words, rate = CORPORA[name]
+        corpus = make_corpus(docs, words, rate, args.seed)
+        report["results"]["analysis"][name] = r = bench_corpus(corpus)
+        print(f"{name:>8}: p50 {r['p50_ms']} ms, p90 {r['p90_ms']} ms, p99 {r['p99_ms']} ms, "
+              f"{r['docs_per_sec']} docs/s, peak {r['peak_kib']} KiB")
+        sample = sample or corpus[0]
+
+    if not args.no_export:
+        fresh_caches()
+        report["results"]["export"] = bench_exporters(cc.analyze_text(sample))
+        for name, r in report["results"]["export"].items():
+            print(f"{name:>8}: {r['ms']} ms")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
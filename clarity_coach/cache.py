@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""Result cache for analyze_text: an in-memory LRU in front of an optional
+on-disk store.
+
+Entries are keyed by a hash of the input text and a fingerprint of everything
+else that decides the output (rule tables, model, thresholds), so changing
+any of those simply misses instead of returning stale results.  Values are
+stored as JSON; the disk tier keeps one file per entry and is pruned by age
+and by total size (least recently used first), so several processes can
+share one directory.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+PRUNE_EVERY = 100   # disk writes between two size/age sweeps
+
+
+def fingerprint(*parts):
+    """Stable hash of JSON-serialisable settings."""
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, size=256, directory=None, max_bytes=100 * 2**20, max_age=30 * 86400):
+        self.size = size
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.prune()
+
+    @staticmethod
+    def key(text, fp):
+        return hashlib.sha256(f"{fp}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """Decoded value, or None on a miss."""
+        with self._lock:
+            blob = self._mem.get(key)
+            if blob is not None:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return json.loads(blob)
+        blob = self._read(key) if self.directory else None
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, blob)
+        return json.loads(blob)
+
+    def put(self, key, value):
+        blob = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, blob)
+        if self.directory:
+            self._write(key, blob)
+
+    def _remember(self, key, blob):
+        if self.size <= 0:
+            return
+        self._mem[key] = blob
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.size:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                blob = f.read()
+            os.utime(path)  # mtime doubles as "last used" for size-based eviction
+            return blob
+        except OSError:
+            return None
+
+    def _write(self, key, blob):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(blob)
+            os.replace(tmp, path)  # atomic, so concurrent readers never see half a file
+        except OSError:
+            return
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Drop disk entries older than max_age, then the least recently used
+        ones until the store fits in max_bytes."""
+        if not self.directory:
+            return
+        now, entries = time.time(), []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if now - st.st_mtime > self.max_age or (name.endswith(".tmp") and now - st.st_mtime > 3600):
+                    self._unlink(path)
+                else:
+                    entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._unlink(path)
+            total -= size
+
+    def _unlink(self, path):
+        try:
+            os.remove(path)
+            with self._lock:
+                self.evictions += 1
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "disk_hits": self.disk_hits,
+                    "evictions": self.evictions, "entries": len(self._mem),
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+
+class TokenMemo:
+    """token -> (correction, score, category) for the fuzzy spelling path.
+
+    A bounded in-memory LRU, optionally backed by a SQLite file that several
+    processes can read and write at once (WAL mode), so a batch run, or every
+    run sharing the file, pays for each distinct token only once.  Rows are
+    tagged with the same kind of fingerprint as ResultCache keys; rows from
+    another fingerprint are dropped when the file is opened.
+    """
+
+    FLUSH_EVERY = 200   # buffered writes per SQLite transaction
+
+    def __init__(self, fp, size=50000, path=None, max_rows=1000000):
+        self.fp = fp
+        self.size = size
+        self.path = path
+        self._mem = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = self.misses = 0
+        if path:
+            self._open(path, max_rows)
+
+    def _open(self, path, max_rows):
+        import sqlite3
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        with db:
+            db.execute("CREATE TABLE IF NOT EXISTS memo (fp TEXT, token TEXT, correction TEXT, "
+                       "score INTEGER, category TEXT, PRIMARY KEY (fp, token))")
+            db.execute("DELETE FROM memo WHERE fp != ?", (self.fp,))
+            extra = db.execute("SELECT COUNT(*) FROM memo").fetchone()[0] - max_rows
+            if extra > 0:  # oldest inserts go first
+                db.execute("DELETE FROM memo WHERE rowid IN (SELECT rowid FROM memo ORDER BY rowid LIMIT ?)",
+                           (extra,))
+        self._db = db
+
+    def get(self, token):
+        with self._lock:
+            value = self._mem.get(token)
+            if value is None and self._db is not None:
+                row = self._db.execute("SELECT correction, score, category FROM memo WHERE fp = ? AND token = ?",
+                                       (self.fp, token)).fetchone()
+                if row is not None:
+                    value = tuple(row)
+                    self._remember(token, value)
+            if value is None:
+                self.misses += 1
+                return None
+            self._mem.move_to_end(token)
+            self.hits += 1
+            return value
+
+    def put(self, token, value):
+        with self._lock:
+            self._remember(token, tuple(value))
+            if self._db is not None:
+                self._pending[token] = value
+                if len(self._pending) >= self.FLUSH_EVERY:
+                    self._flush()
+
+    def _remember(self, token, value):
+        self._mem[token] = value
+        self._mem.move_to_end(token)
+        while len(self._mem) > self.size:
+            self._mem.popitem(last=False)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        import sqlite3
+        rows = [(self.fp, token, *value) for token, value in self._pending.items()]
+        try:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?, ?)", rows)
+        except sqlite3.OperationalError:
+            return  # locked by another writer for too long; kept for the next flush
+        self._pending.clear()
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._mem),
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
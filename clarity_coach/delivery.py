@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Background delivery of network jobs (Drive uploads, Gmail sends).
+
+The Google client calls block for hundreds of milliseconds each.  Making them
+inline, with a fixed sleep between retries, left the CPU idle while
+``process_text`` and folder batches waited on the network.  ``Delivery``
+runs an asyncio event loop on its own thread instead.  ``submit`` returns a
+``concurrent.futures.Future`` straight away; the blocking call runs via
+``asyncio.to_thread``, at most ``concurrency`` at a time, and a failed
+attempt is retried after an exponential backoff with jitter.
+
+Jobs are written to a SQLite queue (WAL mode, so worker processes can share
+it) before they start and deleted once they succeed.  Jobs left over by a
+run that was interrupted or gave up are picked up again by ``resume``.  That
+makes delivery at-least-once: a job cut off mid-request is repeated.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import wait
+
+
+class DeliveryQueue:
+    """Pending jobs as (id, kind, payload) rows in a SQLite file."""
+
+    def __init__(self, path):
+        import sqlite3
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, kind TEXT, payload TEXT, "
+                             "status TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0, error TEXT, "
+                             "created REAL, owner INTEGER)")
+
+    def add(self, kind, payload):
+        # owned by this process while it works on the job
+        with self._lock, self._db:
+            cur = self._db.execute("INSERT INTO jobs (kind, payload, created, owner) VALUES (?, ?, ?, ?)",
+                                   (kind, json.dumps(payload, ensure_ascii=False), time.time(), os.getpid()))
+            return cur.lastrowid
+
+    def claim(self, kinds=None):
+        """Pending jobs (of kinds, default all) no live process is working on,
+        now owned by this one."""
+        with self._lock, self._db:
+            rows = self._db.execute("SELECT id, kind, payload, owner FROM jobs WHERE status = 'pending'").fetchall()
+            mine = [(job_id, kind, json.loads(payload)) for job_id, kind, payload, owner in rows
+                    if (kinds is None or kind in kinds)
+                    and (owner is None or (owner != os.getpid() and not alive(owner)))]
+            self._db.executemany("UPDATE jobs SET owner = ? WHERE id = ?", [(os.getpid(), j[0]) for j in mine])
+        return mine
+
+    def attempt(self, job_id, error):
+        with self._lock, self._db:
+            self._db.execute("UPDATE jobs SET attempts = attempts + 1, error = ? WHERE id = ?", (error, job_id))
+            return self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+    def release(self, job_id, status="pending"):
+        # pending: left for a later run; failed: kept for inspection only
+        with self._lock, self._db:
+            self._db.execute("UPDATE jobs SET status = ?, owner = NULL WHERE id = ?", (status, job_id))
+
+    def done(self, job_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def close(self):
+        self._db.close()
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists, owned by someone else
+    return True
+
+
+class Delivery:
+    """handlers: {kind: blocking fn(payload) -> result}; one attempt per call,
+    raising on failure."""
+
+    def __init__(self, handlers, concurrency=4, retries=3, backoff=2.0, max_backoff=60.0,
+                 queue_path=None, give_up_after=10):
+        self.handlers = handlers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.give_up_after = give_up_after   # attempts across runs before a job is marked failed
+        self.queue = DeliveryQueue(queue_path) if queue_path else None
+        self._loop = asyncio.new_event_loop()
+        self.concurrency = concurrency
+        self._sem = None  # created on the loop's thread
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="clarity-delivery", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind, payload):
+        job_id = self.queue.add(kind, payload) if self.queue else None
+        return self._start(job_id, kind, payload)
+
+    def resume(self, kinds=None):
+        """Restart jobs (of kinds, default every kind with a handler) left in
+        the queue by earlier runs; returns their futures.  Other jobs stay
+        queued for a run that wants them."""
+        if not self.queue:
+            return []
+        kinds = set(self.handlers) if kinds is None else set(kinds) & set(self.handlers)
+        return [self._start(job_id, kind, payload) for job_id, kind, payload in self.queue.claim(kinds)]
+
+    def _start(self, job_id, kind, payload):
+        future = asyncio.run_coroutine_threadsafe(self._run(job_id, kind, payload), self._loop)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def delay(self, attempt):
+        # exponential backoff with jitter, so retries from many jobs don't line up
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def _run(self, job_id, kind, payload):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        started, error = time.perf_counter(), None
+        for attempt in range(1, self.retries + 1):
+            async with self._sem:
+                try:
+                    result = await asyncio.to_thread(self.handlers[kind], payload)
+                except Exception as e:
+                    error = e
+                else:
+                    if job_id is not None:
+                        self.queue.done(job_id)
+                    return result, {"wall_ms": round((time.perf_counter() - started) * 1000, 3),
+                                    "attempts": attempt}
+            logging.error(f"Delivery {kind} failed (attempt {attempt}/{self.retries}): {error}")
+            final = isinstance(error, FileNotFoundError)  # nothing to deliver; retrying can't help
+            if job_id is not None and (self.queue.attempt(job_id, str(error)) >= self.give_up_after or final):
+                self.queue.release(job_id, "failed")
+                raise error
+            if final:
+                raise error
+            if attempt < self.retries:
+                await asyncio.sleep(self.delay(attempt - 1))  # not holding a slot while waiting
+        if job_id is not None:
+            self.queue.release(job_id)  # the next run tries again
+        raise error
+
+    def drain(self, timeout=None):
+        """Wait for every submitted job to finish (successfully or not)."""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout=timeout)
+
+    def close(self, timeout=None):
+        self.drain(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        if self.queue:
+            self.queue.close()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Word diff for the side-by-side views.
+
+``difflib.SequenceMatcher`` looks for the longest matching block over and
+over, which gets super-linear on long documents.  The corrected text differs
+from the original only in scattered places, so ``diff_opcodes`` anchors the
+two token lists on what they obviously share and diffs the small gaps left:
+
+1. a common prefix and suffix are matched directly;
+2. tokens that occur exactly once on each side are anchors (or, when there
+   are none, runs of ``ANCHOR_RUN`` tokens, which are unique far more
+   often in long texts); the longest run of anchors in the same order on
+   both sides (patience sorting, n log n) splits the range into
+   independent gaps, each handled the same way;
+3. gaps without unique tokens go to Myers' O(ND) algorithm, which is fast
+   because such gaps are short or nearly equal;
+4. past ``MAX_EDITS`` edits (long repetitive text, where nothing is unique)
+   the gap is cut into sentences, the sentence sequences are diffed the same
+   way, and the token diff runs again inside the sentences that changed (one
+   pair at a time where a run of sentences was edited in place).  Only a gap
+   that sentences cannot split is reported as one replacement.
+
+Output has the same shape as ``SequenceMatcher.get_opcodes()``.
+"""
+
+from bisect import bisect_left
+from collections import Counter
+
+MAX_EDITS = 500
+ANCHOR_RUN = 3
+SENTENCE_ENDS = (".", "!", "?", ":", ";")
+
+
+def diff_opcodes(a, b):
+    """(tag, i1, i2, j1, j2) opcodes turning sequence a into b."""
+    ops = []
+    _diff(a, 0, len(a), b, 0, len(b), ops)
+    return _merge(ops)
+
+
+def _diff(a, alo, ahi, b, blo, bhi, ops):
+    # explicit stack of ranges still to diff and opcodes to emit once the
+    # ranges before them are done, so output comes out in order
+    stack = [("range", alo, ahi, blo, bhi)]
+    while stack:
+        item = stack.pop()
+        if item[0] == "emit":
+            ops.append(item[1])
+            continue
+        _, alo, ahi, blo, bhi = item
+
+        # common prefix and suffix
+        i, j = alo, blo
+        while i < ahi and j < bhi and a[i] == b[j]:
+            i += 1; j += 1
+        ops.append(("equal", alo, i, blo, j))
+        alo, blo = i, j
+        i, j = ahi, bhi
+        while alo < i and blo < j and a[i - 1] == b[j - 1]:
+            i -= 1; j -= 1
+        stack.append(("emit", ("equal", i, ahi, j, bhi)))
+        ahi, bhi = i, j
+
+        if alo == ahi or blo == bhi:
+            ops.append(("delete" if alo < ahi else "insert", alo, ahi, blo, bhi))
+            continue
+
+        anchors = (_anchors(a, alo, ahi, b, blo, bhi, 1)
+                   or _anchors(a, alo, ahi, b, blo, bhi, ANCHOR_RUN))
+        if not anchors:
+            edits = _myers(a, alo, ahi, b, blo, bhi)
+            if edits is None:
+                edits = _by_sentence(a, alo, ahi, b, blo, bhi)
+                if edits is None:
+                    ops.append(("replace", alo, ahi, blo, bhi))
+                    continue
+                stack.extend(reversed(edits))
+                continue
+            ops.extend(edits)
+            continue
+        work = []
+        for i, j in anchors:
+            work.append(("range", alo, i, blo, j))
+            work.append(("emit", ("equal", i, i + 1, j, j + 1)))
+            alo, blo = i + 1, j + 1
+        work.append(("range", alo, ahi, blo, bhi))
+        stack.extend(reversed(work))
+
+
+def _anchors(a, alo, ahi, b, blo, bhi, run):
+    """(i, j) starts of run-token sequences unique on both sides, longest common order.
+    Only the first token of each is matched here; the rest falls into the next gap."""
+    ka = [tuple(a[i:i + run]) for i in range(alo, ahi - run + 1)]
+    kb = [tuple(b[j:j + run]) for j in range(blo, bhi - run + 1)]
+    ca, cb = Counter(ka), Counter(kb)
+    pos_b = {key: blo + j for j, key in enumerate(kb) if cb[key] == 1 and ca[key] == 1}
+    pairs = [(alo + i, pos_b[key]) for i, key in enumerate(ka) if key in pos_b]
+    if not pairs:
+        return []
+    # longest increasing subsequence of the b positions (patience sorting)
+    tops, top_idx, prev = [], [], [None] * len(pairs)
+    for n, (_, j) in enumerate(pairs):
+        k = bisect_left(tops, j)
+        if k == len(tops):
+            tops.append(j); top_idx.append(n)
+        else:
+            tops[k] = j; top_idx[k] = n
+        prev[n] = top_idx[k - 1] if k else None
+    out, n = [], top_idx[-1]
+    while n is not None:
+        out.append(pairs[n])
+        n = prev[n]
+    return out[::-1]
+
+
+def _myers(a, alo, ahi, b, blo, bhi):
+    n, m = ahi - alo, bhi - blo
+    v, trace = {1: 0}, []
+    for d in range(min(n + m, MAX_EDITS) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1; y += 1
+            v[k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m, alo, blo)
+    return None  # more than MAX_EDITS edits
+
+
+def _sentences(seq, lo, hi):
+    # start of each sentence in seq[lo:hi] (a run of tokens up to one that
+    # ends a sentence), then hi
+    bounds = [lo]
+    for i in range(lo, hi - 1):
+        if isinstance(seq[i], str) and seq[i].endswith(SENTENCE_ENDS):
+            bounds.append(i + 1)
+    bounds.append(hi)
+    return bounds
+
+
+def _by_sentence(a, alo, ahi, b, blo, bhi):
+    """Work items for a gap past MAX_EDITS, diffed a sentence at a time;
+    None when that does not split it."""
+    ba, bb = _sentences(a, alo, ahi), _sentences(b, blo, bhi)
+    if len(ba) < 3 and len(bb) < 3:
+        return None
+    keys_a = [tuple(a[i:k]) for i, k in zip(ba, ba[1:])]
+    keys_b = [tuple(b[j:k]) for j, k in zip(bb, bb[1:])]
+    work = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(keys_a, keys_b):
+        if tag == "equal":
+            work.append(("emit", ("equal", ba[i1], ba[i2], bb[j1], bb[j2])))
+        elif i2 - i1 == j2 - j1:
+            # sentences edited in place: diff them pairwise
+            work.extend(("range", ba[i], ba[i + 1], bb[j], bb[j + 1]) for i, j in zip(range(i1, i2), range(j1, j2)))
+        else:
+            work.append(("range", ba[i1], ba[i2], bb[j1], bb[j2]))
+    if len(work) == 1:
+        return None  # no sentence in common and none to pair up
+    return work
+
+
+def _backtrack(trace, x, y, alo, blo):
+    ops = []
+    for d in range(len(trace) - 1, -1, -1):
+        v, k = trace[d], x - y
+        if k == -d or (k != d and v.get(k - 1, -1) < v.get(k + 1, -1)):
+            pk = k + 1
+        else:
+            pk = k - 1
+        px = v.get(pk, 0) if d else 0
+        py = px - pk if d else 0
+        while x > px and y > py:
+            x -= 1; y -= 1
+            ops.append(("equal", alo + x, alo + x + 1, blo + y, blo + y + 1))
+        if d:
+            if x == px:
+                ops.append(("insert", alo + x, alo + x, blo + py, blo + py + 1))
+            else:
+                ops.append(("delete", alo + px, alo + px + 1, blo + y, blo + y))
+        x, y = px, py
+    return ops[::-1]
+
+
+def _merge(ops):
+    # join neighbouring opcodes of one kind; a delete next to an insert is a replace
+    out = []
+    for tag, i1, i2, j1, j2 in ops:
+        if i1 == i2 and j1 == j2:
+            continue
+        if out:
+            ptag, pi1, pi2, pj1, pj2 = out[-1]
+            if ptag == tag or (ptag != "equal" and tag != "equal"):
+                out[-1] = (tag if ptag == tag else "replace", pi1, i2, pj1, j2)
+                continue
+        out.append((tag, i1, i2, j1, j2))
+    return out
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Deduplicated, rate-limited logging.
+
+Hot paths can log once per token or per text: fuzzywuzzy's "Applied processor
+reduces input query to empty string" warning for every punctuation token, or
+the same clipboard error for every file.  Each record costs a write to
+``clarity_errors.log`` and buries the errors that matter.  ``LogLimiter`` is a
+``logging.Filter`` for the log handlers.  An identical message gets through
+``repeats`` times.  Below ERROR, one call site (file and line, so messages
+that only differ by the token in them count together) gets through ``rate``
+times per ``window`` seconds; errors are distinct failures (another file,
+another upload) and are only deduplicated.  Anything else is dropped and
+counted, and ``summary()`` writes one line per call site with the count and
+the last message dropped.
+"""
+
+import logging
+import threading
+
+
+class LogLimiter(logging.Filter):
+    def __init__(self, repeats=3, rate=20, window=60.0, max_messages=10000):
+        super().__init__()
+        self.repeats = repeats
+        self.rate = rate
+        self.window = window
+        self.max_messages = max_messages   # distinct messages remembered for dedup
+        self._lock = threading.Lock()
+        self._seen = {}    # message -> times logged
+        self._sites = {}   # (path, line) -> [window start, passed in window, dropped, level, last dropped message]
+
+    def filter(self, record):
+        if record.levelno >= logging.CRITICAL or getattr(record, "log_summary", False):
+            return True
+        msg = record.getMessage()
+        with self._lock:
+            site = self._sites.get((record.pathname, record.lineno))
+            if site is None:
+                site = self._sites[(record.pathname, record.lineno)] = [record.created, 0, 0, record.levelno, None]
+            if record.created - site[0] >= self.window:
+                site[0], site[1] = record.created, 0
+            seen = self._seen.get(msg, 0)
+            if seen < self.repeats and (site[1] < self.rate or record.levelno >= logging.ERROR):
+                if seen == 0 and len(self._seen) >= self.max_messages:
+                    self._seen.clear()
+                self._seen[msg] = seen + 1
+                site[1] += 1
+                return True
+            site[2] += 1
+            site[3], site[4] = record.levelno, msg
+            return False
+
+    def suppressed(self):
+        with self._lock:
+            return sum(site[2] for site in self._sites.values())
+
+    def summary(self, logger=None):
+        """Log what was dropped since the last summary and reset the counts."""
+        with self._lock:
+            dropped = [(path, line, site[2], site[3], site[4]) for (path, line), site in self._sites.items() if site[2]]
+            for site in self._sites.values():
+                site[2] = 0
+        for path, line, n, level, msg in dropped:
+            (logger or logging.getLogger()).log(
+                level, f"Suppressed {n} repeated log messages from {path}:{line}; last: {msg}",
+                extra={"log_summary": True})
+        return sum(d[2] for d in dropped)
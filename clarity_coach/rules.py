@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""Single-pass matching of the rewrite tables (jargon, slang, grammar, ...).
+
+Each table used to be applied with its own loop of ``str.replace``/``re.sub``
+calls, one full pass over the text per entry.  ``RuleMatcher`` compiles every
+table into one regular expression: literal tables become a character trie
+(``(?:a(?:n (?:i|we))|...)``), so the regex engine walks all of them in a single
+scan no matter how many entries they hold, and regex tables are joined as
+named alternatives.  Every match comes back as a ``Change`` with its
+category, rule and character offsets.  ``OffsetMap`` carries offsets from a
+later pass's text back to the text the first pass ran on.
+"""
+
+import re
+from bisect import bisect_left
+
+
+class Change:
+    """One edit: text[start:end] was before and became after, by rule of
+    category.  A pass sets offsets into the text it ran on; analysis results
+    carry them into the original text (see OffsetMap).  Serialized as a plain
+    list in __slots__ order (see to_list/from_list)."""
+    __slots__ = ("category", "before", "after", "start", "end", "rule")
+
+    def __init__(self, category, before, after, start=None, end=None, rule=None):
+        self.category, self.before, self.after = category, before, after
+        self.start, self.end, self.rule = start, end, rule
+
+    def __str__(self):
+        return f"{self.before} → {self.after}"
+
+    def __repr__(self):
+        return f"Change({self.category!r}, {self.before!r}, {self.after!r}, {self.start}, {self.end}, {self.rule!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Change) and self.to_list() == other.to_list()
+
+    def to_list(self):
+        return [self.category, self.before, self.after, self.start, self.end, self.rule]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+
+def trie_regex(words):
+    """Regex matching any of words, longest first, structured as a trie."""
+    trie = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class RuleMatcher:
+    """Rule tables compiled into one pattern; matches never overlap and the
+    leftmost one wins (the longest entry for literals, the earlier table on a tie)."""
+
+    def __init__(self):
+        self._tables = []      # (group, category, kind, table, ignore_case, pattern)
+        self._compiled = {}    # categories -> compiled pattern
+
+    def add_literals(self, category, table, ignore_case=False, whole_token=False):
+        """Plain strings: {text: replacement}. whole_token only matches
+        whitespace-delimited tokens."""
+        if ignore_case:
+            table = {k.lower(): v for k, v in table.items()}
+        pattern = trie_regex(table)
+        if whole_token:
+            pattern = rf"(?<!\S){pattern}(?!\S)"
+        self._add(category, "literal", table, pattern, ignore_case)
+
+    def add_patterns(self, category, table, ignore_case=True):
+        """Regular expressions: {pattern: replacement}."""
+        for pattern, replacement in table.items():
+            self._add(category, "regex", {pattern: replacement}, pattern, ignore_case)
+
+    def _add(self, category, kind, table, pattern, ignore_case):
+        if not table:
+            return
+        group = f"r{len(self._tables)}"
+        self._tables.append((group, category, kind, table, ignore_case, pattern))
+        self._compiled.clear()
+
+    def categories(self):
+        return list(dict.fromkeys(t[1] for t in self._tables))
+
+    def _pattern(self, categories):
+        key = None if categories is None else frozenset(categories)
+        if key not in self._compiled:
+            parts = [f"(?P<{group}>(?i:{pattern}))" if ic else f"(?P<{group}>{pattern})"
+                     for group, cat, _, _, ic, pattern in self._tables if key is None or cat in key]
+            self._compiled[key] = re.compile("|".join(parts)) if parts else None
+        return self._compiled[key]
+
+    def finditer(self, text, categories=None):
+        pattern = self._pattern(categories)
+        if pattern is None:
+            return
+        tables = {t[0]: t for t in self._tables}
+        for m in pattern.finditer(text):
+            _, category, kind, table, ignore_case, _ = tables[m.lastgroup]
+            found = m.group()
+            if kind == "literal":
+                rule = found.lower() if ignore_case else found
+            else:
+                rule = next(iter(table))
+            yield Change(category, found, table.get(rule, found), m.start(), m.end(), rule)
+
+    def apply(self, text, categories=None):
+        """Replace every match in one pass; returns (new_text, matches)."""
+        out, matches, pos = [], [], 0
+        for m in self.finditer(text, categories):
+            out.append(text[pos:m.start])
+            out.append(m.after)
+            pos = m.end
+            matches.append(m)
+        out.append(text[pos:])
+        return "".join(out), matches
+
+
+def _solid_len(s):
+    # non-whitespace characters in s
+    return len("".join(s.split()))
+
+
+class OffsetMap:
+    """Offsets in a rewritten text, traced back to the original.
+
+    The passes between them replace spans (their Changes) and may change
+    whitespace and letter case; nothing else.  So outside the Changes every
+    non-whitespace character survives in order, and a position is tracked as
+    the number of non-whitespace characters before it.  A position inside a
+    replacement maps to the start or end of the span it replaced.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.passes = []  # per pass: [(out_start, out_end, in_start, in_end)] as counts
+        self.lengths = [_solid_len(text)]  # count of each pass's input, then of the output
+
+    def add(self, text, changes):
+        """Record a pass that ran on text and made changes (in text order)."""
+        edits, delta = [], 0
+        for (s, e), c in zip(_pairs(_counts(text, [x for c in changes for x in (c.start, c.end)])), changes):
+            out = _solid_len(c.after)
+            edits.append((s + delta, s + delta + out, s, e))
+            delta += out - (e - s)
+        self.passes.append(edits)
+        self.lengths.append(self.lengths[-1] + delta)
+        return self
+
+    @classmethod
+    def join(cls, text, maps):
+        """The map of text, whose whitespace-separated pieces went through
+        the same passes separately with maps."""
+        joined = cls(text)
+        if not maps:
+            return joined
+        joined.passes = [[] for _ in maps[0].passes]
+        shift = [0] * len(maps[0].lengths)
+        for m in maps:
+            for k, edits in enumerate(m.passes):
+                a, b = shift[k + 1], shift[k]
+                joined.passes[k] += [(o0 + a, o1 + a, s + b, e + b) for o0, o1, s, e in edits]
+            shift = [x + n for x, n in zip(shift, m.lengths)]
+        joined.lengths = shift
+        return joined
+
+    def original(self, changes, text):
+        """Copies of changes (in text order, offsets into text, the output of
+        the recorded passes) with offsets into the original text."""
+        counts = _counts(text, [x for c in changes for x in (c.start, c.end)])
+        for edits in reversed(self.passes):
+            starts = [o0 for o0, _, _, _ in edits]
+            back = []
+            for i, n in enumerate(counts):
+                k = bisect_left(starts, n) - 1
+                if k < 0:
+                    back.append(n)
+                    continue
+                _, o1, s, e = edits[k]
+                back.append((e if i % 2 else s) if n < o1 else n - (o1 - e))
+            counts = back
+        spans = _pairs(_offsets(self.text, counts))
+        return [Change(c.category, c.before, c.after, s, e, c.rule) for c, (s, e) in zip(changes, spans)]
+
+
+def _pairs(values):
+    # [a, b, c, d] -> [(a, b), (c, d)]
+    return list(zip(values[::2], values[1::2]))
+
+
+def _counts(text, offsets):
+    # non-whitespace characters before each offset; offsets non-decreasing
+    out, pos, n = [], 0, 0
+    for off in offsets:
+        n += _solid_len(text[pos:off])
+        pos = off
+        out.append(n)
+    return out
+
+
+_SPACE = re.compile(r"\s*")
+
+
+def _offsets(text, counts):
+    # inverse of _counts for alternating (start, end) counts: a start is the
+    # offset of its next non-whitespace character, an end the one after its last
+    out, pos, n = [], 0, 0
+    for i, target in enumerate(counts):
+        if target < n:  # two changes inside one replacement: rescan
+            pos, n = 0, 0
+        while n < target and pos < len(text):  # never overshoots: a character adds at most one
+            step = pos + target - n
+            n += _solid_len(text[pos:step])
+            pos = step
+        if i % 2 == 0:
+            pos = _SPACE.match(text, pos).end()
+        out.append(pos)
+    return out
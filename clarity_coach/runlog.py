@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""Structured run log: one JSON line per processed text, plus a SQLite index.
+
+``clarity_log.md`` was reopened for every text, grew without bound and could
+only be searched by re-reading markdown.  ``RunLog`` buffers records and
+appends them in one write per flush.  The active file is rotated once it
+passes ``max_bytes`` or ``rotate_days``, and only ``keep`` rotated files are
+kept.  Next to the log, an index (``<log>.idx.sqlite``) records for every
+run its time, source, per-category change counts, the words of its text and
+where its line sits.  Queries go through the index and read only the
+matching lines:
+
+    clarity-coach log --token kubernetes
+    clarity-coach log --by-category --since 7d
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+
+WORD = re.compile(r"[\w'-]+")
+
+
+class RunLog:
+    def __init__(self, path, max_bytes=50 * 2**20, rotate_days=7, keep=10, buffer=100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_days = rotate_days
+        self.keep = keep
+        self.buffer = buffer
+        self._pending = []
+        self._db = None
+
+    def index(self):
+        if self._db is None:
+            self._db = open_index(self.path)
+        return self._db
+
+    def add(self, record, words=()):
+        """record must be JSON-serialisable and carry "ts" (epoch seconds) and
+        "stats"; words are indexed for --token queries."""
+        self._pending.append((record, words))
+        if len(self._pending) >= self.buffer:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        self._rotate_if_needed()
+        lines = [(json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8") for r, _ in self._pending]
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(b"".join(lines))
+        db = self.index()
+        with db:
+            for (record, words), line in zip(self._pending, lines):
+                run = db.execute("INSERT INTO runs (ts, source, segment, offset, length) VALUES (?, ?, ?, ?, ?)",
+                                 (record["ts"], record.get("source"), os.path.basename(self.path), offset,
+                                  len(line))).lastrowid
+                db.executemany("INSERT INTO changes VALUES (?, ?, ?, ?)",
+                               [(run, record["ts"], cat, n) for cat, n in record["stats"]["by_category"].items() if n])
+                db.executemany("INSERT OR IGNORE INTO tokens VALUES (?, ?)", [(w, run) for w in set(words)])
+                offset += len(line)
+        self._pending.clear()
+
+    def _rotate_if_needed(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        first = self._first_ts()
+        too_old = first is not None and time.time() - first > self.rotate_days * 86400
+        if st.st_size < self.max_bytes and not too_old:
+            return
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}.{stamp}{ext}"
+        os.replace(self.path, rotated)
+        db = self.index()
+        with db:
+            db.execute("UPDATE runs SET segment = ? WHERE segment = ?",
+                       (os.path.basename(rotated), os.path.basename(self.path)))
+        for old in sorted(glob.glob(f"{glob.escape(base)}.*-*{ext}"))[:-self.keep or None]:
+            os.remove(old)
+            with db:
+                gone = [r for (r,) in db.execute("SELECT id FROM runs WHERE segment = ?", (os.path.basename(old),))]
+                db.executemany("DELETE FROM tokens WHERE run = ?", [(r,) for r in gone])
+                db.executemany("DELETE FROM changes WHERE run = ?", [(r,) for r in gone])
+                db.execute("DELETE FROM runs WHERE segment = ?", (os.path.basename(old),))
+
+    def _first_ts(self):
+        row = self.index().execute("SELECT MIN(ts) FROM runs WHERE segment = ?",
+                                   (os.path.basename(self.path),)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def open_index(path):
+    db = sqlite3.connect(path + ".idx.sqlite", timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    with db:
+        db.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, ts REAL, source TEXT, "
+                   "segment TEXT, offset INTEGER, length INTEGER)")
+        db.execute("CREATE TABLE IF NOT EXISTS changes (run INTEGER, ts REAL, category TEXT, n INTEGER)")
+        db.execute("CREATE TABLE IF NOT EXISTS tokens (token TEXT, run INTEGER, PRIMARY KEY (token, run)) WITHOUT ROWID")
+        db.execute("CREATE INDEX IF NOT EXISTS runs_ts ON runs (ts)")
+        db.execute("CREATE INDEX IF NOT EXISTS changes_ts ON changes (ts, category)")
+    return db
+
+
+def words_of(text):
+    return {w.lower() for w in WORD.findall(text)}
+
+
+# ----- Queries -----
+def read_runs(path, rows):
+    # rows: (segment, offset, length); each line is read with one seek
+    folder = os.path.dirname(path)
+    handles = {}
+    try:
+        for segment, offset, length in rows:
+            f = handles.get(segment)
+            if f is None:
+                try:
+                    f = handles[segment] = open(os.path.join(folder, segment), "rb")
+                except OSError:
+                    continue
+            f.seek(offset)
+            yield json.loads(f.read(length))
+    finally:
+        for f in handles.values():
+            f.close()
+
+
+def since_ts(spec):
+    """'7d', '12h', '30m' or an ISO date -> epoch seconds."""
+    m = re.fullmatch(r"(\d+)([dhm])", spec or "")
+    if m:
+        return time.time() - int(m.group(1)) * {"d": 86400, "h": 3600, "m": 60}[m.group(2)]
+    return datetime.fromisoformat(spec).timestamp()
+
+
+def runs_with_token(path, token, since=None, limit=50):
+    db = open_index(path)
+    try:
+        rows = db.execute("SELECT r.segment, r.offset, r.length FROM tokens t JOIN runs r ON r.id = t.run "
+                          "WHERE t.token = ? AND r.ts >= ? ORDER BY r.ts DESC LIMIT ?",
+                          (token.lower(), since or 0, limit)).fetchall()
+    finally:
+        db.close()
+    return list(read_runs(path, rows))
+
+
+def changes_by_category(path, since=None, per="day"):
+    db = open_index(path)
+    fmt = {"day": "%Y-%m-%d", "hour": "%Y-%m-%d %H:00", "week": "%Y-W%W"}[per]
+    try:
+        return db.execute(f"SELECT strftime('{fmt}', ts, 'unixepoch', 'localtime') AS bucket, category, SUM(n) "
+                          "FROM changes WHERE ts >= ? GROUP BY bucket, category ORDER BY bucket, category",
+                          (since or 0,)).fetchall()
+    finally:
+        db.close()
+
+
+def main(argv=None, path="clarity_log.jsonl"):
+    parser = argparse.ArgumentParser(prog="clarity-coach log", description="Query the run log.")
+    parser.add_argument("--file", default=path, help="Run log to query.")
+    parser.add_argument("--token", help="Runs whose text contains this word.")
+    parser.add_argument("--by-category", action="store_true", help="Change counts per category and time bucket.")
+    parser.add_argument("--per", choices=["hour", "day", "week"], default="day", help="Time bucket for --by-category.")
+    parser.add_argument("--since", help="Only runs after this: 7d, 12h, 30m or an ISO date.")
+    parser.add_argument("--limit", type=int, default=50, help="Most runs to print for --token.")
+    parser.add_argument("--json", action="store_true", help="Print full records as JSON lines.")
+    args = parser.parse_args(argv)
+
+    since = since_ts(args.since) if args.since else None
+    if args.by_category:
+        for bucket, category, n in changes_by_category(args.file, since, args.per):
+            print(f"{bucket}  {category:<12} {n}")
+    elif args.token:
+        for rec in runs_with_token(args.file, args.token, since, args.limit):
+            if args.json:
+                print(json.dumps(rec, ensure_ascii=False))
+            else:
+                when = datetime.fromtimestamp(rec["ts"]).isoformat(timespec="seconds")
+                print(f"{when}  {rec.get('source') or '-'}  {rec['stats']['num_changes']} changes  "
+                      f"{rec['polished'][:80]}")
+    else:
+        parser.print_help()
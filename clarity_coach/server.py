@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""Long-running HTTP/JSON front end for analyze_text.
+
+Starting the CLI for every call pays for loading spaCy and the vocabulary
+before a few sentences are analyzed.  ``clarity-coach serve`` loads them once
+and keeps them warm.  Requests are queued and a single batcher thread
+collects whatever arrives within ``BATCH_WAIT_MS`` (up to ``BATCH_TEXTS``
+texts) into one ``analyze_texts`` call, so concurrent requests share one
+``nlp.pipe`` batch.  At most ``MAX_IN_FLIGHT`` texts may be waiting or
+running; past that, requests get 503 with a Retry-After header instead of
+piling up, and a single request with more texts than that gets 413.  When a
+batch fails, each request in it is analyzed again on its own, so only the
+request that caused the failure gets an error.
+
+    clarity-coach serve --port 8750
+    curl -s localhost:8750/analyze -d '{"text": "teh microservices r gr8"}'
+
+Endpoints: ``POST /analyze`` with ``{"text": ...}`` or ``{"texts": [...]}``,
+``GET /metrics`` (throughput, latency percentiles, batch sizes, queue depth,
+cache counters) and ``GET /health``.
+"""
+
+import json, time, queue, logging, argparse, threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import clarity_coach as cc
+from clarity_coach.bench import percentile
+
+HOST = "127.0.0.1"
+PORT = 8750
+BATCH_TEXTS = 64        # texts per analyze_texts call
+BATCH_WAIT_MS = 10      # how long the first request of a batch waits for company
+MAX_IN_FLIGHT = 1024    # texts queued or being analyzed before requests are refused
+MAX_BODY = 5 * 2**20    # bytes per request
+REQUEST_TIMEOUT = 120   # seconds a request waits for its results
+WINDOW = 1000           # recent requests kept for latency percentiles
+RATE_WINDOW = 60        # seconds of history for the recent throughput figure
+
+
+class Busy(Exception):
+    pass
+
+
+class TooLarge(Exception):
+    pass
+
+
+class Batcher:
+    """Queue of (texts, future) jobs drained by one thread, so the pipeline,
+    caches and counters are only ever used from that thread."""
+
+    def __init__(self, batch_texts=BATCH_TEXTS, wait_ms=BATCH_WAIT_MS, max_in_flight=MAX_IN_FLIGHT):
+        self.batch_texts = batch_texts
+        self.wait = wait_ms / 1000
+        self.max_in_flight = max_in_flight
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.started = time.time()
+        self.requests = self.texts = self.rejected = self.errors = self.batches = 0
+        self._latencies = deque(maxlen=WINDOW)   # ms per request, enqueue to result
+        self._done = deque()                     # (finish time, texts) within RATE_WINDOW
+        self._thread = threading.Thread(target=self._run, name="clarity-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        if len(texts) > self.max_in_flight:
+            raise TooLarge()  # would never fit, however long the client retries
+        with self._lock:
+            if self.in_flight + len(texts) > self.max_in_flight:
+                self.rejected += 1
+                raise Busy()
+            self.in_flight += len(texts)
+        future = Future()
+        self._jobs.put((texts, future, time.perf_counter()))
+        return future
+
+    def stop(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            jobs, n = [job], len(job[0])
+            deadline = time.monotonic() + self.wait
+            while n < self.batch_texts:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self._jobs.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._jobs.put(None)  # finish this batch, then stop
+                    break
+                jobs.append(job)
+                n += len(job[0])
+            self._process(jobs)
+
+    def _process(self, jobs):
+        texts = [t for job in jobs for t in job[0]]
+        try:
+            results, pos, outcomes = cc.analyze_texts(texts), 0, []
+            for job_texts, _, _ in jobs:
+                outcomes.append(results[pos:pos + len(job_texts)])
+                pos += len(job_texts)
+        except Exception as e:
+            logging.error(f"Serve batch of {len(texts)} failed: {e}")
+            # one bad request must not fail the others batched with it
+            outcomes = [self._alone(job[0]) for job in jobs] if len(jobs) > 1 else [e]
+        now = time.perf_counter()
+        with self._lock:
+            self.in_flight -= len(texts)
+            self.batches += 1
+            self.requests += len(jobs)
+            self.texts += len(texts)
+            self.errors += sum(isinstance(out, Exception) for out in outcomes)
+            self._done.append((time.time(), len(texts)))
+            for _, _, queued in jobs:
+                self._latencies.append((now - queued) * 1000)
+        for (_, future, _), out in zip(jobs, outcomes):
+            if isinstance(out, Exception):
+                future.set_exception(RuntimeError(f"analysis failed: {out}"))
+            else:
+                future.set_result(out)
+
+    @staticmethod
+    def _alone(texts):
+        # results for one request, or the exception analyzing it raised
+        try:
+            return cc.analyze_texts(texts)
+        except Exception as e:
+            logging.error(f"Serve request of {len(texts)} texts failed: {e}")
+            return e
+
+    def metrics(self):
+        with self._lock:
+            now = time.time()
+            while self._done and now - self._done[0][0] > RATE_WINDOW:
+                self._done.popleft()
+            uptime = now - self.started
+            lat = list(self._latencies)
+            recent = sum(n for _, n in self._done)
+            return {"uptime_s": round(uptime, 1), "requests": self.requests, "texts": self.texts,
+                    "batches": self.batches, "rejected": self.rejected, "errors": self.errors,
+                    "in_flight": self.in_flight, "max_in_flight": self.max_in_flight,
+                    "mean_batch_texts": round(self.texts / self.batches, 2) if self.batches else 0.0,
+                    "texts_per_sec": round(self.texts / uptime, 2) if uptime else 0.0,
+                    "recent_texts_per_sec": round(recent / min(uptime, RATE_WINDOW), 2) if uptime else 0.0,
+                    "latency_ms": {f"p{q}": round(percentile(lat, q), 3) for q in (50, 90, 99)} if lat else {},
+                    "cache": cc.cache_stats()}
+
+
+class Handler(BaseHTTPRequestHandler):
+    batcher = None  # set by serve()
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, {"ok": True})
+        elif self.path == "/metrics":
+            self._send(200, self.batcher.metrics())
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/analyze":
+            return self._send(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self._send(400, {"error": "bad Content-Length"})
+        if length > MAX_BODY:
+            return self._send(413, {"error": f"body over {MAX_BODY} bytes"})
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            single = "texts" not in body
+            texts = [body["text"]] if single else body["texts"]
+            if not isinstance(texts, list) or not texts or not all(isinstance(t, str) for t in texts):
+                raise ValueError
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return self._send(400, {"error": 'expected {"text": str} or {"texts": [str, ...]}'})
+        try:
+            results = self.batcher.submit(texts).result(timeout=REQUEST_TIMEOUT)
+        except TooLarge:
+            return self._send(413, {"error": f"more than {self.batcher.max_in_flight} texts in one request"})
+        except Busy:
+            return self._send(503, {"error": "busy, retry later"}, {"Retry-After": "1"})
+        except Exception as e:
+            return self._send(500, {"error": str(e)})
+        out = [cc.to_json(res) for res in results]
+        self._send(200, {**(out[0] if single else {"results": out}), "change_fields": cc.CHANGE_FIELDS})
+
+    def _send(self, status, payload, headers=None):
+        blob = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(blob)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(blob)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would cost more than a short analysis; see /metrics
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # listen backlog; the default of 5 resets bursts of clients
+
+
+def serve(host=HOST, port=PORT, batch_texts=BATCH_TEXTS, wait_ms=BATCH_WAIT_MS, max_in_flight=MAX_IN_FLIGHT):
+    # warm up so the first request doesn't pay for loading the model and vocabulary
+    cc.load_nlp()
+    cc.spell_index()
+    Handler.batcher = batcher = Batcher(batch_texts, wait_ms, max_in_flight)
+    httpd = Server((host, port), Handler)
+    print(f"Clarity Coach serving on http://{host}:{httpd.server_port} (Ctrl+C to stop)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        batcher.stop()
+        cc.token_memo().flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="clarity-coach serve", description="Serve analyze_text over HTTP/JSON.")
+    parser.add_argument("--host", default=HOST, help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=PORT, help="Port to listen on (0 picks a free one).")
+    parser.add_argument("--batch-texts", type=int, default=BATCH_TEXTS, help="Most texts analyzed in one batch.")
+    parser.add_argument("--batch-wait-ms", type=float, default=BATCH_WAIT_MS, help="How long a batch waits to fill up.")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="Texts queued before requests get 503 (larger requests get 413).")
+    parser.add_argument("--sentencizer", choices=["parser", "senter", "rule"], help="Sentence segmentation mode.")
+    parser.add_argument("--cache-dir", help="Keep analysis results on disk here and reuse them across runs.")
+    parser.add_argument("--cache-size", type=int, help="Analysis results kept in memory (0 disables).")
+    parser.add_argument("--token-memo", help="SQLite file memoizing spelling corrections across runs.")
+    args = parser.parse_args(argv)
+
+    if args.sentencizer: cc.SENTENCE_MODE = args.sentencizer
+    if args.cache_dir: cc.CACHE_DIR = args.cache_dir
+    if args.cache_size is not None: cc.CACHE_SIZE = args.cache_size
+    if args.token_memo: cc.TOKEN_MEMO_FILE = args.token_memo
+    cc.setup_logging()
+    serve(args.host, args.port, args.batch_texts, args.batch_wait_ms, args.max_in_flight)
+
+
+if __name__ == "__main__":
+    main()
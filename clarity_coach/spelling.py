@@ -0,0 +1,531 @@
+# -*- coding: utf-8 -*-
+"""Indexed fuzzy spelling lookup.
+
+``process.extractOne(word, VALID_WORDS)`` scores a token against every word in
+the vocabulary with ``fuzz.WRatio``.  ``SpellIndex`` only scores the words that
+can possibly reach ``min_score`` and returns the same best match and score.
+
+Which words can reach the threshold follows from how WRatio scores a single
+token against a choice:
+
+* similar lengths: ``ratio``/``token_sort_ratio`` need a long common
+  subsequence, found through a symmetric-delete index with a deletion budget
+  derived from the threshold; ``token_set_ratio`` needs the token to be one of
+  the choice's tokens, found through the same index;
+* lengths 1.5x to 8x apart: partial scores only reach 86+ when the shorter
+  string sits inside the longer one, or when the comparison window is clipped
+  by the end of the longer string and misses a single character;
+* tokens that process to several words ("end-to-end", "e.g.", URLs) also
+  reach 86+ against words sharing one of their parts (token_set_ratio), or
+  when their sorted parts are close to, contain or sit inside the sorted parts
+  of a choice (token_sort_ratio and the partial variants).  The few choices
+  with several words are indexed by their sorted parts on the first such
+  query.
+
+Ties that extractOne breaks by set iteration order are broken by frequency
+rank here, so the more common word wins.
+
+Building the index takes seconds, so it can be saved once to a versioned
+binary file (``python -m clarity_coach.spelling``) and memory-mapped at
+startup; worker processes then share the same pages instead of each holding
+a private copy of the vocabulary and index.
+"""
+
+import os, mmap, struct, logging, argparse, zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from math import ceil, comb
+
+from fuzzywuzzy import fuzz, utils
+
+# Past this length the shorter side of a partial comparison can reach
+# partial_ratio >= 95 without an exact or clipped match, so for tokens that
+# could end up there every word of a length that pairs up with them is scored.
+MAX_INDEXED_LEN = 18
+
+# Rough cost of bounding one word by its characters, in index probes (a probe
+# is a delete variant plus its postings lookup): a ratio neighbourhood is
+# filtered word by word instead of probed when that is cheaper.
+BOUND_COST = 0.25
+
+VOCAB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vocab.bin")
+VOCAB_SIZE = 50000
+
+# File layout: header, then 8-byte aligned sections listed in _SECTIONS.
+# Bump FORMAT_VERSION whenever the layout or the index construction changes.
+MAGIC = b"CCVOCAB\0"
+FORMAT_VERSION = 1
+_SECTIONS = (
+    ("words", "B"), ("word_offs", "I"), ("forms", "B"), ("form_offs", "I"), ("word_keys", "Q"),
+    ("order", "I"), ("blob", "B"), ("starts", "I"), ("by_len", "I"), ("keys", "Q"),
+)
+_HEADER = struct.Struct("<8sII" + "QQ" * len(_SECTIONS))
+
+
+def _key(s):
+    return zlib.crc32(s.encode("utf-8"))
+
+
+def _deletes(s, depth, least=0):
+    # every string left after deleting least..depth characters of s
+    out = {s} if least == 0 else set()
+    frontier = {s}
+    for d in range(1, depth + 1):
+        frontier = {v[:i] + v[i + 1:] for v in frontier for i in range(len(v))}
+        if d >= least:
+            out |= frontier
+    return out
+
+
+def _chars(s):
+    # the characters of s as bits, shared by a few characters each
+    mask = 0
+    for ch in s:
+        mask |= 1 << (ord(ch) % 63)
+    return mask
+
+
+def _pack_strings(strings):
+    blob, offs = bytearray(), array("I", [0])
+    for s in strings:
+        blob += s.encode("utf-8")
+        offs.append(len(blob))
+    return bytes(blob), offs
+
+
+class _StringTable:
+    """Read-only list of strings stored as one utf-8 blob plus offsets."""
+
+    def __init__(self, blob, offs):
+        self._blob, self._offs = blob, offs
+
+    def __len__(self):
+        return len(self._offs) - 1
+
+    def __getitem__(self, i):
+        return bytes(self._blob[self._offs[i]:self._offs[i + 1]]).decode("utf-8")
+
+    def size(self, i):
+        # in bytes, which is the length for the ASCII-only forms
+        return self._offs[i + 1] - self._offs[i]
+
+
+def process_token(token):
+    # extractOne runs full_process on the query, then again with force_ascii
+    return utils.full_process(utils.full_process(token), force_ascii=True)
+
+
+def process_choice(word):
+    return utils.full_process(word, force_ascii=True)
+
+
+class SpellIndex:
+    """Candidate-generation index over a ranked word list (most frequent first).
+
+    ``lookup(token)`` returns ``(word, score)`` for the best ``fuzz.WRatio``
+    match scoring at least ``min_score``, or ``(None, 0)``.
+    """
+
+    def __init__(self, words, min_score=86):
+        if min_score < 86:
+            raise ValueError("SpellIndex needs min_score >= 86")
+        self.words = list(words)
+        self.min_score = self.built_score = min_score
+        self.forms = [process_choice(w) for w in self.words]
+        self._t = (min_score - 0.5) / 100 - 1e-9
+        self._word_keys = array("Q", sorted((_key(w) << 32) | wid for wid, w in enumerate(self.words)))
+
+        # forms grouped by length (rank order inside a group) so substring
+        # searches only scan the lengths WRatio would treat as partial matches
+        order = sorted((wid for wid, f in enumerate(self.forms) if f), key=lambda wid: len(self.forms[wid]))
+        blob, starts, by_len = bytearray(b"\n"), array("I"), array("I")
+        for i, wid in enumerate(order):
+            while len(by_len) <= len(self.forms[wid]):
+                by_len.append(i)
+            starts.append(len(blob))
+            blob += self.forms[wid].encode("utf-8") + b"\n"
+        by_len.append(len(order))
+        starts.append(len(blob))
+        self._order = array("I", order)
+        self._blob = bytes(blob)
+        self._blob_base = 0
+        self._starts = starts
+        self._by_len = by_len
+        self._multi = None
+
+        keys = []
+        for wid, form in enumerate(self.forms):
+            if form:
+                keys.extend((_key(v) << 32) | wid for v in self._variants(form))
+        keys.sort()
+        self._keys = array("Q", keys)
+
+    # ----- prebuilt file -----
+    def save(self, path):
+        words, word_offs = _pack_strings(self.words)
+        forms, form_offs = _pack_strings(self.forms)
+        data = {"words": words, "word_offs": word_offs, "forms": forms, "form_offs": form_offs,
+                "word_keys": self._word_keys, "order": self._order, "blob": self._blob,
+                "starts": self._starts, "by_len": self._by_len, "keys": self._keys}
+        layout, pos = [], _HEADER.size
+        for name, _ in _SECTIONS:
+            pos += -pos % 8
+            size = len(data[name]) * (data[name].itemsize if isinstance(data[name], array) else 1)
+            layout += [pos, size]
+            pos += size
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, self.built_score, *layout))
+            for i, (name, _) in enumerate(_SECTIONS):
+                f.write(b"\0" * (layout[2 * i] - f.tell()))
+                f.write(data[name])
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, min_score=86):
+        """Memory-map a file written by save(); raises ValueError if it is unusable."""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) < _HEADER.size:
+            raise ValueError("truncated vocabulary file")
+        magic, version, built_score, *layout = _HEADER.unpack_from(mm)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"unsupported vocabulary file (version {version}, need {FORMAT_VERSION})")
+        if min_score < built_score:
+            raise ValueError(f"vocabulary file was built for min_score >= {built_score}")
+        if layout[-2] + layout[-1] > len(mm):
+            raise ValueError("truncated vocabulary file")
+        mv = memoryview(mm)
+        sec = {}
+        for i, (name, fmt) in enumerate(_SECTIONS):
+            start, size = layout[2 * i], layout[2 * i + 1]
+            sec[name] = mv[start:start + size].cast(fmt)
+
+        self = cls.__new__(cls)
+        self._mmap = mm
+        self.min_score, self.built_score = min_score, built_score
+        self._t = (min_score - 0.5) / 100 - 1e-9
+        self.words = _StringTable(sec["words"], sec["word_offs"])
+        self.forms = _StringTable(sec["forms"], sec["form_offs"])
+        self._word_keys = sec["word_keys"]
+        self._order, self._starts, self._by_len, self._keys = sec["order"], sec["starts"], sec["by_len"], sec["keys"]
+        # substring searches run on the map itself, offset to the blob section
+        self._blob, self._blob_base = mm, layout[2 * [n for n, _ in _SECTIONS].index("blob")]
+        self._multi = None
+        return self
+
+    # ----- index construction -----
+    def _budget(self, length, t=None):
+        # max deletions on one side for an LCS ratio of at least t
+        t = self._t if t is None else t
+        return int(length * (2 - 2 * t) / (2 - t))
+
+    def _variants(self, form):
+        out = _deletes(form, self._budget(len(form)))
+        if " " in form:
+            tokens = form.split()
+            sorted_form = " ".join(sorted(tokens))
+            out |= _deletes(sorted_form, self._budget(len(sorted_form)))
+            out.update(tokens)
+        return out
+
+    # ----- lookup -----
+    def _postings(self, variant, keys=None):
+        keys = self._keys if keys is None else keys
+        k = _key(variant) << 32
+        lo = bisect_left(keys, k)
+        hi = bisect_left(keys, k + (1 << 32), lo)
+        return [v & 0xFFFFFFFF for v in keys[lo:hi]]
+
+    def _length(self, wid):
+        # of a form, without decoding it from the map
+        forms = self.forms
+        return forms.size(wid) if isinstance(forms, _StringTable) else len(forms[wid])
+
+    def __contains__(self, word):
+        return any(self.words[wid] == word for wid in self._postings(word, self._word_keys))
+
+    def __len__(self):
+        return len(self.words)
+
+    def _containing(self, needle, n, first_only):
+        # word ids whose form contains needle (at the end when needle ends in
+        # "\n") and is 1.5x to 8x as long as the token
+        blob, base, starts, by_len = self._blob, self._blob_base, self._starts, self._by_len
+        found = []
+        for m in range(-(-3 * n // 2), min(8 * n, len(by_len) - 2) + 1):
+            a, b = by_len[m], by_len[m + 1]
+            end = base + starts[b]
+            pos = blob.find(needle, base + starts[a], end)
+            while pos != -1:
+                found.append(self._order[bisect_right(starts, pos - base, a, b) - 1])
+                if first_only:
+                    break
+                pos = blob.find(needle, pos + 1, end)
+        if first_only and found:
+            return [min(found)]
+        return found
+
+    def _exact(self, form):
+        # word ids whose form is exactly form
+        n = len(form)
+        if not 0 < n < len(self._by_len) - 1:
+            return []
+        blob, base, starts, a, b = self._blob, self._blob_base, self._starts, self._by_len[n], self._by_len[n + 1]
+        needle, end, found = b"\n" + form.encode("utf-8") + b"\n", base + starts[b], []
+        pos = blob.find(needle, base + starts[a] - 1, end)
+        while pos != -1:
+            found.append(self._order[bisect_right(starts, pos + 1 - base, a, b) - 1])
+            pos = blob.find(needle, pos + 1, end)
+        return found
+
+    def _clipped_window_ok(self, length):
+        # partial_ratio of a string against its own copy with one character
+        # missing, which is what a window clipped by the string end scores
+        pr = utils.intr(100 * 2 * (length - 1) / (2 * length - 1))
+        return utils.intr(pr * 0.9) >= self.min_score
+
+    def _band(self, lo, hi):
+        # word ids whose form is lo to hi characters long
+        lo, hi = max(lo, 1), min(hi, len(self._by_len) - 2)
+        if lo > hi:
+            return set()
+        return set(self._order[self._by_len[lo]:self._by_len[hi + 1]])
+
+    def _band_size(self, lo, hi):
+        lo, hi = max(lo, 1), min(hi, len(self._by_len) - 2)
+        return self._by_len[hi + 1] - self._by_len[lo] if lo <= hi else 0
+
+    def _near(self, s, t=None, which=0):
+        """Word ids whose form (which=0), sorted form (1) or sorted unique form
+        (2) can reach ratio t with s.  The delete neighbourhood of a long s is
+        huge, so the length band is scored instead when that is cheaper."""
+        t = self._t if t is None else t
+        n, longest = len(s), len(self._by_len) - 2
+        lo, hi = ceil(n * t / (2 - t)), int(n * (2 - t) / t)
+        budget, ids = self._budget(n, t), set()
+        if " " in s:
+            # a word without spaces only matches once every space is deleted;
+            # words with spaces are few enough to bound one by one
+            budget -= s.count(" ")
+            ids = self._near_multi(s, t, lo, hi, which)
+        bare = s.replace(" ", "")
+        least = max(0, len(bare) - longest)  # no index key is longer than the longest form
+        if least > budget or lo > longest:
+            return ids
+        probes = sum(comb(len(bare), d) for d in range(least, budget + 1))
+        if BOUND_COST * self._band_size(lo, hi) < probes:
+            return ids | self._bound(s, bare, t, self._band(lo, hi))
+        for v in _deletes(bare, budget, least):
+            ids.update(self._postings(v))
+        return ids
+
+    def _bound(self, s, bare, t, band):
+        # the words of band whose characters leave room for ratio t with s;
+        # a form without spaces shares at most the characters of bare
+        n, mask, chars, ids = len(s), _chars(bare), None, set()
+        for wid in band:
+            form = self.forms[wid]
+            m, row_mask = len(form), _chars(form)
+            need = t * (n + m) / 2
+            if min(m - (row_mask & ~mask).bit_count(), len(bare) - (mask & ~row_mask).bit_count()) < need:
+                continue
+            chars = chars or Counter(bare)
+            if sum((chars & Counter(form)).values()) >= need:
+                ids.add(wid)
+        return ids
+
+    def _near_multi(self, s, t, lo, hi, which):
+        # words with spaces whose string can have ratio t with s, going by
+        # length and then by the characters they share (a cheap bound first)
+        n, mask, chars, ids = len(s), _chars(s), None, set()
+        lengths, strings = self._multi_forms()[3][which]
+        for m, wid, row_mask, row_chars in strings[bisect_left(lengths, lo):bisect_right(lengths, hi)]:
+            need = t * (n + m) / 2
+            if min(m - (row_mask & ~mask).bit_count(), n - (mask & ~row_mask).bit_count()) < need:
+                continue
+            chars = chars or Counter(s)
+            if sum((chars & row_chars).values()) >= need:
+                ids.add(wid)
+        return ids
+
+    def candidates(self, q):
+        n = len(q)
+        ids = self._near(q)
+        if " " in q:
+            ids |= self._multi_word(q)
+
+        if self.min_score > 90:
+            return ids  # partial scores are capped at 90
+
+        # token inside a longer word: every such word scores exactly 90, so
+        # the first one in rank order is the best of them
+        ids.update(self._containing(q.encode("utf-8"), n, first_only=True))
+        if self._clipped_window_ok(n):
+            for v in _deletes(q, 1) - {q}:
+                ids.update(self._containing((v + "\n").encode("utf-8"), n, first_only=False))
+
+        # shorter word inside the token
+        for size in range(max(1, -(-n // 8)), 2 * n // 3 + 1):
+            for i in range(n - size + 1):
+                sub = q[i:i + size]
+                ids.update(self._exact(sub))
+        for size in range(1, 2 * n // 3):
+            if self._clipped_window_ok(size + 1):
+                ids.update(wid for wid in self._postings(q[-size:]) if self._length(wid) == size + 1)
+
+        # past MAX_INDEXED_LEN on the shorter side a partial match need not be
+        # exact, so every word of a length that could pair up is scored
+        if n > MAX_INDEXED_LEN:
+            ids |= self._band(-(-3 * n // 2), 8 * n)
+        if 2 * n >= 3 * (MAX_INDEXED_LEN + 1):
+            ids |= self._band(MAX_INDEXED_LEN + 1, 2 * n // 3)
+        return ids
+
+    def _multi_forms(self):
+        # forms with a space (a few percent), keyed by their parts and by their
+        # sorted (unique) parts, and listed by length; built on the first
+        # multi-word query
+        if self._multi is None:
+            by_part, by_sorted, by_set, rows = {}, {}, {}, []
+            for wid in range(len(self.forms)):
+                form = self.forms[wid]
+                if " " not in form:
+                    continue
+                parts = form.split()
+                sorted_form, set_form = " ".join(sorted(parts)), " ".join(sorted(set(parts)))
+                row = (len(form), wid, frozenset(parts), len(set_form), _chars(form))
+                for part in set(parts):
+                    by_part.setdefault(part, []).append(row)
+                by_sorted.setdefault(sorted_form, []).append(wid)
+                by_set.setdefault(set_form, []).append(wid)
+                rows.append((wid, form, sorted_form, set_form))
+            # by_part rows sorted by length, so a query only bounds the ones
+            # close to its own length
+            by_part = {part: ([r[0] for r in sorted(rs)], sorted(rs)) for part, rs in by_part.items()}
+            by_len = []
+            for which in (1, 2, 3):
+                strings = sorted((len(row[which]), row[0], _chars(row[which]), Counter(row[which])) for row in rows)
+                by_len.append(([m for m, *_ in strings], strings))
+            self._multi = (by_part, by_sorted, by_set, by_len, rows)
+        return self._multi
+
+    def _multi_word(self, q):
+        """Candidates a query of several words adds to those of q as one string."""
+        by_part, by_sorted, by_set, _, rows = self._multi_forms()
+        n, parts = len(q), q.split()
+        sorted_q, set_q = " ".join(sorted(parts)), " ".join(sorted(set(parts)))
+        # token_sort/token_set_ratio are weighted 0.95: the unweighted ratio must round to 90+
+        t = ((self.min_score - 0.5) / 0.95 - 0.5) / 100 - 1e-9
+        ids = self._near(sorted_q, t, which=1) | self._near(set_q, t, which=2)
+        # sharing a part. Lengths 1.5x to 8x apart: partial_token_set_ratio is
+        # 100, which WRatio weighs to 86 whatever the rest, so only the first
+        # such word in rank order can win on it (a higher partial score means
+        # q sits in the word, which candidates() finds).  Similar lengths:
+        # token_set_ratio only gets there when the unshared parts are short
+        # or alike, which the characters they share bound cheaply.
+        q_parts = set(parts)
+        reach = (q_parts, len(" ".join(q_parts)), _chars(q), t)
+        near_lo, near_hi = 2 * n // 3 + 1, -(-3 * n // 2) - 1  # under 1.5x apart
+        partial = []
+        for part in q_parts:
+            lengths, sharing = by_part.get(part, ([], []))
+            exact = [(len(part), wid, frozenset((part,)), len(part), _chars(part)) for wid in self._exact(part)]
+            a, b = bisect_left(lengths, near_lo), bisect_right(lengths, near_hi)
+            for _, wid, f_parts, f_len, f_mask in sharing[a:b] + [r for r in exact if near_lo <= r[0] <= near_hi]:
+                if self._set_reaches(f_parts, f_len, f_mask, *reach):
+                    ids.add(wid)
+            partial += [r[1] for r in sharing[bisect_left(lengths, -(-n // 8)):a] + sharing[b:bisect_right(lengths, 8 * n)]]
+            partial += [r[1] for r in exact if -(-n // 8) <= r[0] <= 8 * n and not near_lo <= r[0] <= near_hi]
+        if partial:
+            ids.add(min(partial))
+        if self.min_score > 90:
+            return ids
+
+        # partial_token_sort/_set only count when one sorted string holds the
+        # other outright; single words inside them are inside q already
+        for s, table in ((sorted_q, by_sorted), (set_q, by_set)):
+            for size in range(3, 2 * n // 3 + 1):
+                for i in range(len(s) - size + 1):
+                    ids.update(table.get(s[i:i + size], ()))
+        ids.update(wid for wid, form, sorted_form, set_form in rows
+                   if 3 * n <= 2 * len(form) <= 16 * n and (sorted_q in sorted_form or set_q in set_form))
+        if " " not in set_q:  # the same word repeated
+            ids.update(self._containing(set_q.encode("utf-8"), n, first_only=True))
+        return ids
+
+    @staticmethod
+    def _set_reaches(parts, f_len, f_mask, q_parts, q_len, q_mask, t):
+        # whether token_set_ratio(q, form) can reach t, given the form's set of
+        # parts, their joined length and its character bits: the shared parts
+        # against either side are an exact prefix of it, and the two sides
+        # against each other share at most their common characters (a cheap
+        # bound by character bits first)
+        shared = q_parts & parts
+        k = len(" ".join(shared))
+        if 2 * k >= t * (k + q_len) or 2 * k >= t * (k + f_len):
+            return True
+        need = t * (q_len + f_len) / 2
+        if min(q_len - (q_mask & ~f_mask).bit_count(), f_len - (f_mask & ~q_mask).bit_count()) < need:
+            return False
+        a = " ".join(sorted(shared) + sorted(q_parts - parts))
+        b = " ".join(sorted(shared) + sorted(parts - q_parts))
+        return sum((Counter(a) & Counter(b)).values()) >= need
+
+    def _best(self, q, ids):
+        # WRatio is capped by the length ratio (100 below 1.5x, 90 up to 8x,
+        # then 60), so words are scored best cap first and in rank order, and
+        # a group stops once nothing left in it can beat the best so far
+        n, groups = len(q), {100: [], 90: [], 60: []}
+        for wid in ids:
+            m = self._length(wid)
+            ratio = max(n, m) / min(n, m) if m else 0
+            groups[100 if ratio < 1.5 else 90 if ratio <= 8 else 60].append(wid)
+        best, best_score = None, 0
+        for cap in (100, 90, 60):
+            if cap < max(best_score, self.min_score):
+                break
+            for wid in sorted(groups[cap]):
+                if best_score == cap and wid > best:
+                    break
+                score = fuzz.WRatio(q, self.forms[wid], full_process=False)
+                if score > best_score or (score == best_score and best is not None and wid < best):
+                    best, best_score = wid, score
+        if best is None or best_score < self.min_score:
+            return None, 0
+        return self.words[best], best_score
+
+    def lookup(self, token):
+        q = process_token(token)
+        if not q:
+            return None, 0
+        return self._best(q, self.candidates(q))
+
+
+def open_vocab_file(path=VOCAB_FILE, min_score=86):
+    """Memory-map the prebuilt vocabulary at path, or return None if it is missing or unusable."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return SpellIndex.load(path, min_score=min_score)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring vocabulary file {path}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the prebuilt Clarity Coach vocabulary and spelling index.")
+    parser.add_argument("--out", default=VOCAB_FILE, help="Output file.")
+    parser.add_argument("--size", type=int, default=VOCAB_SIZE, help="Number of most frequent words to keep.")
+    parser.add_argument("--min-score", type=int, default=86, help="Lowest fuzzy score the index must serve.")
+    args = parser.parse_args()
+
+    from wordfreq import top_n_list
+    index = SpellIndex(top_n_list("en", args.size), min_score=args.min_score)
+    index.save(args.out)
+    print(f"Wrote {args.out} ({len(index)} words, {os.path.getsize(args.out) // 1024} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed output store (``--store``).
+
+Every run used to write a fresh set of timestamped reports and a zip, so
+re-running the same inputs filled ``clarity_outputs/`` with byte-identical
+copies and spent the export time again.  In store mode each artifact is named
+by a hash of the input text and everything that decides its content (the
+analysis fingerprint and the format): ``<store>/<k[:2]>/<k>.<ext>``.  An
+artifact that already exists is reused, not rendered again.  New ones are
+rendered into a temp directory inside the store and moved into place, so a
+half-written file never carries a key, and two processes racing on one key
+both end up with a complete file.
+
+``index.sqlite`` in the store maps runs to artifacts:
+``artifacts(key, path, format, bytes, created)`` and
+``uses(run, ts, name, format, key, reused)``, one row per artifact a run
+produced or reused.
+"""
+
+import glob
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+
+class OutputStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS artifacts (key TEXT PRIMARY KEY, path TEXT, format TEXT, "
+                             "bytes INTEGER, created REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS uses (run TEXT, ts REAL, name TEXT, format TEXT, "
+                             "key TEXT, reused INTEGER)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS uses_run ON uses (run)")
+        self.reused = self.stored = 0
+
+    def find(self, key):
+        """Path of the artifact stored under key, or None."""
+        found = glob.glob(os.path.join(self.directory, key[:2], glob.escape(key) + ".*"))
+        return found[0] if found else None
+
+    def scratch(self):
+        # temp dir on the store's filesystem, so put() is a rename
+        return tempfile.mkdtemp(prefix="tmp-", dir=self.directory)
+
+    def put(self, key, path, fmt):
+        """Move the rendered file at path into the store under key; returns its new path."""
+        ext = os.path.splitext(path)[1]
+        dest = os.path.join(self.directory, key[:2], key + ext)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(path, dest)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?)",
+                             (key, os.path.relpath(dest, self.directory), fmt, os.path.getsize(dest), time.time()))
+        return dest
+
+    def record(self, run, name, fmt, key, reused):
+        with self._lock, self._db:
+            self._db.execute("INSERT INTO uses VALUES (?, ?, ?, ?, ?, ?)", (run, time.time(), name, fmt, key, int(reused)))
+            if reused:
+                self.reused += 1
+            else:
+                self.stored += 1
+
+    def artifacts(self, run):
+        """(name, format, path, reused) for every artifact of run."""
+        with self._lock:
+            rows = self._db.execute("SELECT u.name, u.format, a.path, u.reused FROM uses u "
+                                    "JOIN artifacts a ON a.key = u.key WHERE u.run = ? ORDER BY u.ts",
+                                    (run,)).fetchall()
+        return [(name, fmt, os.path.join(self.directory, path), bool(reused)) for name, fmt, path, reused in rows]
+
+    @staticmethod
+    def discard(scratch):
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    def close(self):
+        self._db.close()
@@ -1,5 +1,15 @@
 import streamlit as st
-from coach import analyze_text
+from coach import IncrementalAnalyzer, load_nlp, spell_index
+
+
+@st.cache_resource
+def get_analyzer():
+    # one per server process: the model, the vocabulary and the per-sentence
+    # results survive reruns, so an edit only re-analyzes what changed
+    load_nlp()
+    spell_index()
+    return IncrementalAnalyzer()
+
 
 st.set_page_config(page_title="🧠 Clarity Coach", layout="centered")
 
@@ -7,12 +17,13 @@ st.title("🧠 Clarity Coach")
 st.write("Paste your technical writing below. This tool will find jargon, grammar, and clarity issues — then offer a cleaner rewrite.")
 
 text = st.text_area("📄 Input Text", height=200)
+live = st.checkbox("Update as I type", value=False)
 
-if st.button("🔍 Analyze"):
+if st.button("🔍 Analyze") or (live and text.strip()):
     if not text.strip():
         st.warning("Please enter some text.")
     else:
-        results = analyze_text(text)
+        results = get_analyzer().analyze(text)
 
         # Display main results
         st.markdown("### ✨ Results")
@@ -25,9 +36,8 @@ if st.button("🔍 Analyze"):
         # Display detailed change list
         st.markdown("**🔧 Changes Made:**")
         if results["changes"]:
-            for i, change in enumerate(results["changes"]):
-                cat = results["categories"][i] if i < len(results["categories"]) else "unspecified"
-                st.markdown(f"- **[{cat}]** {change}")
+            for change in results["changes"]:
+                st.markdown(f"- **[{change.category}]** {change}")
         else:
             st.markdown("No changes were needed!")
 
@@ -1,18 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import difflib
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 from datetime import datetime
 import spacy
-from fuzzywuzzy import process
 from wordfreq import top_n_list
+from clarity_coach.spelling import SpellIndex, VOCAB_FILE, VOCAB_SIZE, open_vocab_file
+from clarity_coach.rules import Change, OffsetMap, RuleMatcher
+from clarity_coach.diff import diff_opcodes
 
 # -------------------------------------------------
 # Core settings
 # -------------------------------------------------
 NLP_MODEL = "en_core_web_sm"
 FUZZY_SCORE = 92
-VALID_WORDS = set(top_n_list("en", 50000))
+# Memory-mapped prebuilt vocabulary when available, else wordfreq
+_spell_index = open_vocab_file(VOCAB_FILE, min_score=FUZZY_SCORE)
+VALID_WORDS = _spell_index if _spell_index is not None else set(top_n_list("en", VOCAB_SIZE))
 
 # Whitelist to *never* auto-correct
 TECH_WHITELIST = {
@@ -67,20 +73,34 @@ GRAMMAR_FIXES = {
     r"\bfor all intensive purposes\b": "for all intents and purposes"
 }
 
+# grammar patterns and jargon terms compiled once into a single matcher
+RULES = RuleMatcher()
+RULES.add_patterns("grammar", GRAMMAR_FIXES, ignore_case=True)
+for _cat in dict.fromkeys(meta["category"] for meta in JARGON_DB.values()):
+    RULES.add_literals(_cat, {t: m["simpler"] for t, m in JARGON_DB.items() if m["category"] == _cat},
+                       ignore_case=True)
+JARGON_CATEGORIES = tuple(dict.fromkeys(meta["category"] for meta in JARGON_DB.values()))
+
+
+def apply_rules(text: str, categories):
+    # returns (new_text, changes); offsets index text
+    return RULES.apply(text, categories)
+
+
 def apply_simple_fixes(text: str):
-    changes, cats = [], []
-    for pattern, repl in GRAMMAR_FIXES.items():
-        def _sub(m):
-            changes.append(f"{m.group(0)} → {repl}")
-            cats.append("grammar")
-            return repl
-        text = re.sub(pattern, _sub, text, flags=re.IGNORECASE)
-    return text, changes, cats
+    return apply_rules(text, ("grammar",))
 
 
 CODE_LIKE_CHARS = set("{}[]()<>;:/\\'\"$#@_|~`^")
 
-nlp = spacy.load("en_core_web_sm")
+nlp = None  # loaded once per process by load_nlp(); app reruns reuse it
+
+
+def load_nlp():
+    global nlp
+    if nlp is None:
+        nlp = spacy.load("en_core_web_sm")
+    return nlp
 
 
 def looks_like_code_token(tok: str) -> bool:
@@ -89,25 +109,31 @@ def looks_like_code_token(tok: str) -> bool:
 def looks_like_domain_term(tok: str) -> bool:
     return "-" in tok or "." in tok or any(c.isupper() for c in tok if c.isalpha()) or len(tok) > 12
 
+def spell_index() -> SpellIndex:
+    global _spell_index
+    if _spell_index is None:
+        _spell_index = SpellIndex(top_n_list("en", VOCAB_SIZE), min_score=FUZZY_SCORE)
+    return _spell_index
+
 # -------------------------------------------------
 # Fix passes
 # -------------------------------------------------
 def correct_spelling(text: str):
-    changes, cats, out = [], [], []
+    # per-token pass; Change offsets index text
+    changes, out = [], []
 
-    for word in text.split():
+    for m in re.finditer(r"\S+", text):
+        word = m.group()
         w = word.lower()
 
         if w in SLANG_MAP:
             out.append(SLANG_MAP[w])
-            changes.append(f"{word} → {SLANG_MAP[w]}")
-            cats.append("slang")
+            changes.append(Change("slang", word, SLANG_MAP[w], m.start(), m.end(), w))
             continue
 
         if w in CONTRACTIONS:
             out.append(CONTRACTIONS[w])
-            changes.append(f"{word} → {CONTRACTIONS[w]}")
-            cats.append("contraction")
+            changes.append(Change("contraction", word, CONTRACTIONS[w], m.start(), m.end(), w))
             continue
 
         if (
@@ -119,75 +145,73 @@ def correct_spelling(text: str):
             out.append(word)
             continue
 
-        match, score = process.extractOne(w, VALID_WORDS)
-        if score and score >= FUZZY_SCORE and len(word) > 2:
+        match, score = spell_index().lookup(w)
+        if match and score >= FUZZY_SCORE and len(word) > 2:
             out.append(match)
-            changes.append(f"{word} → {match}")
-            cats.append("spelling")
+            changes.append(Change("spelling", word, match, m.start(), m.end(), f"fuzzy:{score}"))
         else:
             out.append(word)
 
-    return " ".join(out), changes, cats
+    return " ".join(out), changes
+
+
+def clean_sentence(sent):
+    s = " ".join([t.text for t in sent])
+    s = s.replace(" ,", ",").replace(" .", ".").strip()
+    if s:
+        s = s[0].upper() + s[1:]
+    return s
 
 
 def sentence_cleanup(text: str):
-    doc = nlp(text)
-    sents = []
-    for sent in doc.sents:
-        s = " ".join([t.text for t in sent])
-        s = s.replace(" ,", ",").replace(" .", ".").strip()
-        if s:
-            s = s[0].upper() + s[1:]
-        sents.append(s)
-    return " ".join(sents)
+    return " ".join(clean_sentence(sent) for sent in load_nlp()(text).sents)
 
 
 def smooth_grammar(text: str):
-    fixed = f" {text} "
-    changes, cats = [], []
-    for bad, good in GRAMMAR_FIXES.items():
-        if bad in fixed:
-            fixed = fixed.replace(bad, good)
-            changes.append(f"{bad.strip()} → {good.strip()}")
-            cats.append("grammar")
-    return fixed.strip(), changes, cats
+    return apply_rules(text, ("grammar",))
 
 
 def replace_jargon(text: str):
-    changes, cats = [], []
-    final = text
-    for term, meta in sorted(JARGON_DB.items(), key=lambda kv: -len(kv[0])):
-        if term in final.lower():
-            final = final.replace(term, meta["simpler"])
-            changes.append(f"{term} → {meta['simpler']}")
-            cats.append(meta["category"])
-    return final, changes, cats
+    # longest term wins where two overlap, as the old length-sorted loop did
+    return apply_rules(text, JARGON_CATEGORIES)
 
 
 def compute_simple_pairs(a: str, b: str):
-    sm = difflib.SequenceMatcher(None, a.split(), b.split())
-    return [(" ".join(a.split()[i1:i2]), " ".join(b.split()[j1:j2])) for _, i1, i2, j1, j2 in sm.get_opcodes()]
+    a_tok, b_tok = a.split(), b.split()
+    return [(" ".join(a_tok[i1:i2]), " ".join(b_tok[j1:j2])) for _, i1, i2, j1, j2 in diff_opcodes(a_tok, b_tok)]
 
 
 # -------------------------------------------------
 # Public API
 # -------------------------------------------------
 def analyze_text(text: str):
+    step1, ch0, ch1, offsets = local_passes(text)
+    return finish_analysis(text, sentence_cleanup(step1), ch0, ch1, offsets)
+
+
+def local_passes(text: str):
     # Step 1: Apply grammar and slang fixes *first*
-    step0, ch0, cat0 = apply_simple_fixes(text)
+    step0, ch0 = apply_simple_fixes(text)
 
     # Step 2: Then spelling and contractions
-    step1, ch1, cat1 = correct_spelling(step0)
+    step1, ch1 = correct_spelling(step0)
 
-    # Step 3: Sentence cleanup
-    step2 = sentence_cleanup(step1)
+    # Change offsets index the original text; offsets maps later passes' back to it
+    offsets = OffsetMap(text).add(text, ch0)
+    mapped = offsets.original(ch1, step0) if ch1 else ch1
+    offsets.add(step0, ch1)
+    return step1, ch0, mapped, offsets
 
-    # Step 4: Replace jargon
-    final, ch3, cat3 = replace_jargon(step2)
+
+def finish_analysis(text: str, step2, ch0, ch1, offsets):
+    # Step 4: Replace jargon (step2 is the text after step 3, sentence cleanup)
+    final, ch3 = replace_jargon(step2)
+    if ch3:
+        ch3 = offsets.original(ch3, step2)
 
     # Merge all change logs
     changes = ch0 + ch1 + ch3
-    cats = cat0 + cat1 + cat3
+    cats = [c.category for c in changes]
 
     # Stats
     stats = {
@@ -216,7 +240,108 @@ def analyze_text(text: str):
         "original": text,
         "polished": final,
         "changes": changes,
-        "categories": cats,
         "stats": stats,
         "diff_pairs": compute_simple_pairs(text, final),
     }
+
+
+# -------------------------------------------------
+# Incremental analysis (edit-as-you-type)
+# -------------------------------------------------
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text: str):
+    # (offset, sentence) pieces of text, cut at whitespace after . ! or ?
+    pieces, start = [], 0
+    for m in SENTENCE_SPLIT.finditer(text):
+        pieces.append((start, text[start:m.start()]))
+        start = m.end()
+    pieces.append((start, text[start:]))
+    return [(offset, s) for offset, s in pieces if s.strip()]
+
+
+class IncrementalAnalyzer:
+    """analyze_text for a document edited a little at a time.
+
+    The grammar and spelling passes work token by token, and no grammar
+    pattern or token spans whitespace after . ! or ?, so their results are
+    kept per sentence (an LRU of up to max_sentences) and a new version of the
+    text only runs them on sentences that changed.
+
+    Sentence cleanup needs the parser's sentence boundaries.  The analyzer
+    keeps the boundaries and cleaned sentences of the last text it saw and
+    re-parses only a window from one sentence before the changed pieces to
+    one sentence after them; sentences outside it are reused as they were.
+    With the rule sentencizer that is exactly analyze_text(text); with a
+    statistical parser a boundary can in principle depend on text further
+    away than the window.  What still looks at the whole text (the jargon
+    regex, joins, stats and the diff) runs in C or skips unchanged tokens.
+    """
+
+    def __init__(self, max_sentences: int = 5000):
+        self.max_sentences = max_sentences
+        self._done = OrderedDict()
+        self._lock = threading.Lock()
+        # step1 pieces and (start, end, cleaned) sentences of the last text
+        self._last = ([], [])
+        self.reused = self.analyzed = 0
+        self.parsed_chars = 0
+
+    def analyze(self, text: str):
+        step1, ch0, ch1, maps = [], [], [], []
+        for offset, sentence in split_sentences(text):
+            with self._lock:
+                res = self._done.get(sentence)
+                if res is not None:
+                    self._done.move_to_end(sentence)
+                    self.reused += 1
+            if res is None:
+                res = local_passes(sentence)
+                with self._lock:
+                    self._done[sentence] = res
+                    while len(self._done) > self.max_sentences:
+                        self._done.popitem(last=False)
+                    self.analyzed += 1
+            step1.append(res[0])
+            # offsets are into the sentence
+            ch0 += [Change(c.category, c.before, c.after, c.start + offset, c.end + offset, c.rule) for c in res[1]]
+            ch1 += [Change(c.category, c.before, c.after, c.start + offset, c.end + offset, c.rule) for c in res[2]]
+            maps.append(res[3])
+        return finish_analysis(text, self._cleanup(step1), ch0, ch1, OffsetMap.join(text, maps))
+
+    def _cleanup(self, pieces):
+        """sentence_cleanup(" ".join(pieces)), re-parsing only around what
+        changed since the last call."""
+        text = " ".join(pieces)
+        with self._lock:
+            old_pieces, old_sents = self._last
+        if pieces == old_pieces:
+            return " ".join(c for _, _, c in old_sents)
+
+        # unchanged pieces at both ends -> the changed span [head, old_len - tail]
+        n = min(len(pieces), len(old_pieces))
+        same = 0
+        while same < n and pieces[same] == old_pieces[same]:
+            same += 1
+        back = 0
+        while back < n - same and pieces[-1 - back] == old_pieces[-1 - back]:
+            back += 1
+        head = sum(len(p) + 1 for p in pieces[:same])
+        tail = sum(len(p) + 1 for p in pieces[len(pieces) - back:])
+        old_len = sum(len(p) + 1 for p in old_pieces) - 1
+        shift = len(text) - old_len
+
+        if old_sents and (same or back):
+            lo = max(bisect_left([e for _, e, _ in old_sents], head) - 1, 0)
+            hi = min(bisect_right([st for st, _, _ in old_sents], old_len - tail), len(old_sents) - 1)
+            start, end = old_sents[lo][0], old_sents[hi][1] + shift
+        else:
+            lo, hi, start, end = 0, len(old_sents) - 1, 0, len(text)
+        window = [(start + sent.start_char, start + sent.end_char, clean_sentence(sent))
+                  for sent in load_nlp()(text[start:end]).sents]
+        sents = old_sents[:lo] + window + [(st + shift, e + shift, c) for st, e, c in old_sents[hi + 1:]]
+        with self._lock:
+            self._last = (pieces, sents)
+            self.parsed_chars += end - start
+        return " ".join(c for _, _, c in sents)
@@ -7,11 +7,17 @@ setup(
     install_requires=[
         "spacy",
         "fuzzywuzzy",
+        "wordfreq",
         "python-docx",
         "pandas",
         "PyPDF2",
         "openpyxl",
-        "pypandoc"
+        "pypandoc",
+        "reportlab",
+        "colorama",
+        "google-api-python-client",
+        "google-auth-httplib2",
+        "google-auth-oauthlib",
     ],
     entry_points={
         "console_scripts": [
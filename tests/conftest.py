@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def cli(tmp_path):
+    """Run the CLI in a fresh process inside tmp_path (main() sets module
+    globals), offline and without a spaCy model."""
+    def run(*args):
+        env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        code = ("import sys, clarity_coach; sys.argv = ['clarity-coach'] + sys.argv[1:]; "
+                "sys.exit(clarity_coach.main())")
+        proc = subprocess.run([sys.executable, "-c", code, *args, "--no-email", "--no-gdoc", "--sentencizer", "rule"],
+                              cwd=tmp_path, env=env, capture_output=True, text=True, timeout=600)
+        assert proc.returncode == 0, proc.stderr
+        return proc.stdout
+    return run
@@ -0,0 +1,86 @@
+"""ResultCache and TokenMemo: values survive the disk round trip and a reopen."""
+
+import os
+import time
+
+import clarity_coach as cc
+from clarity_coach.cache import ResultCache, TokenMemo, fingerprint
+
+RESULT = {"original": "idk wanna go", "polished": "I don't know want to go",
+          "changes": [["slang", "idk", "I don't know", 0, 3, "idk"]], "stats": {"words_before": 3}}
+
+
+def test_fingerprint_is_stable_and_order_sensitive():
+    assert fingerprint({"b": 1, "a": 2}, 3) == fingerprint({"a": 2, "b": 1}, 3)
+    assert fingerprint(1, 2) != fingerprint(2, 1)
+
+
+def test_memory_round_trip_and_eviction():
+    cache = ResultCache(size=2)
+    for i in range(3):
+        cache.put(f"k{i}", {"i": i})
+    assert cache.get("k0") is None
+    assert cache.get("k2") == {"i": 2}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_hit_after_reopen(tmp_path):
+    key = ResultCache.key(RESULT["original"], "fp")
+    ResultCache(directory=str(tmp_path)).put(key, RESULT)
+    reopened = ResultCache(directory=str(tmp_path))
+    assert reopened.get(key) == RESULT
+    assert reopened.stats()["disk_hits"] == 1
+    assert reopened.get(ResultCache.key(RESULT["original"], "other fp")) is None
+
+
+def test_disk_entries_expire(tmp_path):
+    cache = ResultCache(size=0, directory=str(tmp_path), max_age=60)
+    cache.put("k", RESULT)
+    old = time.time() - 120
+    os.utime(cache._path("k"), (old, old))
+    assert cache.get("k") is None
+    assert not os.path.exists(cache._path("k"))
+
+
+def test_analysis_fingerprint_follows_table_reloads():
+    before = cc.analysis_fingerprint()
+    assert cc.analysis_fingerprint() == before
+    cc.JARGON_DB["synergy"] = {"simpler": "teamwork", "category": "jargon"}
+    try:
+        cc.load_rules()
+        assert cc.analysis_fingerprint() != before
+        assert cc.RULES.apply("synergy")[0] == "teamwork"
+    finally:
+        del cc.JARGON_DB["synergy"]
+        cc.load_rules()
+    assert cc.analysis_fingerprint() == before
+
+
+def test_token_memo_hit_after_reopen(tmp_path):
+    path = str(tmp_path / "memo.sqlite")
+    memo = TokenMemo("fp", path=path)
+    memo.put("recieve", ("receive", 86, "spelling"))
+    memo.put("kubernetes", (None, 0, None))
+    memo.close()
+    reopened = TokenMemo("fp", path=path)
+    assert reopened.get("recieve") == ("receive", 86, "spelling")
+    assert reopened.get("kubernetes") == (None, 0, None)
+    assert reopened.get("teh") is None
+    assert reopened.stats()["hits"] == 2
+
+
+def test_token_memo_drops_rows_of_another_fingerprint(tmp_path):
+    path = str(tmp_path / "memo.sqlite")
+    memo = TokenMemo("old", path=path)
+    memo.put("recieve", ("receive", 86, "spelling"))
+    memo.close()
+    assert TokenMemo("new", path=path).get("recieve") is None
+    assert TokenMemo("old", path=path).get("recieve") is None
+
+
+def test_token_memo_memory_bound():
+    memo = TokenMemo("fp", size=2)
+    for token in ("a", "b", "c"):
+        memo.put(token, (token, 100, None))
+    assert memo.get("a") is None
+    assert memo.get("c") == ("c", 100, None)
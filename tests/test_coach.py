@@ -0,0 +1,57 @@
+"""The Streamlit front end's IncrementalAnalyzer gives analyze_text's result
+while re-parsing only around each edit."""
+
+import os
+import sys
+
+import pytest
+
+spacy = pytest.importorskip("spacy")
+pytest.importorskip("wordfreq")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "projects", "clarity-coach"))
+import coach  # noqa: E402
+
+DOC = ("idk teh microservices r gonna fail. we wanna ship the orchestration btw! "
+       "Is it there fault? i seen the kubernetes pods restart. e.g. this one rly. "
+       "The distributed tracing is gonna help u. Thx for the synergy.")
+
+EDITS = [
+    DOC,
+    DOC.replace("gonna fail.", "gonna fail tmrw."),  # inside the first sentence
+    DOC.replace("btw! ", "btw! Wait. "),  # a new sentence in the middle
+    DOC.replace("Is it there fault? ", ""),  # a sentence removed
+    DOC + " Last one, ok.",  # appended
+    "Now " + DOC,  # prepended
+    DOC.replace("rly. The", "rly the"),  # two sentences merged
+    "",
+    DOC,
+]
+
+
+@pytest.fixture
+def rule_nlp(monkeypatch):
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    monkeypatch.setattr(coach, "nlp", nlp)
+
+
+def summary(res):
+    return (res["polished"], res["stats"], res["diff_pairs"],
+            [(c.category, c.before, c.after, c.start, c.end) for c in res["changes"]])
+
+
+def test_matches_analyze_text_across_edits(rule_nlp):
+    analyzer = coach.IncrementalAnalyzer()
+    for text in EDITS:
+        assert summary(analyzer.analyze(text)) == summary(coach.analyze_text(text)), text
+
+
+def test_parses_only_around_the_edit(rule_nlp):
+    analyzer = coach.IncrementalAnalyzer()
+    long_doc = " ".join([DOC] * 50)
+    analyzer.analyze(long_doc)
+    parsed = analyzer.parsed_chars
+    edited = long_doc.replace("Thx for the synergy.", "Thanks a lot.", 1)
+    assert summary(analyzer.analyze(edited)) == summary(coach.analyze_text(edited))
+    assert analyzer.parsed_chars - parsed < 500 < len(edited)
@@ -0,0 +1,171 @@
+"""Uploads and sends through a local fake Google API server (GOOGLE_API_ENDPOINT):
+retries, the persistent queue and resuming what a crashed run left behind."""
+
+import json
+import sqlite3
+import subprocess
+import sys
+import threading
+import zipfile
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+pytest.importorskip("google_auth_httplib2")
+
+import clarity_coach as cc
+from clarity_coach.delivery import Delivery, DeliveryQueue
+
+
+class FakeGoogle(BaseHTTPRequestHandler):
+    """Drive multipart uploads and Gmail resumable sends; the next `fail`
+    requests get 503."""
+
+    def handle_one(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path.split("?")[0]))
+            failing = server.fail > 0
+            server.fail -= failing
+        if failing:
+            return self.reply(503, {"error": {"code": 503, "message": "try later"}})
+        if "uploadType=resumable" in self.path:
+            return self.reply(200, None, {"Location": f"http://127.0.0.1:{server.server_port}/session"})
+        if "/drive/" in self.path:
+            server.uploads += 1
+            return self.reply(200, {"id": "doc1", "webViewLink": "http://docs.example/doc1"})
+        server.sends += 1
+        return self.reply(200, {"id": "msg1"})
+
+    do_POST = do_PUT = handle_one
+
+    def reply(self, status, payload, headers=None):
+        blob = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(blob)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(blob)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def google(monkeypatch, tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGoogle)
+    server.lock, server.requests, server.fail, server.uploads, server.sends = threading.Lock(), [], 0, 0, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for name, value in {"GOOGLE_API_ENDPOINT": f"http://127.0.0.1:{server.server_port}",
+                        "_google_services": {}, "_google_creds": None, "_google_local": threading.local(),
+                        "_delivery": None, "DELIVERY_QUEUE": str(tmp_path / "queue.sqlite"),
+                        "RETRY_SLEEP": 0.01, "API_RETRIES": 3, "DRY_RUN": False, "SAVE_LOCAL": True,
+                        "UPLOAD_GDOC": True, "SEND_EMAIL": True, "EMAIL_TO": "reader@example.com"}.items():
+        monkeypatch.setattr(cc, name, value)
+    monkeypatch.chdir(tmp_path)
+    yield server
+    cc.close_delivery()
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "report.txt").write_text("polished text")
+    with zipfile.ZipFile(tmp_path / "out.zip", "w") as z:
+        z.writestr("report.txt", "polished text")
+    return str(tmp_path / "report.txt"), str(tmp_path / "out.zip")
+
+
+def pending(queue_path):
+    with sqlite3.connect(queue_path) as db:
+        return db.execute("SELECT kind, status, attempts FROM jobs").fetchall()
+
+
+def dead_pid():
+    proc = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    return int(proc.stdout)
+
+
+def test_upload_and_send(google, files):
+    report, zip_path = files
+    link, timing = cc.queue_gdoc(report).result(timeout=30)
+    sent, _ = cc.queue_email(zip_path).result(timeout=30)
+    assert link == "http://docs.example/doc1" and sent is True and timing["attempts"] == 1
+    assert (google.uploads, google.sends) == (1, 1)
+    assert ("PUT", "/session") in google.requests
+    assert pending(cc.DELIVERY_QUEUE) == []
+
+
+def test_retries_after_server_errors(google, files):
+    google.fail = 2
+    link, timing = cc.queue_gdoc(files[0]).result(timeout=30)
+    assert link == "http://docs.example/doc1"
+    assert timing["attempts"] == 3
+    assert pending(cc.DELIVERY_QUEUE) == []
+
+
+def test_job_out_of_retries_stays_queued(google, files):
+    google.fail = 3
+    with pytest.raises(Exception):
+        cc.queue_gdoc(files[0]).result(timeout=30)
+    assert pending(cc.DELIVERY_QUEUE) == [("gdoc", "pending", 3)]
+    assert google.uploads == 0
+
+
+def test_resume_after_crash(google, files):
+    queue = DeliveryQueue(cc.DELIVERY_QUEUE)
+    gdoc = queue.add("gdoc", {"path": files[0], "folder": None})
+    queue.add("email", cc.email_job(files[1]))
+    with queue._db:  # both were being delivered by a run that died
+        queue._db.execute("UPDATE jobs SET owner = ?", (dead_pid(),))
+    queue.close()
+
+    cc.SEND_EMAIL = False  # --no-email: leftover emails wait for a run that sends them
+    jobs = cc.resume_deliveries()
+    assert [job.result(timeout=30)[0] for job in jobs] == ["http://docs.example/doc1"]
+    assert (google.uploads, google.sends) == (1, 0)
+    assert pending(cc.DELIVERY_QUEUE) == [("email", "pending", 0)]
+    assert gdoc not in [row[0] for row in sqlite3.connect(cc.DELIVERY_QUEUE).execute("SELECT id FROM jobs")]
+
+    cc.close_delivery()
+    cc.SEND_EMAIL = True
+    assert [job.result(timeout=30)[0] for job in cc.resume_deliveries()] == [True]
+    assert google.sends == 1 and pending(cc.DELIVERY_QUEUE) == []
+
+
+def test_no_resume_without_delivery(google, files):
+    queue = DeliveryQueue(cc.DELIVERY_QUEUE)
+    queue.add("gdoc", {"path": files[0], "folder": None})
+    with queue._db:
+        queue._db.execute("UPDATE jobs SET owner = NULL")
+    queue.close()
+    cc.SAVE_LOCAL = False
+    assert cc.resume_deliveries() is None
+    cc.SAVE_LOCAL, cc.UPLOAD_GDOC, cc.SEND_EMAIL = True, False, False
+    assert cc.resume_deliveries() is None
+    assert google.requests == [] and pending(cc.DELIVERY_QUEUE) == [("gdoc", "pending", 0)]
+
+
+def test_claim_skips_jobs_of_live_processes(tmp_path):
+    queue = DeliveryQueue(str(tmp_path / "q.sqlite"))
+    mine = queue.add("gdoc", {"path": "x"})
+    assert queue.claim() == []  # this process is still working on it
+    with queue._db:
+        queue._db.execute("UPDATE jobs SET owner = ?", (dead_pid(),))
+    assert queue.claim(["email"]) == []
+    assert queue.claim(["gdoc"]) == [(mine, "gdoc", {"path": "x"})]
+    queue.close()
+
+
+def test_backoff_grows_and_is_capped():
+    delivery = Delivery({}, backoff=1.0, max_backoff=4.0)
+    try:
+        for attempt, base in [(0, 1.0), (1, 2.0), (2, 4.0), (5, 4.0)]:
+            assert all(0.5 * base <= delivery.delay(attempt) <= 1.5 * base for _ in range(50))
+    finally:
+        delivery.close()
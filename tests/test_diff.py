@@ -0,0 +1,88 @@
+"""diff_opcodes output must be a valid edit script from a to b."""
+
+import random
+from difflib import SequenceMatcher
+
+import pytest
+
+from clarity_coach import diff
+from clarity_coach.diff import diff_opcodes
+
+
+def apply(ops, a, b):
+    # rebuild b from a and the opcodes, checking they tile both sequences
+    out, i, j = [], 0, 0
+    for tag, i1, i2, j1, j2 in ops:
+        assert (i1, j1) == (i, j)
+        if tag == "equal":
+            assert a[i1:i2] == b[j1:j2]
+            out += a[i1:i2]
+        else:
+            assert tag in ("replace", "delete", "insert")
+            out += b[j1:j2]
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return out
+
+
+def edited(words, rng, n):
+    b = list(words)
+    for _ in range(n):
+        k = rng.randrange(len(b) + 1)
+        op = rng.choice("sid")
+        if op == "i" or not b:
+            b.insert(k, rng.choice(["new", "word", "here."]))
+        elif op == "d" and k < len(b):
+            del b[k]
+        elif k < len(b):
+            b[k] = b[k].upper()
+    return b
+
+
+def edited_count(ops):
+    return sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in ops if tag != "equal")
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_reconstructs_random_edits(seed):
+    rng = random.Random(seed)
+    a = [rng.choice(["the", "cat", "sat", "on", "a", "mat.", "dog", "ran!"]) for _ in range(rng.randrange(0, 300))]
+    b = edited(a, rng, rng.randrange(0, 40))
+    assert apply(diff_opcodes(a, b), a, b) == b
+
+
+def test_matches_sequence_matcher_on_unique_tokens():
+    a = [f"w{i}" for i in range(200)]
+    b = a[:50] + ["x"] + a[51:120] + a[130:] + ["y"]
+    assert diff_opcodes(a, b) == SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+
+
+def test_identical_and_empty():
+    assert diff_opcodes([], []) == []
+    assert diff_opcodes(["a"], []) == [("delete", 0, 1, 0, 0)]
+    assert diff_opcodes([], ["a"]) == [("insert", 0, 0, 0, 1)]
+    assert diff_opcodes(["a", "b"], ["a", "b"]) == [("equal", 0, 2, 0, 2)]
+
+
+def test_repetitive_text_past_max_edits_is_not_one_replace(monkeypatch):
+    # nothing is unique, so every gap goes to Myers; with the edit budget
+    # spent, sentences keep the unchanged parts aligned
+    monkeypatch.setattr(diff, "MAX_EDITS", 20)
+    rng = random.Random(1)
+    a = "the cat sat on the mat . it was a cat . the mat was flat .".split() * 40
+    b = list(a)
+    for k in rng.sample(range(len(b)), 60):
+        b[k] = b[k] + "s" if b[k] != "." else b[k]
+    ops = diff_opcodes(a, b)
+    assert apply(ops, a, b) == b
+    assert len(ops) > 1
+    assert edited_count(ops) < len(a) // 4
+
+
+def test_repetitive_text_with_inserted_sentences(monkeypatch):
+    monkeypatch.setattr(diff, "MAX_EDITS", 10)
+    a = "we met . we ate . we left .".split() * 50
+    b = a[:30] + "then it rained hard .".split() * 8 + a[30:]
+    ops = diff_opcodes(a, b)
+    assert apply(ops, a, b) == b
+    assert edited_count(ops) <= 40
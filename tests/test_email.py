@@ -0,0 +1,45 @@
+"""write_message: the streamed RFC 822 message uses CRLF line endings
+throughout and parses back to the body and attachment. expires_soon takes
+google-auth's naive UTC expiry as well as an aware one."""
+
+import email
+import io
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+import clarity_coach as cc
+
+
+def test_message_lines_end_in_crlf(tmp_path):
+    payload = os.urandom(3 * cc.MIME_BLOCK + 100)  # several blocks and a short last one
+    (tmp_path / "out.zip").write_bytes(payload)
+    job = {"zip": str(tmp_path / "out.zip"), "to": "reader@example.com", "from": "me",
+           "subject": "Clarity Coach résumé", "body": "Polished text attached.\n" * 10}
+    out = io.BytesIO()
+    cc.write_message(job, out)
+    data = out.getvalue()
+    assert re.search(rb"(?<!\r)\n", data) is None
+    assert all(len(line) <= 76 for line in data.split(b"\r\n"))
+
+    body, attachment = email.message_from_bytes(data).get_payload()
+    assert body.get_payload(decode=True).decode() == job["body"]
+    assert attachment.get_filename() == "out.zip"
+    assert attachment.get_payload(decode=True) == payload
+
+
+class Creds:
+    def __init__(self, expiry):
+        self.expiry = expiry
+
+
+def test_expires_soon_with_naive_and_aware_expiry():
+    now = datetime.now(timezone.utc)
+    soon = now + timedelta(seconds=cc.CREDS_REFRESH_MARGIN / 2)
+    later = now + timedelta(seconds=cc.CREDS_REFRESH_MARGIN * 2)
+    assert cc.expires_soon(Creds(soon)) and not cc.expires_soon(Creds(later))
+    naive = later.replace(tzinfo=None)  # google-auth's naive UTC
+    assert not cc.expires_soon(Creds(naive))
+    assert cc.expires_soon(Creds(soon.replace(tzinfo=None)))
+    assert cc.expires_soon(Creds(soon.astimezone(timezone(timedelta(hours=-5)))))
+    assert not cc.expires_soon(Creds(None))
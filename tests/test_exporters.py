@@ -0,0 +1,78 @@
+"""The exporter registry: --formats selection, unknown formats and exporters
+loaded from the clarity_coach.exporters entry point group."""
+
+import textwrap
+
+import clarity_coach as cc
+
+TEXT = "idk teh microservices r gonna fail"
+
+PLUGIN = '''
+import clarity_coach as cc
+
+def save_shout(res, outdir):
+    fn = cc.timestamped_filename(cc.OUTPUT_FILE, "shout", outdir)
+    with open(fn, "w", encoding="utf-8") as f:
+        f.write(res["polished"].upper())
+    return fn
+
+save_shout.cost = "light"
+'''
+
+
+class EntryPoint:
+    def __init__(self, name, save):
+        self.name, self.save = name, save
+
+    def load(self):
+        return self.save
+
+
+def test_selection_keeps_requested_formats_heaviest_first(monkeypatch):
+    monkeypatch.setattr(cc, "EXPORT_FORMATS", ["md", "zip", "pdf", "json"])
+    assert cc.selected_exporters() == ["pdf", "md", "json"]
+    monkeypatch.setattr(cc, "EXPORT_FORMATS", None)
+    assert set(cc.selected_exporters()) == set(cc.EXPORTERS)
+
+
+def test_unknown_format_is_skipped(monkeypatch, caplog):
+    monkeypatch.setattr(cc, "plugin_entry_points", lambda: [])
+    monkeypatch.setattr(cc, "EXPORT_FORMATS", ["md", "nope"])
+    assert cc.selected_exporters() == ["md"]
+    assert "Unknown export format: nope" in caplog.text
+    assert "nope" not in cc.available_formats()
+
+
+def test_unknown_format_is_rejected_by_the_cli(cli, tmp_path):
+    out = cli(TEXT, "--formats", "md,nope", "--outdir", "out")
+    assert "Unknown format(s): nope" in out
+    assert not list((tmp_path / "out").glob("*.md"))
+
+
+def test_plugin_loaded_on_first_use(monkeypatch):
+    def save(res, outdir):
+        return "x"
+    save.version = 3
+    monkeypatch.setattr(cc, "plugin_entry_points", lambda: [EntryPoint("fake", save)])
+    monkeypatch.setattr(cc, "EXPORTERS", dict(cc.EXPORTERS))  # load_plugin registers into it
+    assert "fake" in cc.available_formats()
+    monkeypatch.setattr(cc, "EXPORT_FORMATS", ["fake", "md"])
+    assert cc.selected_exporters() == ["fake", "md"]  # plugins default to heavy
+    assert cc.EXPORTERS["fake"] == {"save": save, "cost": "heavy", "stream": None, "version": 3}
+
+
+def test_installed_entry_point_plugin(cli, tmp_path, monkeypatch):
+    site = tmp_path / "site"
+    dist = site / "shout_plugin-0.1.dist-info"
+    dist.mkdir(parents=True)
+    (site / "shout_plugin.py").write_text(PLUGIN)
+    (dist / "METADATA").write_text("Metadata-Version: 2.1\nName: shout-plugin\nVersion: 0.1\n")
+    (dist / "entry_points.txt").write_text(textwrap.dedent("""\
+        [clarity_coach.exporters]
+        shout = shout_plugin:save_shout
+        """))
+    monkeypatch.setenv("PYTHONPATH", str(site))
+    cli(TEXT, "--formats", "shout,md", "--outdir", "out")
+    (shouted,) = (tmp_path / "out").glob("*.shout")
+    assert shouted.read_text() == shouted.read_text().upper() and "KNOW" in shouted.read_text()
+    assert list((tmp_path / "out").glob("*.md"))
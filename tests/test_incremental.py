@@ -0,0 +1,45 @@
+"""--incremental skips inputs unchanged since the last run with the same settings."""
+
+import json
+import os
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def processed(tmp_path):
+    with open(tmp_path / "out" / "clarity_inputs.json", encoding="utf-8") as f:
+        return {os.path.basename(fp): rec["sha256"] for fp, rec in json.load(f)["files"].items()}
+
+
+def test_skips_unchanged_and_reruns_changed(cli, tmp_path):
+    (tmp_path / "in").mkdir()
+    write(tmp_path / "in" / "a.txt", "idk teh microservices r gonna fail")
+    write(tmp_path / "in" / "b.txt", "we wanna ship the orchestration btw")
+    args = ("--folder", "in", "--outdir", "out", "--incremental", "--formats", "md")
+
+    assert "0 of 2 files unchanged" in cli(*args)
+    first = processed(tmp_path)
+    assert set(first) == {"a.txt", "b.txt"}
+
+    assert "2 of 2 files unchanged" in cli(*args)
+
+    write(tmp_path / "in" / "b.txt", "we wanna ship the orchestration now")
+    os.utime(tmp_path / "in" / "a.txt")  # touched, same content
+    assert "1 of 2 files unchanged" in cli(*args)
+    second = processed(tmp_path)
+    assert second["a.txt"] == first["a.txt"] and second["b.txt"] != first["b.txt"]
+
+
+def test_other_output_settings_rerun_everything(cli, tmp_path):
+    (tmp_path / "in").mkdir()
+    write(tmp_path / "in" / "a.txt", "idk teh microservices r gonna fail")
+    args = ("--folder", "in", "--outdir", "out", "--incremental")
+
+    cli(*args, "--formats", "md")
+    assert "1 of 1 files unchanged" in cli(*args, "--formats", "md")
+    assert "0 of 1 files unchanged" in cli(*args, "--formats", "json")
+    assert "0 of 1 files unchanged" in cli(*args, "--formats", "json", "--store", "st")
+    assert "0 of 1 files unchanged" in cli(*args, "--formats", "json", "--store", "st", "--digest")
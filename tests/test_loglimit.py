@@ -0,0 +1,40 @@
+"""LogLimiter drops repeats and noisy call sites, never distinct errors."""
+
+import logging
+
+from clarity_coach.loglimit import LogLimiter
+
+
+def record(msg, level=logging.WARNING, line=10, created=0.0):
+    rec = logging.LogRecord("t", level, "site.py", line, msg, None, None)
+    rec.created = created
+    return rec
+
+
+def test_identical_messages_pass_repeats_times():
+    limiter = LogLimiter(repeats=2, rate=100)
+    assert [limiter.filter(record("same")) for _ in range(4)] == [True, True, False, False]
+    assert limiter.suppressed() == 2
+
+
+def test_call_site_rate_limits_warnings():
+    limiter = LogLimiter(repeats=3, rate=5, window=60)
+    passed = sum(limiter.filter(record(f"token {i}")) for i in range(20))
+    assert passed == 5
+    assert limiter.filter(record("later", created=61.0))
+
+
+def test_distinct_errors_are_not_rate_limited():
+    limiter = LogLimiter(repeats=1, rate=5, window=60)
+    assert all(limiter.filter(record(f"Failed to read file{i}.txt", logging.ERROR)) for i in range(50))
+    assert not limiter.filter(record("Failed to read file0.txt", logging.ERROR))
+
+
+def test_summary_reports_and_resets(caplog):
+    limiter = LogLimiter(repeats=1, rate=100)
+    for _ in range(3):
+        limiter.filter(record("again"))
+    with caplog.at_level(logging.INFO):
+        assert limiter.summary() == 2
+    assert "Suppressed 2 repeated log messages from site.py:10; last: again" in caplog.text
+    assert limiter.summary() == 0
@@ -0,0 +1,102 @@
+"""RuleMatcher must find what the old one-loop-per-table-entry code found."""
+
+import random
+import re
+
+import pytest
+
+import clarity_coach as cc
+from clarity_coach.rules import Change, OffsetMap, RuleMatcher, trie_regex
+
+TEXTS = [
+    "idk if we shud go, btw the orchestration is asynchronous",
+    "Microservices and Distributed Tracing make orchestration hard an we know it",
+    "u dont know ur code, pls check.  IDK.  Cant say, tho.",
+    "an i said: an we should keep asynchronous microservices asynchronous",
+    "nothing to see here",
+    "",
+    "dont dont\tdont\ncant",
+    "distributed tracingdistributed tracing",
+    "cuzin btwx du u ur? (u) u",
+]
+
+
+def per_rule_spans(text):
+    # one scan of the text per table entry, as before the matcher
+    spans = set()
+    for m in re.finditer(r"\S+", text):
+        w = m.group().lower()
+        if w in cc.SLANG_MAP:
+            spans.add(("slang", m.start(), m.end(), w))
+        elif w in cc.CONTRACTIONS:
+            spans.add(("contraction", m.start(), m.end(), w))
+    for bad in cc.GRAMMAR_FIXES:
+        for m in re.finditer(re.escape(bad), text):
+            spans.add(("grammar", m.start(), m.end(), bad))
+    for term in cc.JARGON_DB:
+        for m in re.finditer(re.escape(term), text, re.IGNORECASE):
+            spans.add(("jargon", m.start(), m.end(), term))
+    return spans
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_matcher_finds_per_rule_spans(text):
+    found = {(c.category, c.start, c.end, c.rule) for c in cc.RULES.finditer(text)}
+    assert found == per_rule_spans(text)
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_apply_replaces_every_span(text):
+    new, matches = cc.RULES.apply(text)
+    expected, pos = [], 0
+    for c in sorted(matches, key=lambda c: c.start):
+        expected += [text[pos:c.start], c.after]
+        pos = c.end
+    assert new == "".join(expected) + text[pos:]
+    assert all(text[c.start:c.end] == c.before for c in matches)
+
+
+def test_earlier_table_wins_a_tie():
+    matcher = RuleMatcher()
+    matcher.add_literals("slang", {"wanna": "want to"}, ignore_case=True, whole_token=True)
+    matcher.add_literals("grammar", {"wanna": "want to"})
+    assert [(c.category, c.start) for c in matcher.finditer("wanna wannabe")] == [("slang", 0), ("grammar", 6)]
+
+
+def test_trie_regex_matches_longest_first_alternation():
+    rng = random.Random(0)
+    for _ in range(200):
+        words = {"".join(rng.choice("ab .") for _ in range(rng.randint(1, 5))) for _ in range(rng.randint(1, 8))}
+        text = "".join(rng.choice("ab .") for _ in range(40))
+        plain = "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+        assert [m.span() for m in re.finditer(trie_regex(words), text)] == \
+               [m.span() for m in re.finditer(plain, text)]
+
+
+def test_change_round_trip():
+    change = Change("jargon", "Asynchronous", "non-blocking", 3, 15, "asynchronous")
+    assert Change.from_list(change.to_list()) == change
+    assert str(change) == "Asynchronous → non-blocking"
+
+
+def test_offset_map_traces_later_passes_to_the_original():
+    text = "idk  the asynchronous\tjobs r bad,  an we wanna add distributed   tracing"
+    step1, ch1 = cc.correct_spelling(text)  # also collapses whitespace
+    step2 = step1.upper()
+    _, ch2 = cc.RULES.apply(step2.lower(), ("grammar", "jargon"))
+    spans = [(c.before, text[c.start:c.end]) for c in OffsetMap(text).add(text, ch1).original(ch2, step2)]
+    assert ("asynchronous", "asynchronous") in spans and ("an we", "an we") in spans
+    assert ("distributed tracing", "distributed   tracing") in spans
+
+
+def test_offset_map_joins_pieces_and_snaps_into_replacements():
+    def passes(piece):
+        step0, ch0 = cc.RULES.apply(piece, ("slang",))
+        return OffsetMap(piece).add(piece, ch0), step0
+    text = "idk why.   it broke idk"
+    maps, outs = zip(*(passes(piece) for piece in ("idk why.", "it broke idk")))
+    step0 = " ".join(outs)
+    inside = Change("x", "don't", "", step0.index("don't"), step0.index("don't") + 5)
+    late = Change("x", "broke", "", step0.index("broke"), step0.index("broke") + 5)
+    mapped = OffsetMap.join(text, list(maps)).original([inside, late], step0)
+    assert [(c.start, c.end) for c in mapped] == [(0, 3), (14, 19)]
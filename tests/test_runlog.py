@@ -0,0 +1,100 @@
+"""RunLog: rotation by size and age, pruning rotated files from the index, and
+the `clarity-coach log` queries."""
+
+import json
+import os
+import time
+
+import pytest
+
+from clarity_coach import runlog
+from clarity_coach.runlog import RunLog, runs_with_token, words_of
+
+NOW = time.time()
+
+
+def record(text, ts=NOW, source="a.txt", **by_category):
+    return {"ts": ts, "source": source, "original": text, "polished": text.upper(),
+            "stats": {"num_changes": sum(by_category.values()), "by_category": by_category or {"spelling": 1}}}
+
+
+def add(log, text, **kw):
+    log.add(record(text, **kw), words_of(text))
+    log.flush()
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "log.jsonl")
+
+
+def rotated(path):
+    base, ext = os.path.splitext(path)
+    folder = os.path.dirname(path)
+    return sorted(f for f in os.listdir(folder) if f.startswith(os.path.basename(base) + ".") and f.endswith(ext)
+                  and f != os.path.basename(path))
+
+
+def test_rotates_once_the_file_reaches_max_bytes(path):
+    log = RunLog(path, max_bytes=2**20, buffer=1)
+    add(log, "same line")
+    line = os.path.getsize(path)
+    log.max_bytes = 2 * line + 1
+    add(log, "same line")
+    add(log, "same line")  # 2 lines: one byte under the limit
+    assert rotated(path) == []
+    log.max_bytes = 3 * line
+    add(log, "same line")  # 3 lines: at the limit
+    assert len(rotated(path)) == 1
+    assert os.path.getsize(path) == line
+    log.close()
+
+
+def test_rotates_once_the_first_run_is_rotate_days_old(path):
+    log = RunLog(path, rotate_days=7, buffer=1)
+    add(log, "recent", ts=NOW - 7 * 86400 + 60)
+    add(log, "later")
+    assert rotated(path) == []
+    log.close()
+
+    os.remove(path)
+    os.remove(path + ".idx.sqlite")
+    log = RunLog(path, rotate_days=7, buffer=1)
+    add(log, "old", ts=NOW - 7 * 86400 - 60)
+    add(log, "later")
+    assert len(rotated(path)) == 1
+    log.close()
+
+
+def test_removed_segments_leave_the_index(path):
+    log = RunLog(path, max_bytes=1, keep=1, buffer=1)
+    for word in ("alpha", "beta", "gamma"):  # each flush rotates the previous file
+        add(log, f"{word} text", grammar=2)
+    log.close()
+    assert len(rotated(path)) == 1
+    assert runs_with_token(path, "alpha") == []
+    assert [r["original"] for r in runs_with_token(path, "beta")] == ["beta text"]
+    assert [r["original"] for r in runs_with_token(path, "gamma")] == ["gamma text"]
+    assert runlog.changes_by_category(path)[0][1:] == ("grammar", 4)
+
+
+def test_log_command_filters(path, capsys):
+    log = RunLog(path)
+    log.add(record("kubernetes again", ts=NOW - 3 * 86400, source="old.txt", jargon=1), words_of("kubernetes again"))
+    log.add(record("kubernetes today", source="new.txt", jargon=2, spelling=1), words_of("kubernetes today"))
+    log.add(record("nothing here", source="other.txt"), words_of("nothing here"))
+    log.close()
+
+    runlog.main(["--file", path, "--token", "Kubernetes"])
+    out = capsys.readouterr().out.splitlines()
+    assert [line.split()[1] for line in out] == ["new.txt", "old.txt"]
+
+    runlog.main(["--file", path, "--token", "kubernetes", "--since", "1d", "--json"])
+    assert [json.loads(line)["source"] for line in capsys.readouterr().out.splitlines()] == ["new.txt"]
+
+    runlog.main(["--file", path, "--token", "kubernetes", "--limit", "1"])
+    assert len(capsys.readouterr().out.splitlines()) == 1
+
+    runlog.main(["--file", path, "--by-category", "--since", "1d"])
+    rows = [line.split()[-2:] for line in capsys.readouterr().out.splitlines()]
+    assert rows == [["jargon", "2"], ["spelling", "2"]]
@@ -0,0 +1,89 @@
+"""Batcher: oversized requests are refused up front, a failing request only
+fails itself.  Handler: malformed requests get 400."""
+
+import http.client
+import json
+import threading
+
+import pytest
+
+import clarity_coach as cc
+from clarity_coach.server import Batcher, Busy, Handler, Server, TooLarge
+
+
+@pytest.fixture
+def batcher(monkeypatch):
+    def analyze_texts(texts):
+        if "boom" in texts:
+            raise ValueError("bad text")
+        return [t.upper() for t in texts]
+
+    monkeypatch.setattr(cc, "analyze_texts", analyze_texts)
+    b = Batcher(batch_texts=64, wait_ms=200, max_in_flight=4)
+    yield b
+    b.stop()
+
+
+def test_too_many_texts_is_not_busy(batcher):
+    with pytest.raises(TooLarge):
+        batcher.submit(["a"] * 5)
+    assert batcher.metrics()["rejected"] == 0
+
+
+def test_busy_when_full(batcher):
+    first = batcher.submit(["a", "b", "c"])
+    with pytest.raises(Busy):
+        batcher.submit(["d", "e"])
+    assert first.result(timeout=5) == ["A", "B", "C"]
+
+
+def test_failed_batch_only_fails_the_bad_request(batcher):
+    good, bad, other = batcher.submit(["a"]), batcher.submit(["boom"]), batcher.submit(["b", "c"])
+    assert good.result(timeout=5) == ["A"]
+    assert other.result(timeout=5) == ["B", "C"]
+    with pytest.raises(RuntimeError, match="bad text"):
+        bad.result(timeout=5)
+    metrics = batcher.metrics()
+    assert (metrics["batches"], metrics["errors"], metrics["in_flight"]) == (1, 1, 0)
+
+
+@pytest.fixture
+def server(batcher, monkeypatch):
+    monkeypatch.setattr(Handler, "batcher", batcher)
+    monkeypatch.setattr(cc, "to_json", lambda res: {"polished": res})
+    httpd = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(port, body, headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("POST", "/analyze", body, headers or {})
+    resp = conn.getresponse()
+    status, payload = resp.status, json.loads(resp.read())
+    conn.close()
+    return status, payload
+
+
+def test_analyzes_text_and_texts(server):
+    assert post(server, json.dumps({"text": "a"}))[1]["polished"] == "A"
+    status, payload = post(server, json.dumps({"texts": ["a", "b"]}))
+    assert status == 200 and [r["polished"] for r in payload["results"]] == ["A", "B"]
+
+
+@pytest.mark.parametrize("body", [{"texts": "abc"}, {"texts": []}, {"texts": ["a", 1]}, {"text": 5}, [], {}])
+def test_malformed_body_is_400(server, body):
+    assert post(server, json.dumps(body))[0] == 400
+
+
+@pytest.mark.parametrize("length", ["-1", "abc"])
+def test_bad_content_length_is_400(server, length):
+    conn = http.client.HTTPConnection("127.0.0.1", server, timeout=10)
+    conn.putrequest("POST", "/analyze")
+    conn.putheader("Content-Length", length)
+    conn.endheaders()
+    resp = conn.getresponse()
+    assert resp.status == 400
+    conn.close()
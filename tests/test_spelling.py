@@ -0,0 +1,58 @@
+"""SpellIndex must return what process.extractOne(..., scorer=WRatio) returns."""
+
+import pytest
+
+pytest.importorskip("wordfreq")
+process = pytest.importorskip("fuzzywuzzy.process")
+from fuzzywuzzy import fuzz
+from wordfreq import top_n_list
+
+from clarity_coach.spelling import SpellIndex
+
+VOCAB = 20000
+
+TOKENS = [
+    # misspellings
+    "teh", "recieve", "definately", "seperate", "occured", "adress", "wich", "thier", "untill",
+    "goverment", "enviroment", "accomodate", "neccessary", "tommorow", "arguement", "calender",
+    "embarass", "foriegn", "harrass", "independant", "millenium", "noticable", "reccomend",
+    # out-of-vocabulary words, long tokens
+    "kubernetes", "microservices", "thisisaverylongtokenwithoutspaces", "antidisestablishmentarianism",
+    # punctuation that processes to several words
+    "end-to-end", "cloud-native", "non-blocking", "state-of-the-art", "e.g.", "i.e.", "u.s.a.",
+    "he's", "it-s", "you're-welcome", "rock'n'roll", "o'clock", "3rd-party", "t-shirt", "x-ray",
+    "end end", "to-do", "a-b", "https://example.com/path?q=1", "www.google.com", "foo_bar",
+    # possessives: one short part shared with thousands of words
+    "bandd's", "wrld's", "companyy's", "xyzq's", "s's", "childrens'",
+    # nothing left after processing
+    "===", "-", "→",
+]
+
+
+@pytest.fixture(scope="module")
+def words():
+    return top_n_list("en", VOCAB)
+
+
+@pytest.fixture(scope="module")
+def index(words):
+    return SpellIndex(words)
+
+
+def expected(token, words):
+    best = process.extractOne(token, words, scorer=fuzz.WRatio, score_cutoff=86)
+    return (best[0], best[1]) if best else (None, 0)
+
+
+@pytest.mark.parametrize("token", TOKENS)
+def test_lookup_matches_extract_one(index, words, token):
+    assert index.lookup(token) == expected(token, words)
+
+
+def test_vocab_file_round_trip(index, tmp_path):
+    path = str(tmp_path / "vocab.bin")
+    index.save(path)
+    loaded = SpellIndex.load(path)
+    assert len(loaded) == len(index)
+    for token in TOKENS:
+        assert loaded.lookup(token) == index.lookup(token)
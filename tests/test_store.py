@@ -0,0 +1,75 @@
+"""OutputStore and --store: artifacts are keyed by content and reused."""
+
+import os
+import sqlite3
+
+import pytest
+
+import clarity_coach as cc
+from clarity_coach.store import OutputStore
+
+TEXT = "idk teh microservices r gonna fail"
+
+
+def test_put_find_and_index(tmp_path):
+    store = OutputStore(str(tmp_path / "store"))
+    assert store.find("ab12") is None
+    scratch = store.scratch()
+    with open(os.path.join(scratch, "report.md"), "w") as f:
+        f.write("# report")
+    path = store.put("ab12", os.path.join(scratch, "report.md"), "md")
+    store.discard(scratch)
+    assert path == store.find("ab12") == str(tmp_path / "store" / "ab" / "ab12.md")
+    store.record("run1", "out", "md", "ab12", False)
+    store.record("run2", "out", "md", "ab12", True)
+    assert store.artifacts("run2") == [("out", "md", path, True)]
+    assert (store.stored, store.reused) == (1, 1)
+    assert not os.path.exists(scratch)
+    store.close()
+
+
+def test_artifact_key_covers_text_format_and_exporter(monkeypatch):
+    res = {"original": TEXT}
+    key = cc.artifact_key(res, "md")
+    assert key == cc.artifact_key(dict(res), "md")
+    assert key != cc.artifact_key({"original": TEXT + "!"}, "md")
+    assert key != cc.artifact_key(res, "json")
+    monkeypatch.setitem(cc.EXPORTERS, "md", {**cc.EXPORTERS["md"], "version": 2})
+    assert cc.artifact_key(res, "md") != key
+
+
+def uses(store):
+    with sqlite3.connect(os.path.join(store, "index.sqlite")) as db:
+        return db.execute("SELECT run, format, key, reused FROM uses ORDER BY ts").fetchall()
+
+
+def test_second_run_reuses_artifacts(cli, tmp_path):
+    args = (TEXT, "--formats", "md,json", "--store", "st")
+    cli(*args)
+    cli(*args)
+    rows = uses(str(tmp_path / "st"))
+    assert len(rows) == 4
+    first, second = rows[:2], rows[2:]
+    assert {r[1] for r in first} == {"md", "json"}
+    assert [r[2] for r in first] == [r[2] for r in second]
+    assert [r[3] for r in first] == [0, 0] and [r[3] for r in second] == [1, 1]
+    stored = [f for _, _, files in os.walk(tmp_path / "st") for f in files if f != "index.sqlite" and "sqlite" not in f]
+    assert len(stored) == 2
+
+
+def test_exports_leave_out_per_run_stats(cli, tmp_path):
+    args = (TEXT, "--formats", "md,json", "--cache-dir", "cache")
+    cli(*args, "--outdir", "first")
+    cli(*args, "--outdir", "second")  # a result cache hit, with its own timings
+    for ext in ("md", "json"):
+        (first,), (second,) = ((tmp_path / d).glob(f"*.{ext}") for d in ("first", "second"))
+        assert first.read_bytes() == second.read_bytes()
+        assert b"timings" not in first.read_bytes() and b"cached" not in first.read_bytes()
+
+
+def test_store_is_rejected_with_stream(cli, tmp_path):
+    (tmp_path / "in").mkdir()
+    (tmp_path / "in" / "a.txt").write_text(TEXT)
+    out = cli("--folder", "in", "--stream", "--store", "st")
+    assert "--store cannot be combined with --stream" in out
+    assert not (tmp_path / "st").exists()
@@ -0,0 +1,66 @@
+"""--stream chunking: iter_chunks cuts at sentence ends (else whitespace, else
+hard), and the parts analyze to what the whole text would."""
+
+import io
+
+import pytest
+
+import clarity_coach as cc
+
+SENTENCES = ("idk teh microservices r gonna fail. we wanna ship the orchestration btw! "
+             "Is it there fault? i seen the kubernetes pods restart. e.g. this one rly. ")
+
+
+def chunks(text, size):
+    return list(cc.iter_chunks(io.StringIO(text), size))
+
+
+def test_cut_after_last_sentence_end_that_fits():
+    buf = "One two. Three four."
+    assert buf[:cc.chunk_cut(buf, 15)] == "One two. "
+    assert chunks(buf, 15) == ["One two.", "Three four."]
+
+
+def test_sentence_crossing_the_boundary_moves_to_the_next_chunk(monkeypatch):
+    monkeypatch.setattr(cc, "READ_BLOCK", 7)  # blocks end mid-sentence too
+    text = "Short one. This sentence crosses it. End."
+    assert chunks(text, 30) == ["Short one.", "This sentence crosses it. End."]
+
+
+def test_whitespace_then_hard_cut():
+    # a sentence longer than a chunk is split between words
+    assert chunks("One two. Three four five six.", 15) == ["One two.", "Three four", "five six."]
+    assert cc.chunk_cut("no sentence end here at all", 12) == 12  # after "sentence "
+    assert chunks("no sentence end here", 12) == ["no sentence", "end here"]
+    assert cc.chunk_cut("x" * 25, 10) == 10
+    assert chunks("x" * 25, 10) == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_chunks_keep_every_word():
+    text = SENTENCES * 30 + "trailing words without an end"
+    for size in (40, 300, 5000):
+        assert " ".join(chunks(text, size)).split() == text.split()
+
+
+@pytest.fixture
+def rule_sentences(monkeypatch):
+    pytest.importorskip("spacy")
+    pytest.importorskip("wordfreq")
+    monkeypatch.setattr(cc, "SENTENCE_MODE", "rule")
+    monkeypatch.setattr(cc, "nlp", None)
+
+
+def test_joined_parts_match_the_whole_text(rule_sentences):
+    text = SENTENCES * 20
+    parts = list(cc.analyze_stream(iter(chunks(text, 300)), batch=3))
+    whole = cc.analyze_text(text.strip())
+    assert len(parts) > 1
+    assert " ".join(p["polished"] for p in parts) == whole["polished"]
+    assert sorted((c.category, c.before, c.after) for p in parts for c in p["changes"]) == \
+        sorted((c.category, c.before, c.after) for c in whole["changes"])
+    total = {}
+    for p in parts:
+        cc.add_stats(total, p["stats"])
+    assert total["parts"] == len(parts)
+    for key in ("words_before", "words_after", "num_changes", "by_category"):
+        assert total[key] == whole["stats"][key]